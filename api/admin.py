@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 from api.models import Status, Income, Outcome, Product, UnitType, ProductCategory, IncomeItem, WarehouseProduct, \
-    Movement, MovementItem, Warehouse, Report, ReportItem, Order, OrderItem, Banner, Catalog
+    Movement, MovementItem, Warehouse, Report, ReportItem, Order, OrderItem, Banner, Catalog, StockReservation
 
 
 @admin.register(Status)
@@ -88,7 +88,13 @@ class OrderAdmin(admin.ModelAdmin):
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
-    pass
+    readonly_fields = 'reservation', 'reserved_qty'
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = 'warehouse', 'product', 'slot', 'reserved', 'updated'
+    list_filter = 'warehouse',
 
 
 @admin.register(Banner)
@@ -0,0 +1,201 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Sum
+
+from . import refcache, reservations, totals
+from .models import Order, OrderItem, Outcome, OutcomeItem, WarehouseProduct
+
+# Заказов в одном прогоне (POST orders/allocate/)
+MAX_ORDERS = 500
+# Непроведённые расходы: товар под них ещё на складе, но уже обещан
+OPEN_OUTCOMES = (Outcome.Status.pending, Outcome.Status.active)
+
+
+def _pick(remaining, stock, priorities):
+    """
+    Склад для следующей отгрузки (жадное покрытие множеств): больше всего строк
+    закрывает целиком, при равенстве — больше штук, затем меньше priority и id.
+    """
+    best, best_key = None, None
+    for warehouse_id, free in stock.items():
+        full = qty = 0
+        for product_id, wanted in remaining.items():
+            have = free.get(product_id, 0)
+            if have > 0:
+                qty += min(have, wanted)
+                full += have >= wanted
+        if not qty:
+            continue
+        key = (full, qty, -priorities.get(warehouse_id, 0), -warehouse_id)
+        if best_key is None or key > best_key:
+            best, best_key = warehouse_id, key
+    return best
+
+
+def _allocate_order(wanted, stock, priorities):
+    """Раскладывает {товар: кол-во} по складам; stock уменьшается на взятое. -> (отгрузки, нехватка)."""
+    remaining = dict(wanted)
+    shipments = {}
+    while remaining:
+        warehouse_id = _pick(remaining, stock, priorities)
+        if warehouse_id is None:
+            break
+        free, taken = stock[warehouse_id], {}
+        for product_id, qty in list(remaining.items()):
+            have = free.get(product_id, 0)
+            if have > 0:
+                take = min(have, qty)
+                taken[product_id] = take
+                free[product_id] = have - take
+                if take == qty:
+                    del remaining[product_id]
+                else:
+                    remaining[product_id] = qty - take
+        shipments[warehouse_id] = taken
+    return shipments, remaining
+
+
+def _open_outcomes(product_ids):
+    """
+    [(склад, товар, кол-во)] по непроведённым расходам — в том числе черновикам, созданным
+    здесь же прошлыми прогонами и пачками. Черновик открытого заказа на его собственном
+    складе уже сидит в резерве заказа (reserved) — его не вычитаем второй раз.
+    """
+    own_reservation = Exists(Order.objects.filter(
+        pk=OuterRef('outcome__reason_id'), warehouse_id=OuterRef('outcome__warehouse_id'),
+        status__in=reservations.RESERVING))
+    return list(
+        OutcomeItem.objects.filter(outcome__status__in=OPEN_OUTCOMES, outcome__warehouse__isnull=False,
+                                   product_id__in=product_ids)
+        .exclude(Q(outcome__reason=Outcome.Reason.order) & own_reservation)
+        .values_list('outcome__warehouse_id', 'product_id').annotate(qty=Sum('count')).order_by()
+    )
+
+
+def plan(order_ids):
+    """
+    План отгрузок для открытых заказов (pending, collected) без отгрузок.
+
+    Заказы, строки, уже созданные отгрузки и свободный остаток по всем складам
+    читаются несколькими запросами на всю пачку; дальше — в памяти. Свободный остаток —
+    count - reserved минус непроведённые расходы (_open_outcomes), так что товар,
+    отданный черновикам прошлых пачек, второй раз не раздаётся. Заказы разбираются
+    по возрастанию id, взятое одним заказом недоступно следующим.
+    Собственный резерв заказа на его складе считается свободным для него же.
+    Возвращает по заказу: {order, shipments: [{warehouse, items: [{product, qty, price}]}],
+    short: [{product, qty}]} или {order, skipped: причина}.
+    Заказы блокируются — вызывать внутри transaction.atomic().
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    orders = Order.objects.select_for_update().filter(pk__in=order_ids).order_by('id')
+    orders = {order.pk: order for order in orders}
+    allocated = set(Outcome.objects.filter(reason=Outcome.Reason.order, reason_id__in=order_ids)
+                    .exclude(status=Outcome.Status.cancelled).values_list('reason_id', flat=True))
+
+    lines = defaultdict(dict)
+    prices, own = {}, defaultdict(int)
+    items = (OrderItem.objects.filter(order_id__in=orders, count__gt=0).exclude(status=OrderItem.Status.cancelled)
+             .order_by('id').values_list('order_id', 'product_id', 'count', 'price', 'reserved_qty'))
+    for order_id, product_id, count, price, reserved in items:
+        lines[order_id][product_id] = lines[order_id].get(product_id, 0) + count
+        prices.setdefault((order_id, product_id), price)
+        own[(order_id, product_id)] += reserved
+
+    product_ids = {pid for wanted in lines.values() for pid in wanted}
+    stock = defaultdict(dict)
+    rows = (reservations.with_available(WarehouseProduct.objects.filter(product_id__in=product_ids,
+                                                                        warehouse__isnull=False))
+            .order_by().values_list('warehouse_id', 'product_id', 'available'))
+    free_stock = defaultdict(int)
+    for warehouse_id, product_id, free in rows:
+        free_stock[(warehouse_id, product_id)] += free
+    for warehouse_id, product_id, qty in _open_outcomes(product_ids):
+        free_stock[(warehouse_id, product_id)] -= qty
+    for (warehouse_id, product_id), free in free_stock.items():
+        stock[warehouse_id][product_id] = max(free, 0)
+    priorities = {row.id: row.priority for row in refcache.WAREHOUSES.all()}
+
+    result = []
+    for order_id in sorted(order_ids):
+        order = orders.get(order_id)
+        if order is None:
+            result.append({'order': order_id, 'skipped': "Заказ не найден"})
+            continue
+        if order.status not in reservations.RESERVING:
+            result.append({'order': order_id, 'skipped': f"Заказ в статусе {order.status}"})
+            continue
+        if order_id in allocated:
+            result.append({'order': order_id, 'skipped': "По заказу уже есть отгрузки"})
+            continue
+        if not lines[order_id]:
+            result.append({'order': order_id, 'skipped': "В заказе нет строк"})
+            continue
+
+        # свой резерв на складе заказа возвращаем в свободный остаток на время расчёта
+        returned = {}
+        if order.warehouse_id:
+            free = stock[order.warehouse_id]
+            for product_id in lines[order_id]:
+                if own[(order_id, product_id)]:
+                    returned[product_id] = own[(order_id, product_id)]
+                    free[product_id] = free.get(product_id, 0) + returned[product_id]
+        shipments, short = _allocate_order(lines[order_id], stock, priorities)
+        if order.warehouse_id:
+            free = stock[order.warehouse_id]
+            for product_id, qty in returned.items():
+                free[product_id] = max(0, free[product_id] - qty)
+
+        result.append({
+            'order': order_id,
+            'shipments': [
+                {'warehouse': warehouse_id,
+                 'items': [{'product': pid, 'qty': qty, 'price': prices[(order_id, pid)]}
+                           for pid, qty in taken.items()]}
+                for warehouse_id, taken in shipments.items()
+            ],
+            'short': [{'product': pid, 'qty': qty} for pid, qty in short.items()],
+        })
+    return result
+
+
+def create_outcomes(plans, user=None):
+    """
+    Черновики Outcome (pending, reason=order) по плану: один расход на склад заказа.
+    Пишутся двумя bulk_create и одним пересчётом итогов. Возвращает {id заказа: [id расходов]}.
+    """
+    orders = Order.objects.in_bulk([row['order'] for row in plans if row.get('shipments')])
+    outcomes, shipments = [], []
+    for row in plans:
+        order = orders.get(row['order'])
+        for shipment in row.get('shipments') or ():
+            outcomes.append(Outcome(
+                client_id=order.client_id, user=user or order.user, warehouse_id=shipment['warehouse'],
+                status=Outcome.Status.pending, reason=Outcome.Reason.order, reason_id=order.pk,
+                comment=f'Заказ #{order.pk}'))
+            shipments.append(shipment)
+
+    created = defaultdict(list)
+    with transaction.atomic():
+        Outcome.objects.bulk_create(outcomes)
+        OutcomeItem.objects.bulk_create([
+            OutcomeItem(outcome=outcome, product_id=item['product'], count=item['qty'], price=item['price'],
+                        user=outcome.user)
+            for outcome, shipment in zip(outcomes, shipments) for item in shipment['items']
+        ])
+        # bulk_create не шлёт сигналов строк — итоги шапок одним UPDATE
+        totals.recalculate(Outcome, [outcome.pk for outcome in outcomes])
+    for outcome in outcomes:
+        created[outcome.reason_id].append(outcome.pk)
+    return dict(created)
+
+
+def allocate(order_ids, user=None, dry_run=False):
+    """План отгрузок по заказам и (если не dry_run) черновики расходов; outcomes — id созданных расходов."""
+    with transaction.atomic():
+        plans = plan(order_ids)
+        created = {} if dry_run else create_outcomes(plans, user)
+    for row in plans:
+        if 'shipments' in row:
+            row['outcomes'] = created.get(row['order'], [])
+    return plans
@@ -0,0 +1,99 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.response import Response
+
+
+class ConcurrentQueriesMixin:
+    """
+    Отчёт, собранный из независимых запросов к БД.
+
+    prepare(request) -> (context, queries) | Response
+        queries — {имя: функция без аргументов}, каждая выполняет один запрос
+        и возвращает уже вычисленные данные (list / dict).
+    build_response(context, results) -> данные ответа
+        results — {имя: результат функции}.
+
+    Синхронный get() выполняет запросы по очереди; AsyncReportView с тем же
+    report_view — одновременно, каждый в своём потоке и соединении.
+    """
+
+    def prepare(self, request):
+        raise NotImplementedError
+
+    def build_response(self, context, results):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        prepared = self.prepare(request)
+        if isinstance(prepared, Response):
+            return prepared
+        context, queries = prepared
+        results = {name: query() for name, query in queries.items()}
+        return Response(self.build_response(context, results))
+
+
+def _in_worker(query):
+    def run():
+        try:
+            return query()
+        finally:
+            # поток из пула живёт дольше запроса — соединение закрываем по правилам CONN_MAX_AGE
+            close_old_connections()
+    return run
+
+
+async def run_concurrently(queries):
+    """Выполняет {имя: функция} одновременно в потоках (thread_sensitive=False), возвращает {имя: результат}."""
+    names = list(queries)
+    results = await asyncio.gather(
+        *(sync_to_async(_in_worker(queries[name]), thread_sensitive=False)() for name in names)
+    )
+    return dict(zip(names, results))
+
+
+class AsyncReportView(View):
+    """
+    Async-версия отчёта с ConcurrentQueriesMixin для ASGI.
+
+    Аутентификация, права и условный GET (ETag) проходят через обычную
+    DRF-инициализацию report_view; независимые запросы отчёта выполняются
+    параллельно, сборка ответа — как в синхронной версии.
+    """
+    report_view = None
+    http_method_names = ['get', 'head', 'options']
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def get(self, request, *args, **kwargs):
+        view, drf_request, prepared = await sync_to_async(self._prepare)(request, *args, **kwargs)
+        if isinstance(prepared, Response):
+            response = prepared
+        else:
+            context, queries = prepared
+            try:
+                results = await run_concurrently(queries)
+                response = Response(view.build_response(context, results))
+            except Exception as exc:
+                response = await sync_to_async(view.handle_exception)(exc)
+        return await sync_to_async(view.finalize_response)(drf_request, response, *args, **kwargs)
+
+    def _prepare(self, request, *args, **kwargs):
+        view = self.report_view()
+        view.args = args
+        view.kwargs = kwargs
+        drf_request = view.initialize_request(request, *args, **kwargs)
+        view.request = drf_request
+        view.headers = view.default_response_headers
+        try:
+            view.initial(drf_request, *args, **kwargs)
+            prepared = view.prepare(drf_request)
+        except Exception as exc:
+            prepared = view.handle_exception(exc)
+        return view, drf_request, prepared
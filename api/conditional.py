@@ -0,0 +1,127 @@
+import hashlib
+
+from django.db.models import Max, Count
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.dateparse import parse_date
+from django.utils.http import quote_etag
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+
+class NotModified(APIException):
+    status_code = status.HTTP_304_NOT_MODIFIED
+    default_detail = ''
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET-запросы (ETag) для отчётов и списков.
+
+    Валидатор считается дёшево: max(updated) и count(*) по исходным таблицам
+    отчёта (с тем же диапазоном дат, что и сам отчёт). Если клиент прислал
+    If-None-Match и данные не менялись — отдаём 304 до выполнения тяжёлой агрегации.
+
+    Last-Modified не отдаём: одно время max(updated) не замечает удалённых строк,
+    смены дня для окон «последние N дней» и источников без поля времени — всё это
+    есть только в ETag. If-Modified-Since без ETag поэтому всегда получает 200.
+
+    Для отчётов источники задаются через `conditional_sources`:
+        ((Outcome, "created"), (Product, None))
+    где второй элемент — поле даты, к которому применяются date_from/date_to
+    (None — таблица берётся целиком).
+
+    Для ViewSet по умолчанию источником служит отфильтрованный queryset
+    (только для действий из `conditional_actions`).
+    """
+    conditional_sources = ()
+    conditional_actions = ('list',)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._etag = None
+        if request.method not in ('GET', 'HEAD'):
+            return
+        querysets = self.get_conditional_querysets(request)
+        if not querysets:
+            return
+        self._etag = self.compute_etag(request, querysets)
+        if get_conditional_response(request._request, etag=self._etag) is not None:
+            raise NotModified()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        etag = getattr(self, '_etag', None)
+        if etag and response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def get_conditional_querysets(self, request):
+        """Список (queryset, поле_времени) для расчёта ETag."""
+        action = getattr(self, 'action', None)
+        if action is not None:
+            if action not in self.conditional_actions:
+                return []
+            qs = self.filter_queryset(self.get_queryset())
+            return [(qs, _timestamp_field(qs.model))]
+
+        try:
+            date_from, date_to = (_query_date(request, name) for name in ("date_from", "date_to"))
+        except ValueError:
+            return []  # без валидатора: ошибку параметра отдаст сам отчёт
+        querysets = []
+        for model, date_field in self.conditional_sources:
+            qs = model.objects.all()
+            if date_field and date_from:
+                qs = qs.filter(**{f"{date_field}__date__gte": date_from})
+            if date_field and date_to:
+                qs = qs.filter(**{f"{date_field}__date__lte": date_to})
+            querysets.append((qs, _timestamp_field(model)))
+        return querysets
+
+    @staticmethod
+    def compute_etag(request, querysets):
+        """
+        ETag ответа.
+
+        В хеш входят: путь с query string, пользователь (ответы `my` зависят от него),
+        текущая дата (отчёты с окном «последние N дней») и по каждому источнику
+        max(ts) + count.
+        """
+        parts = [request.get_full_path(), str(request.user.pk), timezone.now().date().isoformat()]
+        for qs, ts_field in querysets:
+            agg = {"n": Count("pk")}
+            if ts_field:
+                agg["ts"] = Max(ts_field)
+            row = qs.order_by().aggregate(**agg)
+            ts = row.get("ts")
+            parts.append(f"{qs.model._meta.label}:{row['n']}:{ts.isoformat() if ts else ''}")
+        digest = hashlib.md5("|".join(parts).encode()).hexdigest()
+        return quote_etag(digest)
+
+
+def _query_date(request, name):
+    """Дата из query string так же, как её разбирает фильтр __date (parse_date); неверная — ValueError."""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(name)
+    return parsed
+
+
+def _timestamp_field(model):
+    names = {f.name for f in model._meta.get_fields()}
+    if "updated" in names:
+        return "updated"
+    if "created" in names:
+        return "created"
+    return None
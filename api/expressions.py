@@ -0,0 +1,12 @@
+from django.db.models import Func
+
+
+class WindowSum(Func):
+    """
+    SUM(...) для использования внутри Window() поверх уже посчитанных агрегатов.
+
+    Штатный Sum() запрещает ссылаться на агрегат ("'total_amount' is an aggregate"),
+    а SUM(SUM(x)) OVER (...) — корректный SQL для сгруппированного запроса.
+    """
+    function = 'SUM'
+    window_compatible = True
@@ -1,17 +1,105 @@
 import django_filters
-from .models import WarehouseProduct, Outcome, Order, Income
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connections
+from django.db.models import Q, Case, When, Value, FloatField
+from django.db.models.functions import Upper
+
+from .models import WarehouseProduct, Outcome, Order, Income, Product, OrderItem, Catalog
+
+# Меньше трёх символов pg_trgm не ищет — только префикс кода и вхождение в название
+TRIGRAM_MIN_LENGTH = 3
+
+
+def _use_trigram(queryset, q):
+    return connections[queryset.db].vendor == 'postgresql' and len(q) >= TRIGRAM_MIN_LENGTH
+
+
+def search_products(queryset, q, name_field='name', code_field='code'):
+    """
+    Поиск товара по строке: вхождение в название, похожесть по триграммам (опечатки,
+    другой порядок слов) и префикс кода.
+
+    На PostgreSQL условия идут по выражениям UPPER(name) / UPPER(code), под которые
+    есть GIN (gin_trgm_ops) и btree (text_pattern_ops) индексы — без полного скана
+    Product при росте каталога. name_field / code_field — путь до полей товара
+    (product__name для строк остатков и заказов); code_field=None — поиск только по названию.
+    """
+    q = (q or '').strip()
+    if not q:
+        return queryset
+    condition = Q(**{f'{name_field}__icontains': q})
+    if code_field:
+        condition |= Q(**{f'{code_field}__istartswith': q})
+    if _use_trigram(queryset, q):
+        queryset = queryset.alias(_search_name=Upper(name_field))
+        condition |= Q(_search_name__trigram_word_similar=q.upper())
+    return queryset.filter(condition)
+
+
+def rank_products(queryset, q, name_field='name', code_field='code'):
+    """Добавляет search_rank: точный код > префикс кода > похожесть названия."""
+    q = (q or '').strip()
+    whens = []
+    if code_field:
+        whens += [When(**{f'{code_field}__iexact': q}, then=Value(3.0)),
+                  When(**{f'{code_field}__istartswith': q}, then=Value(2.0))]
+    if _use_trigram(queryset, q):
+        similarity = TrigramWordSimilarity(Value(q.upper()), Upper(name_field))
+        return queryset.annotate(search_rank=Case(*whens, default=Value(0.0), output_field=FloatField()) + similarity)
+    whens += [When(**{f'{name_field}__istartswith': q}, then=Value(1.0)),
+              When(**{f'{name_field}__icontains': q}, then=Value(0.5))]
+    return queryset.annotate(search_rank=Case(*whens, default=Value(0.0), output_field=FloatField()))
+
+
+class ProductSearchFilter(django_filters.CharFilter):
+    """Фильтр ?q= поверх search_products() для любых моделей, ссылающихся на товар."""
+
+    def __init__(self, *args, name_field='name', code_field='code', **kwargs):
+        self.name_field = name_field
+        self.code_field = code_field
+        kwargs.setdefault('label', 'Поиск по названию и коду')
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        return search_products(qs, value, self.name_field, self.code_field)
+
+
+class ProductFilter(django_filters.FilterSet):
+    q = ProductSearchFilter()
+
+    class Meta:
+        model = Product
+        fields = ['name', 'category', 'code', 'unit_type', 'status', 'created', 'user', 'q']
 
 
 class WarehouseProductFilter(django_filters.FilterSet):
-    product_name = django_filters.CharFilter(
-        field_name='product__name',
-        lookup_expr='icontains',
+    product_name = ProductSearchFilter(
+        name_field='product__name', code_field=None,
         label='Название продукта (по части слова)'
     )
+    q = ProductSearchFilter(name_field='product__name', code_field='product__code')
+    # аннотация reorder.below_reorder во WarehouseProductViewSet
+    below_reorder = django_filters.BooleanFilter(label='Ниже точки заказа')
 
     class Meta:
         model = WarehouseProduct
-        fields = ['product', 'product_name', 'warehouse', 'status', 'created', 'user', 'product__category']
+        fields = ['product', 'product_name', 'q', 'warehouse', 'status', 'created', 'user', 'product__category']
+
+
+class OrderItemFilter(django_filters.FilterSet):
+    q = ProductSearchFilter(name_field='product__name', code_field='product__code')
+
+    class Meta:
+        model = OrderItem
+        fields = ['order', 'product', 'status', 'q']
+
+
+class CatalogFilter(django_filters.FilterSet):
+    q = ProductSearchFilter(code_field=None, label='Поиск по названию')
+
+    class Meta:
+        model = Catalog
+        fields = ['status', 'q']
 
 
 class IncomeFilter(django_filters.FilterSet):
@@ -50,4 +138,4 @@ class OrderFilter(django_filters.FilterSet):
 
     class Meta:
         model = Order
-        fields = ['client', 'user', 'status', 'created', 'from_date', 'to_date']
+        fields = ['client', 'user', 'warehouse', 'status', 'created', 'from_date', 'to_date']
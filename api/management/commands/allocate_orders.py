@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import allocation, reservations
+from api.models import Order
+
+
+class Command(BaseCommand):
+    help = ('Распределяет открытые заказы без отгрузок по складам и создаёт черновики расходов '
+            '(меньше отгрузок, затем приоритет склада); --dry-run — только план.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--order', type=int, action='append', help='Только эти заказы (можно несколько раз)')
+        parser.add_argument('--limit', type=int, default=allocation.MAX_ORDERS, help='Заказов в одной пачке')
+        parser.add_argument('--dry-run', action='store_true', help='Показать план, ничего не создавая')
+
+    def handle(self, *args, **options):
+        if options['limit'] < 1:
+            raise CommandError('--limit должен быть не меньше 1')
+        if options['order']:
+            ids = options['order']
+        else:
+            ids = list(Order.objects.filter(status__in=reservations.RESERVING).order_by('id')
+                       .values_list('id', flat=True))
+        planned = outcomes = short = skipped = 0
+        for start in range(0, len(ids), options['limit']):
+            for row in allocation.allocate(ids[start:start + options['limit']], dry_run=options['dry_run']):
+                if 'skipped' in row:
+                    skipped += 1
+                    if options['order']:
+                        self.stdout.write(f"  заказ #{row['order']}: {row['skipped']}")
+                    continue
+                planned += 1
+                outcomes += len(row['outcomes']) if not options['dry_run'] else len(row['shipments'])
+                short += bool(row['short'])
+                warehouses = ', '.join(str(shipment['warehouse']) for shipment in row['shipments']) or '—'
+                missing = f", не хватает позиций: {len(row['short'])}" if row['short'] else ''
+                self.stdout.write(f"  заказ #{row['order']}: склады {warehouses}{missing}")
+
+        verb = 'будет создано' if options['dry_run'] else 'создано'
+        self.stdout.write(self.style.SUCCESS(
+            f'Заказов распределено: {planned}, расходов {verb}: {outcomes}, '
+            f'с нехваткой: {short}, пропущено: {skipped}'))
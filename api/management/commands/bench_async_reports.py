@@ -0,0 +1,73 @@
+import asyncio
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.views import SalesVolumeCompareView, SalesVolumeCompareAsyncView, SalesGeographyView, \
+    SalesGeographyAsyncView, CentralStockView, CentralStockAsyncView, ForecastShortagesView, \
+    ForecastShortagesAsyncView
+from user.models import User
+
+REPORTS = (
+    ("sales-volume/compare", SalesVolumeCompareView, SalesVolumeCompareAsyncView, {"group_by": "month"}),
+    ("sales-geography", SalesGeographyView, SalesGeographyAsyncView, {}),
+    ("central-stock", CentralStockView, CentralStockAsyncView, {}),
+    ("forecast-shortages", ForecastShortagesView, ForecastShortagesAsyncView, {"window_days": 365}),
+)
+
+
+class Command(BaseCommand):
+    help = 'Сравнить время отчётов: синхронные (запросы по очереди) и async (независимые запросы параллельно)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=20, help='Повторов на каждый отчёт и режим')
+        parser.add_argument('--user', help='phone_number пользователя (по умолчанию первый суперпользователь)')
+
+    def handle(self, *args, **options):
+        runs = max(1, options['runs'])
+        users = User.objects.filter(phone_number=options['user']) if options['user'] \
+            else User.objects.filter(is_superuser=True).order_by('id')
+        user = users.first()
+        if not user:
+            raise CommandError('Не найден пользователь для запросов')
+
+        factory = APIRequestFactory()
+
+        def make_request(name, params):
+            request = factory.get(f'/api/v1/reports/{name}/', params)
+            force_authenticate(request, user=user)
+            return request
+
+        for name, sync_cls, async_cls, params in REPORTS:
+            sync_view, async_view = sync_cls.as_view(), async_cls.as_view()
+
+            sync_times, sync_data = [], None
+            for _ in range(runs):
+                t0 = time.perf_counter()
+                response = sync_view(make_request(name, params))
+                response.render()
+                sync_times.append((time.perf_counter() - t0) * 1000)
+                sync_data = response.content
+
+            async def run_async():
+                timings, content = [], None
+                for _ in range(runs):
+                    t0 = time.perf_counter()
+                    response = await async_view(make_request(name, params))
+                    response.render()
+                    timings.append((time.perf_counter() - t0) * 1000)
+                    content = response.content
+                return timings, content
+
+            async_times, async_data = asyncio.run(run_async())
+
+            same = 'совпадают' if sync_data == async_data else 'РАЗЛИЧАЮТСЯ'
+            sync_p50, async_p50 = statistics.median(sync_times), statistics.median(async_times)
+            self.stdout.write(
+                f'{name}: sync p50={sync_p50:.1f} мс, async p50={async_p50:.1f} мс, '
+                f'ускорение ×{(sync_p50 / async_p50) if async_p50 else 0:.2f}; ответы {same}'
+            )
+        connections.close_all()
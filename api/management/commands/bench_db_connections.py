@@ -0,0 +1,110 @@
+import asyncio
+import statistics
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from api.models import Product
+
+
+class Command(BaseCommand):
+    help = ('Сравнить задержку «запроса» с новым соединением на каждый запрос (CONN_MAX_AGE=0) '
+            'и с переиспользуемым соединением (CONN_MAX_AGE из настроек) — для API и для апдейтов бота')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Сколько запросов в каждом режиме')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        n = max(1, options['requests'])
+        alias = options['database']
+        conn = connections[alias]
+        original_max_age = conn.settings_dict['CONN_MAX_AGE']
+
+        api_max_age = settings.DB_CONNECTIONS['api']['max_age'] or None
+        bot_max_age = settings.DB_CONNECTIONS['bot']['max_age'] or None
+        groups = (
+            ('API', self._run, api_max_age),
+            ('бот', self._run_bot, bot_max_age),
+        )
+        results = []
+        try:
+            for group, run, max_age in groups:
+                timings = {}
+                for label, mode_max_age in (('новое соединение (CONN_MAX_AGE=0)', 0),
+                                            (f'постоянное (CONN_MAX_AGE={max_age})', max_age)):
+                    conn.close()
+                    _close_in_db_thread(alias)
+                    conn.settings_dict['CONN_MAX_AGE'] = mode_max_age
+                    timings[label] = run(alias, n)
+                results.append((group, timings))
+        finally:
+            conn.close()
+            _close_in_db_thread(alias)
+            conn.settings_dict['CONN_MAX_AGE'] = original_max_age
+
+        for group, timings in results:
+            for label, values in timings.items():
+                self.stdout.write(
+                    f'{group}, {label}: p50={_pct(values, 50):.2f} мс, p95={_pct(values, 95):.2f} мс, '
+                    f'среднее={statistics.mean(values):.2f} мс'
+                )
+            (_, fresh), (_, persistent) = timings.items()
+            saved = _pct(fresh, 50) - _pct(persistent, 50)
+            self.stdout.write(self.style.SUCCESS(f'{group}: установка соединения убрана из p50: −{saved:.2f} мс'))
+
+    @staticmethod
+    def _run(alias, n):
+        """Цикл запроса как в Django: close_old_connections на старте и в конце, между ними — запрос к БД."""
+        timings = []
+        for _ in range(n):
+            t0 = time.perf_counter()
+            close_old_connections()
+            _query(alias)
+            close_old_connections()
+            timings.append((time.perf_counter() - t0) * 1000)
+        return timings
+
+    @staticmethod
+    def _run_bot(alias, n):
+        """Апдейты бота: каждый — отдельная задача asyncio через DBConnectionMiddleware, ORM — sync_to_async."""
+        from bot.middlewares import DBConnectionMiddleware
+
+        middleware = DBConnectionMiddleware()
+
+        async def handler(event, data):
+            await sync_to_async(_query)(alias)
+
+        async def updates():
+            timings = []
+            for _ in range(n):
+                t0 = time.perf_counter()
+                await asyncio.create_task(middleware(handler, None, {}))
+                timings.append((time.perf_counter() - t0) * 1000)
+            return timings
+
+        return asyncio.run(updates())
+
+
+def _query(alias):
+    list(Product.objects.using(alias).order_by('id').values('id', 'name')[:20])
+
+
+def _close_in_db_thread(alias):
+    """Закрыть соединение потока, в котором sync_to_async выполняет ORM бота."""
+    def close():
+        connections[alias].close()
+
+    async def run():
+        await sync_to_async(close)()
+
+    asyncio.run(run())
+
+
+def _pct(values, pct):
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
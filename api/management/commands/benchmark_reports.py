@@ -0,0 +1,238 @@
+import asyncio
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api import synthetic
+from api.models import Outcome, OutcomeItem
+from api.urls import router, urlpatterns
+from panasonic_api import timing
+from user.models import User
+
+# Фиксированные наборы параметров. Даты подставляются от anchor (последний день данных):
+# {to} — anchor, {quarter} — 90 дней назад, {year} — 365 дней назад
+PARAM_SETS = {
+    'report-sales-volume': [
+        {'group_by': 'day', 'date_from': '{quarter}', 'date_to': '{to}'},
+        {'group_by': 'month', 'date_from': '{year}', 'date_to': '{to}'},
+    ],
+    'report-sales-volume-compare': [{'group_by': 'month', 'mode': 'yoy', 'date_from': '{year}', 'date_to': '{to}'}],
+    'report-top-products': [
+        {'date_from': '{year}', 'date_to': '{to}'},
+        {'per': 'warehouse', 'metric': 'qty', 'limit': 10, 'date_from': '{year}', 'date_to': '{to}'},
+    ],
+    'report-least-popular-products': [{'date_from': '{year}', 'date_to': '{to}'}],
+    'report-dealers-sales': [{'date_from': '{year}', 'date_to': '{to}'}],
+    'report-dealers-compare': [{'group_by': 'month', 'date_from': '{year}', 'date_to': '{to}'}],
+    'report-dealer-avg-check': [{'date_from': '{year}', 'date_to': '{to}'}],
+    'report-orders-and-returns': [{'group_by': 'week', 'date_from': '{year}', 'date_to': '{to}'}],
+    'report-sales-geography': [{'date_from': '{year}', 'date_to': '{to}'}],
+    'report-top-categories': [{'date_from': '{year}', 'date_to': '{to}'}],
+    'report-assortment-structure': [{'level': 'product', 'date_from': '{year}', 'date_to': '{to}'}],
+    'report-central-stock': [{}],
+    'report-stocks-by-warehouse-dealer': [{}, {'group_by': 'warehouse_product'}],
+    'report-forecast-shortages': [{'window_days': 90}],
+    'report-plan-vs-actual': [{'date_from': '{year}', 'date_to': '{to}'}],
+    'report-plan-achievement': [{'dimension': 'dealer', 'date_from': '{year}', 'date_to': '{to}'}],
+    'report-orders-count': [{'group_by': 'month', 'date_from': '{year}', 'date_to': '{to}'}],
+    'report-average-order-amount': [{'dimension': 'dealer', 'date_from': '{year}', 'date_to': '{to}'}],
+    'report-most-ordered-products': [{'date_from': '{year}', 'date_to': '{to}'}],
+}
+
+# Не GET-эндпоинты и служебные маршруты
+SKIP = {'order_import', 'income_import', 'timing-endpoints'}
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _endpoints():
+    """(имя маршрута, путь, view) для всех GET-эндпоинтов api/urls.py: отчёты и списки ViewSet."""
+    patterns = list(urlpatterns) + [p for p in router.urls if p.name and p.name.endswith('-list')]
+    for pattern in patterns:
+        name = pattern.name
+        if not name or name in SKIP or '<' in str(pattern.pattern):
+            continue
+        yield name, f'/api/v1/{str(pattern.pattern).lstrip("^").rstrip("$")}', pattern.callback
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк эндпоинтов api/urls.py: p50/p95, число SQL-запросов и пик памяти. '
+            'Результат сравнивается с JSON-базой; регрессия больше порога — ошибка.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(synthetic.SCALES), default='10k',
+                            help='Масштаб синтетического набора (число OutcomeItem) и имя базы по умолчанию')
+        parser.add_argument('--seed-data', action='store_true',
+                            help='Сгенерировать синтетический набор, если его ещё нет (нужна отдельная БД)')
+        parser.add_argument('--reset-data', action='store_true', help='Удалить прежний синтетический набор')
+        parser.add_argument('--seed', type=int, default=42, help='Seed генератора')
+        parser.add_argument('--anchor', help='Последний день данных YYYY-MM-DD (по умолчанию — из набора)')
+        parser.add_argument('--runs', type=int, default=10, help='Замеров на каждый набор параметров')
+        parser.add_argument('--warmup', type=int, default=1, help='Прогревочных запросов (не учитываются)')
+        parser.add_argument('--only', help='Только маршруты, содержащие подстроку')
+        parser.add_argument('--user', help='phone_number пользователя для запросов')
+        parser.add_argument('--baseline', help='Путь к JSON-базе (по умолчанию benchmarks/reports-<scale>.json)')
+        parser.add_argument('--update-baseline', action='store_true', help='Записать результаты как новую базу')
+        parser.add_argument('--threshold', type=float, default=20.0,
+                            help='Допустимый рост p95 и пика памяти, %% (по умолчанию 20)')
+        parser.add_argument('--min-ms', type=float, default=5.0,
+                            help='Рост p95 меньше этого числа мс не считается регрессией (шум)')
+
+    def handle(self, *args, **options):
+        if options['reset_data']:
+            synthetic.clear_dataset()
+            self.stdout.write('Синтетический набор удалён')
+        if options['seed_data'] and not synthetic.dataset_exists():
+            items = synthetic.SCALES[options['scale']]
+            self.stdout.write(f'Генерация набора {options["scale"]} ({items} строк расхода)...')
+            t0 = time.perf_counter()
+            synthetic.DatasetBuilder(items, seed=options['seed'], log=self.stdout.write).build()
+            self.stdout.write(f'Набор готов за {time.perf_counter() - t0:.1f} с')
+
+        user = self._user(options['user'])
+        anchor = self._anchor(options['anchor'])
+        dates = {'to': anchor, 'quarter': anchor - timedelta(days=89), 'year': anchor - timedelta(days=364)}
+        runs, warmup = max(1, options['runs']), max(0, options['warmup'])
+        factory = APIRequestFactory()
+        # счётчик SQL — до первого запроса, чтобы попасть и на соединения потоков async-отчётов
+        timing.install()
+
+        results = {}
+        for name, path, view in _endpoints():
+            if options['only'] and options['only'] not in name:
+                continue
+            for param_set in PARAM_SETS.get(name, [{}]):
+                params = {k: str(v).format(**dates) for k, v in param_set.items()}
+                key = f'{name}?{urlencode(sorted(param_set.items()), safe="{}")}' if param_set else name
+
+                def call():
+                    request = factory.get(path, params)
+                    force_authenticate(request, user=user)
+                    response = view(request)
+                    if asyncio.iscoroutine(response):
+                        response = asyncio.run(response)
+                    response.render()
+                    return response
+
+                for _ in range(warmup):
+                    call()
+                times, queries = [], 0
+                for _ in range(runs):
+                    with timing.measure() as measured:
+                        t0 = time.perf_counter()
+                        response = call()
+                        times.append((time.perf_counter() - t0) * 1000)
+                    queries = max(queries, measured.queries)
+
+                # пик памяти — отдельным прогоном: tracemalloc заметно замедляет код
+                tracemalloc.start()
+                try:
+                    call()
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+
+                results[key] = {
+                    'status': response.status_code,
+                    'p50_ms': round(statistics.median(times), 2),
+                    'p95_ms': round(_percentile(times, 95), 2),
+                    'queries': queries,
+                    'peak_kb': round(peak / 1024, 1),
+                }
+                row = results[key]
+                self.stdout.write(f'{key}: p50={row["p50_ms"]} мс, p95={row["p95_ms"]} мс, '
+                                  f'SQL={row["queries"]}, память={row["peak_kb"]} КБ, HTTP {row["status"]}')
+        connections.close_all()
+
+        if not results:
+            raise CommandError('Нет эндпоинтов для замера')
+        report = {
+            'meta': {
+                'scale': options['scale'],
+                'outcome_items': OutcomeItem.objects.count(),
+                'anchor': anchor.isoformat(),
+                'runs': runs,
+                'vendor': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'created': timezone.now().isoformat(),
+            },
+            'results': results,
+        }
+
+        path = self._baseline_path(options)
+        baseline = json.loads(path.read_text()) if path.exists() else None
+        if baseline is None or options['update_baseline']:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True))
+            self.stdout.write(self.style.SUCCESS(f'База записана: {path}'))
+            return
+
+        regressions = self._compare(baseline, report, options['threshold'], options['min_ms'])
+        if regressions:
+            raise CommandError('Регрессии относительно %s:\n%s' % (path, '\n'.join(regressions)))
+        self.stdout.write(self.style.SUCCESS(f'Регрессий нет (порог {options["threshold"]}%, база {path})'))
+
+    def _compare(self, baseline, report, threshold, min_ms):
+        base_meta, meta = baseline.get('meta', {}), report['meta']
+        if base_meta.get('outcome_items') != meta['outcome_items']:
+            self.stdout.write(self.style.WARNING(
+                f'Объём данных отличается от базы: {base_meta.get("outcome_items")} → {meta["outcome_items"]}'))
+        factor = 1 + threshold / 100
+        regressions = []
+        for key, base in baseline.get('results', {}).items():
+            row = report['results'].get(key)
+            if row is None:
+                continue
+            if row['status'] != base['status']:
+                regressions.append(f'{key}: HTTP {base["status"]} → {row["status"]}')
+            if row['p95_ms'] > base['p95_ms'] * factor and row['p95_ms'] - base['p95_ms'] >= min_ms:
+                regressions.append(f'{key}: p95 {base["p95_ms"]} → {row["p95_ms"]} мс')
+            if row['queries'] > base['queries']:
+                regressions.append(f'{key}: SQL-запросов {base["queries"]} → {row["queries"]}')
+            if row['peak_kb'] > base['peak_kb'] * factor:
+                regressions.append(f'{key}: пик памяти {base["peak_kb"]} → {row["peak_kb"]} КБ')
+        new = sorted(set(report['results']) - set(baseline.get('results', {})))
+        if new:
+            self.stdout.write(f'Нет в базе (не сравниваются): {", ".join(new)}')
+        return regressions
+
+    def _user(self, phone):
+        if phone:
+            users = User.objects.filter(phone_number=phone)
+        elif synthetic.dataset_exists():
+            users = User.objects.filter(phone_number=synthetic.OWNER_PHONE)
+        else:
+            users = User.objects.filter(is_superuser=True).order_by('id')
+        user = users.first()
+        if not user:
+            raise CommandError('Не найден пользователь для запросов')
+        return user
+
+    def _anchor(self, value):
+        if value:
+            return date.fromisoformat(value)
+        last = Outcome.objects.filter(user__phone_number=synthetic.OWNER_PHONE).aggregate(last=Max('created'))['last']
+        return timezone.localdate(last) if last else timezone.localdate()
+
+    def _baseline_path(self, options):
+        if options['baseline']:
+            return Path(options['baseline'])
+        return settings.BASE_DIR / 'benchmarks' / f'reports-{options["scale"]}.json'
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import totals
+
+MODELS = {model._meta.model_name: model for model in totals.DOCUMENTS}
+
+
+class Command(BaseCommand):
+    help = ('Сверяет итоги шапок заказов, приходов и расходов (items_count, total_qty, total_amount) '
+            'со строками документов; --fix пересчитывает расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(MODELS), action='append',
+                            help='Только эти документы (можно несколько раз; по умолчанию все)')
+        parser.add_argument('--fix', action='store_true', help='Пересчитать шапки с расхождениями')
+        parser.add_argument('--show', type=int, default=10, help='Сколько расхождений вывести на модель')
+
+    def handle(self, *args, **options):
+        broken_total = 0
+        for name in options['model'] or sorted(MODELS):
+            model = MODELS[name]
+            broken = []
+            for pk, stored, expected in totals.mismatches(model):
+                broken.append(pk)
+                if len(broken) <= options['show']:
+                    diff = ', '.join(f'{field} {stored[field]} → {expected[field]}'
+                                     for field in totals.TOTAL_FIELDS if stored[field] != expected[field])
+                    self.stdout.write(f'  {name} #{pk}: {diff}')
+            if not broken:
+                self.stdout.write(self.style.SUCCESS(f'{name}: расхождений нет'))
+                continue
+            if options['fix']:
+                # updated тоже сдвигается: отчёты по шапкам должны сбросить ETag
+                fixed = sum(totals.recalculate(model, broken[i:i + totals.BATCH_SIZE], keep_empty_amount=True)
+                            for i in range(0, len(broken), totals.BATCH_SIZE))
+                self.stdout.write(self.style.WARNING(f'{name}: расхождений {len(broken)}, исправлено {fixed}'))
+            else:
+                broken_total += len(broken)
+                self.stdout.write(self.style.WARNING(f'{name}: расхождений {len(broken)}'))
+
+        if broken_total:
+            raise CommandError(f'Итоги расходятся со строками у {broken_total} документов (запустите с --fix)')
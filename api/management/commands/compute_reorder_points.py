@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import reorder
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает страховой запас и точку заказа по всем парам (склад, товар): '
+            'разброс дневного спроса и сроки поставки по проведённым приходам.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window-days', type=int, default=reorder.WINDOW_DAYS,
+                            help='Окно спроса, дней')
+        parser.add_argument('--history-days', type=int, default=reorder.LEAD_TIME_HISTORY_DAYS,
+                            help='За сколько дней брать приходы для срока поставки')
+        parser.add_argument('--service-level', type=float, default=reorder.SERVICE_LEVEL,
+                            help='Уровень сервиса, доля (0.95 — 95%% циклов без дефицита)')
+
+    def handle(self, *args, **options):
+        try:
+            result = reorder.recompute(window_days=max(2, options['window_days']),
+                                       service_level=options['service_level'],
+                                       history_days=max(1, options['history_days']))
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Точки заказа пересчитаны (уровень сервиса {result['service_level']}, z={result['z']}): "
+            f"пар со спросом {result['pairs']}, новых строк остатка {result['created']}, "
+            f"обнулено {result['reset']}, ниже точки заказа {result['below_reorder']}"))
@@ -5,13 +5,9 @@ class Command(BaseCommand):
     help = 'Создать WarehouseProduct для всех продуктов с количеством 0, если еще не создано'
 
     def handle(self, *args, **options):
-        products = Product.objects.all()
-        created_count = 0
-        for product in products:
-            obj, created = WarehouseProduct.objects.get_or_create(
-                product=product,
-                defaults={'count': 100, 'warehouse_id': 1, 'price': product.price}
-            )
-            if created:
-                created_count += 1
-        self.stdout.write(self.style.SUCCESS(f'Создано новых WarehouseProduct: {created_count}'))
\ No newline at end of file
+        products = Product.objects.filter(warehouseproduct__isnull=True).values_list('id', 'price')
+        rows = [WarehouseProduct(product_id=product_id, warehouse_id=1, count=100, price=price)
+                for product_id, price in products]
+        # одной вставкой; позиции, которые успели завести параллельно, пропускаются
+        WarehouseProduct.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+        self.stdout.write(self.style.SUCCESS(f'Создано новых WarehouseProduct: {len(rows)}'))
@@ -1,83 +1,156 @@
 import os
+import time
+import xml.etree.ElementTree as ET
+from decimal import Decimal, InvalidOperation
 
-import pandas as pd
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from openpyxl import load_workbook
+from openpyxl.utils.cell import range_boundaries
+
+from api import refcache
+from api.models import ProductCategory, Product
+
+# Колонки прайса: B — код, C — категория / название товара, D — цена
+CODE_COL, NAME_COL, PRICE_COL = 2, 3, 4
+
+
+def merged_cell_map(sheet):
+    """
+    {(row, col): (row, col) верхней левой ячейки} для всех объединённых ячеек листа.
+
+    Строится один раз на лист вместо обхода merged_cells.ranges в каждой строке.
+    В read-only режиме openpyxl не разбирает объединения — читаем <mergeCell> из XML листа.
+    """
+    if hasattr(sheet, 'merged_cells'):
+        refs = [str(merged_range) for merged_range in sheet.merged_cells.ranges]
+    else:
+        refs = [el.get('ref') for _, el in ET.iterparse(sheet._get_source()) if el.tag.endswith('}mergeCell')]
+    merged = {}
+    for ref in refs:
+        min_col, min_row, max_col, max_row = range_boundaries(ref)
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                merged[(row, col)] = (min_row, min_col)
+    return merged
+
+
+def _price(value):
+    try:
+        return Decimal(str(value)).quantize(Decimal('0.01'))
+    except (InvalidOperation, TypeError, ValueError):
+        return Decimal('0.00')
 
-from api.models import ProductCategory, Product  # замените на своё название приложения
 
 class Command(BaseCommand):
-    help = 'Импортирует категории и продукты из Excel-файла'
+    help = 'Импортирует категории и продукты из Excel-файла (upsert по коду товара)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=os.path.join(os.path.dirname(__file__), "Viko price.xlsx"),
+                            help='Путь к прайсу (по умолчанию Viko price.xlsx рядом с командой)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Товаров в одном INSERT ... ON CONFLICT')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if not os.path.exists(options['file']):
+            raise CommandError(f"Файл не найден: {options['file']}")
+        wb = load_workbook(filename=options['file'], read_only=True)
+        try:
+            categories, products, skipped = self.read_sheet(wb.active)
+        finally:
+            wb.close()
+
+        with transaction.atomic():
+            category_ids, categories_created = self.save_categories(categories)
+            created, updated = self.save_products(products, category_ids, max(1, options['batch_size']))
+            # bulk_create сигналов не шлёт — справочники в памяти сбрасываем сами
+            refcache.invalidate(ProductCategory, Product)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Импорт завершён за {time.perf_counter() - started:.1f} с: "
+            f"категорий {len(categories)} (новых {categories_created}), "
+            f"товаров создано {created}, обновлено {updated}"
+        ))
+        for reason, names in skipped.items():
+            if names:
+                self.stdout.write(self.style.WARNING(
+                    f"Пропущено {reason}: {len(names)} ({', '.join(map(str, names[:5]))}{'…' if len(names) > 5 else ''})"
+                ))
 
-    def handle(self, *args, **kwargs):
-        file_path = os.path.join(os.path.dirname(__file__), "Viko price.xlsx") # укажи путь, если файл не в корне проекта
-        wb = load_workbook(filename=file_path)
-        sheet = wb.active
+    def read_sheet(self, sheet):
+        """Один потоковый проход по листу: категории (жирные строки) и товары под ними."""
+        merged = merged_cell_map(sheet)
+        anchors = set(merged.values())
+        anchor_cells = {}  # значение и жирность верхних левых ячеек объединений
 
+        categories = []
+        products = {}  # code -> поля товара; повтор кода в прайсе — побеждает последняя строка
+        skipped = {'без категории': [], 'без кода': []}
         current_category = None
 
-        for row in sheet.iter_rows(min_row=2):
-            code_cell = row[1]  # колонка B
-            name_cell = row[2]  # колонка C (в ней категории и названия товаров)
-            price_cell = row[3]  # колонка D
-
-            # Проверим, объединена ли ячейка name_cell
-            for merged_range in sheet.merged_cells.ranges:
-                if name_cell.coordinate in merged_range:
-                    # Берем значение и стиль из верхней левой ячейки объединённого диапазона
-                    top_left_cell = sheet[merged_range.coord.split(":")[0]]
-                    name_cell = top_left_cell
-                    break
+        for row_idx, row in enumerate(sheet.iter_rows(min_row=2, max_col=PRICE_COL), start=2):
+            cells = {col: row[col - 1] if len(row) >= col else None for col in (CODE_COL, NAME_COL, PRICE_COL)}
+            for col, cell in cells.items():
+                if (row_idx, col) in anchors:
+                    anchor_cells[(row_idx, col)] = cell
 
-            name = name_cell.value
-            code = code_cell.value
-            price = price_cell.value
+            name_cell = cells[NAME_COL]
+            # объединённая ячейка: значение и стиль берём из верхней левой
+            top_left = merged.get((row_idx, NAME_COL))
+            if top_left is not None:
+                name_cell = anchor_cells.get(top_left, name_cell)
 
+            name = getattr(name_cell, 'value', None)
             if not name:
                 continue
 
-            is_bold = bool(name_cell.font and name_cell.font.bold)
-
-            self.stdout.write(f"Строка {name_cell.row}: '{name}' | bold={is_bold}")
-
-            if is_bold:
+            font = getattr(name_cell, 'font', None)
+            if font is not None and font.bold:
                 # Это категория
-                category_name = str(name).strip()
-                current_category, created = ProductCategory.objects.get_or_create(name=category_name)
-                self.stdout.write(self.style.SUCCESS(
-                    f"{'Создана' if created else 'Найдена'} категория: {current_category.name}"
-                ))
+                current_category = str(name).strip()
+                if current_category not in categories:
+                    categories.append(current_category)
                 continue
 
             if not current_category:
-                self.stdout.write(self.style.WARNING(f'Пропущен продукт без категории: {name}'))
+                skipped['без категории'].append(name)
+                continue
+
+            code = getattr(cells[CODE_COL], 'value', None)
+            code = str(code).strip() if code is not None else ''
+            if not code:
+                skipped['без кода'].append(name)
                 continue
 
-            product_code = str(code).strip() if code else ''
-            product_name = name.strip()
-
-            try:
-                product_price = round(float(price), 2)
-            except (TypeError, ValueError):
-                product_price = 0.0
-
-            product, created = Product.objects.get_or_create(
-                code=product_code,
-                defaults={
-                    'name': product_name,
-                    'price': product_price,
-                    'category': current_category,
-                }
-            )
-
-            if not created:
-                product.name = product_name
-                product.price = product_price
-                product.category = current_category
-                product.save()
-
-            self.stdout.write(self.style.NOTICE(
-                f"{'Создан' if created else 'Обновлён'} продукт: {product.name} (код: {product.code})"
-            ))
-
-        self.stdout.write(self.style.SUCCESS("Импорт завершён."))
+            products[code] = {
+                'name': str(name).strip(),
+                'price': _price(getattr(cells[PRICE_COL], 'value', None)),
+                'category': current_category,
+            }
+        return categories, products, skipped
+
+    @staticmethod
+    def save_categories(names):
+        """Категории по имени: существующие переиспользуются, недостающие создаются одним запросом."""
+        existing = {}
+        for pk, name in ProductCategory.objects.filter(name__in=names).order_by('-id').values_list('id', 'name'):
+            existing[name] = pk  # при дублях имени — самая старая
+        missing = [ProductCategory(name=name) for name in names if name not in existing]
+        for category in ProductCategory.objects.bulk_create(missing):
+            existing[category.name] = category.pk
+        return existing, len(missing)
+
+    @staticmethod
+    def save_products(products, category_ids, batch_size):
+        """Upsert по уникальному code: INSERT ... ON CONFLICT (code) DO UPDATE пачками."""
+        codes = list(products)
+        existing = refcache.product_ids(codes)
+        Product.objects.bulk_create(
+            [Product(code=code, name=row['name'], price=row['price'], category_id=category_ids[row['category']])
+             for code, row in products.items()],
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['code'],
+            update_fields=['name', 'price', 'category', 'updated'],
+        )
+        return len(codes) - len(existing), len(existing)
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Warehouse
+from api.stock import read_stock_file, load_stock, StockFileError
+from user.models import User
+
+
+class Command(BaseCommand):
+    help = ('Загрузить остатки склада из файла (xlsx/csv: code, count, [name], [price]). '
+            'Идемпотентно: повторный запуск с тем же файлом ничего не меняет.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Путь к файлу остатков')
+        parser.add_argument('--warehouse', required=True, help='id или название склада')
+        parser.add_argument('--user', help='phone_number пользователя, от имени которого создаются строки')
+        parser.add_argument('--keep-missing', action='store_true',
+                            help='Не обнулять позиции склада, которых нет в файле')
+        parser.add_argument('--create-products', action='store_true', help='Создавать товары с неизвестными кодами')
+        parser.add_argument('--category', help='Категория для новых товаров (по умолчанию «Без категории»)')
+        parser.add_argument('--dry-run', action='store_true', help='Только сверка, без записи')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        value = options['warehouse']
+        warehouse = Warehouse.objects.filter(pk=value).first() if value.isdigit() else \
+            Warehouse.objects.filter(name__iexact=value).first()
+        if not warehouse:
+            raise CommandError(f"Склад '{value}' не найден")
+        user = None
+        if options['user']:
+            user = User.objects.filter(phone_number=options['user']).first()
+            if not user:
+                raise CommandError(f"Пользователь '{options['user']}' не найден")
+
+        try:
+            with open(options['file'], 'rb') as f:
+                lines, errors = read_stock_file(f, options['file'])
+        except (OSError, StockFileError) as e:
+            raise CommandError(str(e))
+
+        summary = load_stock(warehouse, lines, user=user, zero_missing=not options['keep_missing'],
+                             create_products=options['create_products'], category_name=options['category'],
+                             dry_run=options['dry_run'])
+
+        self.stdout.write(f"Склад: {warehouse.name} (id={warehouse.pk}), позиций в файле: {summary['lines']}")
+        self.stdout.write(
+            f"Создано: {summary['created']}, обновлено: {summary['updated']}, обнулено: {summary['zeroed']}, "
+            f"без изменений: {summary['unchanged']}, "
+            f"новых товаров: {summary['products_created']}"
+        )
+        self.stdout.write(f"Остаток склада: {summary['qty_before']} → {summary['qty_after']}")
+        unknown = summary['unknown_codes']
+        if unknown:
+            self.stdout.write(self.style.WARNING(
+                f"Неизвестные коды ({len(unknown)}): {', '.join(unknown[:10])}{'…' if len(unknown) > 10 else ''}"
+            ))
+        for error in errors[:20]:
+            self.stdout.write(self.style.WARNING(error))
+        if len(errors) > 20:
+            self.stdout.write(self.style.WARNING(f"… и ещё {len(errors) - 20} ошибок"))
+        status = 'Пробный прогон (ничего не записано)' if summary['dry_run'] else 'Готово'
+        self.stdout.write(self.style.SUCCESS(f"{status} за {time.perf_counter() - started:.1f} с"))
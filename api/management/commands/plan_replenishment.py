@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import replenishment
+from user.models import User
+
+
+class Command(BaseCommand):
+    help = ('План пополнения складов дилеров с центрального склада по расходу и остаткам; '
+            'создаёт черновики перемещений (pending), --dry-run — только план.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--central', type=int, help='Центральный склад (по умолчанию — с наименьшим id)')
+        parser.add_argument('--warehouse', type=int, action='append',
+                            help='Только эти склады-получатели (можно несколько раз; по умолчанию все)')
+        parser.add_argument('--window-days', type=int, default=replenishment.WINDOW_DAYS,
+                            help='Окно расчёта суточного расхода, дней')
+        parser.add_argument('--cover-days', type=int, default=replenishment.COVER_DAYS,
+                            help='На сколько дней расхода пополнять склад')
+        parser.add_argument('--user', type=int, help='Автор перемещений (по умолчанию — первый суперпользователь)')
+        parser.add_argument('--dry-run', action='store_true', help='Показать план, ничего не создавая')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(pk=options['user']) if options['user'] else \
+            User.objects.filter(is_superuser=True).order_by('id')
+        user = users.first()
+        if user is None:
+            raise CommandError('Не найден пользователь для черновиков (--user)')
+        try:
+            result = replenishment.replenish(
+                user, central_id=options['central'], warehouse_ids=options['warehouse'],
+                window_days=max(1, options['window_days']), cover_days=max(1, options['cover_days']),
+                dry_run=options['dry_run'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for row in result['movements']:
+            qty = sum(item['qty'] for item in row['items'])
+            created = f", перемещение #{row['movement']}" if 'movement' in row else ''
+            self.stdout.write(f"  склад {row['warehouse_to']}: позиций {len(row['items'])}, штук {qty}{created}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Центральный склад {result['central']}: товаров со спросом {result['products']}, "
+            f"в дефиците {result['scarce_products']}, к перемещению {result['qty']} шт. "
+            f"в {len(result['movements'])} перемещениях" + (' (dry-run)' if options['dry_run'] else '')))
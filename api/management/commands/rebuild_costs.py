@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import valuation
+from api.models import MovementItem, OutcomeItem, WarehouseProduct
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Проигрывает историю приходов, расходов и перемещений по скользящей средней и заполняет '
+            'себестоимость строк расходов и перемещений, проведённых до её учёта; --prices — ещё и '
+            'среднюю цену остатков.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Перезаписать себестоимость у всех строк')
+        parser.add_argument('--prices', action='store_true',
+                            help='Записать среднюю цену из истории в остатки (WarehouseProduct.price)')
+        parser.add_argument('--warehouse', type=int, action='append', help='Только эти склады')
+
+    def handle(self, *args, **options):
+        issued = {}
+        rows = valuation.replay(valuation.AVERAGE, warehouse_ids=options['warehouse'], issued=issued)
+
+        updated = {}
+        with transaction.atomic():
+            for kind, model in (('outcome', OutcomeItem), ('movement', MovementItem)):
+                costs = {pk: cost for (item_kind, pk), cost in issued.items() if item_kind == kind}
+                queryset = model.objects.filter(pk__in=list(costs)) if options['all'] else \
+                    model.objects.filter(pk__in=list(costs), cost__isnull=True)
+                items = [model(pk=pk, cost=costs[pk]) for pk in queryset.values_list('id', flat=True)]
+                model.objects.bulk_update(items, ['cost'], batch_size=BATCH_SIZE)
+                updated[kind] = len(items)
+
+            prices = 0
+            if options['prices']:
+                units = {(row['warehouse'], row['product']): row['unit_cost'] for row in rows if row['unit_cost']}
+                balances = []
+                for wp in WarehouseProduct.objects.filter(warehouse_id__in={w for w, _ in units}).only(
+                        'id', 'warehouse_id', 'product_id', 'price'):
+                    unit = units.get((wp.warehouse_id, wp.product_id))
+                    if unit is not None and unit != wp.price:
+                        wp.price = unit
+                        balances.append(wp)
+                WarehouseProduct.objects.bulk_update(balances, ['price'], batch_size=BATCH_SIZE)
+                prices = len(balances)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Себестоимость заполнена: строк расходов {updated['outcome']}, строк перемещений {updated['movement']}"
+            + (f", цен остатков {prices}" if options['prices'] else '')))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api import reservations
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает резерв товара по всем открытым заказам (pending, collected) — '
+            'после массовой записи заказов или ручной правки строк.')
+
+    def handle(self, *args, **options):
+        changed = reservations.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Резерв пересчитан: строк заказов в резерве {changed}'))
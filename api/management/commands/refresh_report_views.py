@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import matviews
+
+
+class Command(BaseCommand):
+    help = 'Обновить materialized view отчётов (REFRESH MATERIALIZED VIEW CONCURRENTLY). Запускать по расписанию.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='Какие представления обновить (по умолчанию все)')
+        parser.add_argument('--blocking', action='store_true',
+                            help='Обычный REFRESH вместо CONCURRENTLY (быстрее, но блокирует чтение)')
+
+    def handle(self, *args, **options):
+        if not matviews.is_supported():
+            raise CommandError('Materialized view поддерживаются только на PostgreSQL')
+        names = options['names'] or matviews.MATERIALIZED_VIEWS
+        for name in names:
+            if name not in matviews.MATERIALIZED_VIEWS:
+                raise CommandError(f'Неизвестное представление: {name}')
+            state = matviews.refresh(name, concurrently=not options['blocking'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: обновлено за {state.duration_ms} мс, полные данные по {state.covered_until}'
+            ))
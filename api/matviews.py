@@ -0,0 +1,75 @@
+import time
+from datetime import date, timedelta
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import Outcome, ReportViewRefresh
+
+SALES_DAILY = 'api_sales_daily_mv'
+
+# Все materialized view отчётов (создаются миграциями, только PostgreSQL)
+MATERIALIZED_VIEWS = (SALES_DAILY,)
+
+
+def is_supported():
+    return connection.vendor == 'postgresql'
+
+
+def refresh(name, concurrently=True):
+    """
+    Обновляет materialized view и записывает, до какого дня она полная.
+
+    CONCURRENTLY не блокирует чтение отчётов, но невозможен для ещё не заполненного
+    представления (создаётся WITH NO DATA) — первое обновление идёт обычным REFRESH.
+    Полными считаются дни строго до начала обновления.
+    """
+    if name not in MATERIALIZED_VIEWS:
+        raise ValueError(f'Неизвестное представление: {name}')
+    started = timezone.now()
+    populated = ReportViewRefresh.objects.filter(name=name).exists()
+    mode = 'CONCURRENTLY ' if concurrently and populated else ''
+    t0 = time.monotonic()
+    with connection.cursor() as cursor:
+        cursor.execute(f'REFRESH MATERIALIZED VIEW {mode}{name}')
+    duration_ms = int((time.monotonic() - t0) * 1000)
+    state, _ = ReportViewRefresh.objects.update_or_create(
+        name=name,
+        defaults={
+            'updated': started,
+            'covered_until': timezone.localdate(started) - timedelta(days=1),
+            'duration_ms': duration_ms,
+        },
+    )
+    return state
+
+
+def mark_outcome_deleted():
+    """Удалённый расход остаётся в представлениях до следующего обновления — до тех пор отчёты живые."""
+    ReportViewRefresh.objects.update(outcome_deleted=timezone.now())
+
+
+def covers(name, date_to, date_from=None):
+    """
+    True, если диапазон отчёта (от date_from или начала истории до date_to включительно)
+    целиком есть в представлении и расходы этого диапазона не менялись после обновления
+    (проведение задним числом, правка строк — они трогают Outcome.updated), а расходы
+    вообще не удалялись (outcome_deleted). Иначе отчёт считается живым запросом.
+    Открытый диапазон (без date_to) всегда живой.
+    """
+    if not date_to or not is_supported():
+        return False
+    try:
+        date_to = date.fromisoformat(date_to)
+        date_from = date.fromisoformat(date_from) if date_from else None
+    except ValueError:
+        return False
+    state = ReportViewRefresh.objects.filter(name=name).values('covered_until', 'updated', 'outcome_deleted').first()
+    if state is None or state['covered_until'] is None or date_to > state['covered_until']:
+        return False
+    if state['outcome_deleted'] and state['outcome_deleted'] >= state['updated']:
+        return False
+    changed = Outcome.objects.filter(created__date__lte=date_to, updated__gt=state['updated'])
+    if date_from:
+        changed = changed.filter(created__date__gte=date_from)
+    return not changed.exists()
@@ -0,0 +1,95 @@
+# Generated by Django 5.0.6 on 2026-10-19 19:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Дневной срез продаж для отчётов по дилерам и план/факт.
+# День считается в TIME_ZONE проекта — так же, как фильтры created__date в отчётах.
+CREATE_SALES_DAILY = """
+CREATE MATERIALIZED VIEW IF NOT EXISTS api_sales_daily_mv AS
+SELECT
+    md5(concat_ws('|', s.day, s.client_id, s.warehouse_id, s.status)) AS id,
+    s.*
+FROM (
+    SELECT
+        (o.created AT TIME ZONE %(tz)s)::date AS day,
+        o.client_id,
+        o.warehouse_id,
+        o.status,
+        COALESCE(SUM(i.count), 0)::integer AS qty,
+        COALESCE(SUM(i.count * i.price), 0)::numeric(20, 2) AS amount,
+        COUNT(DISTINCT o.id)::integer AS orders,
+        MIN(o.created) AS first_sale,
+        MAX(o.created) AS last_sale
+    FROM api_outcomeitem i
+    JOIN api_outcome o ON o.id = i.outcome_id
+    GROUP BY 1, 2, 3, 4
+) s
+WITH NO DATA
+"""
+
+SALES_DAILY_INDEXES = [
+    # уникальный индекс обязателен для REFRESH MATERIALIZED VIEW CONCURRENTLY
+    "CREATE UNIQUE INDEX IF NOT EXISTS api_sales_daily_mv_id ON api_sales_daily_mv (id)",
+    "CREATE INDEX IF NOT EXISTS api_sales_daily_mv_day ON api_sales_daily_mv (day, status)",
+    "CREATE INDEX IF NOT EXISTS api_sales_daily_mv_client ON api_sales_daily_mv (client_id, day)",
+]
+
+
+def create_views(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    tz = settings.TIME_ZONE or 'UTC'
+    schema_editor.execute(CREATE_SALES_DAILY.replace('%(tz)s', "'%s'" % tz.replace("'", "''")))
+    for sql in SALES_DAILY_INDEXES:
+        schema_editor.execute(sql)
+
+
+def drop_views(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP MATERIALIZED VIEW IF EXISTS api_sales_daily_mv")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_updated_db_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesDaily',
+            fields=[
+                ('id', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('status', models.CharField(max_length=255, null=True)),
+                ('qty', models.IntegerField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('orders', models.IntegerField()),
+                ('first_sale', models.DateTimeField()),
+                ('last_sale', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Продажи по дням',
+                'verbose_name_plural': 'Продажи по дням',
+                'db_table': 'api_sales_daily_mv',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ReportViewRefresh',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Представление')),
+                ('updated', models.DateTimeField(verbose_name='Обновлено')),
+                ('covered_until', models.DateField(verbose_name='Полные данные по')),
+                ('duration_ms', models.IntegerField(default=0, verbose_name='Длительность, мс')),
+            ],
+            options={
+                'verbose_name': 'Обновление отчётного представления',
+                'verbose_name_plural': 'Обновления отчётных представлений',
+            },
+        ),
+        migrations.RunPython(create_views, drop_views),
+    ]
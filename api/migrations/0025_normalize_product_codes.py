@@ -0,0 +1,37 @@
+# Generated by Django 5.0.6 on 2026-10-19 19:21
+
+from django.db import migrations
+
+
+def normalize_codes(apps, schema_editor):
+    """
+    Перед уникальным индексом: пустой код -> NULL, пробелы по краям убираем,
+    у повторов код остаётся за самым старым товаром, остальным — суффикс "-dup<id>"
+    (товары и ссылки на них не трогаем, дубли видно по коду).
+    """
+    Product = apps.get_model('api', 'Product')
+    Product.objects.filter(code='').update(code=None)
+    seen = set()
+    changed = []
+    for product in Product.objects.exclude(code__isnull=True).only('id', 'code').order_by('id').iterator():
+        code = product.code.strip() or None
+        if code is not None and code in seen:
+            suffix = f'-dup{product.id}'
+            code = code[:255 - len(suffix)] + suffix
+        if code is not None:
+            seen.add(code)
+        if code != product.code:
+            product.code = code
+            changed.append(product)
+    Product.objects.bulk_update(changed, ['code'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_report_materialized_views'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_codes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.6 on 2026-10-19 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # отдельно от 0025: на PostgreSQL ALTER после UPDATE в той же транзакции
+    # падает с "pending trigger events"
+
+    dependencies = [
+        ('api', '0025_normalize_product_codes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='code',
+            field=models.CharField(max_length=255, null=True, unique=True, verbose_name='Код продукта'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+# Индексы под поиск товаров (api.filters.search_products). Выражения совпадают с тем,
+# что генерирует Django: icontains / istartswith -> UPPER("col"::text) LIKE UPPER(...).
+# GIN gin_trgm_ops обслуживает LIKE '%...%' и похожесть (<%), btree text_pattern_ops —
+# префикс кода короче трёх символов, где триграммы не работают.
+INDEXES = {
+    'api_product_name_trgm': 'CREATE INDEX CONCURRENTLY IF NOT EXISTS api_product_name_trgm '
+                             'ON api_product USING gin (UPPER(name) gin_trgm_ops)',
+    'api_product_code_trgm': 'CREATE INDEX CONCURRENTLY IF NOT EXISTS api_product_code_trgm '
+                             'ON api_product USING gin (UPPER(code) gin_trgm_ops)',
+    'api_product_code_prefix': 'CREATE INDEX CONCURRENTLY IF NOT EXISTS api_product_code_prefix '
+                               'ON api_product (UPPER(code) text_pattern_ops)',
+}
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for sql in INDEXES.values():
+        schema_editor.execute(sql)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in INDEXES:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не работает внутри транзакции, зато не блокирует запись в каталог
+    atomic = False
+
+    dependencies = [
+        ('api', '0026_product_code_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.0.6 on 2026-10-19 19:33
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum
+
+# Документ -> (модель строк, FK строки на документ)
+DOCUMENTS = {'order': ('orderitem', 'order'), 'income': ('incomeitem', 'income'), 'outcome': ('outcomeitem', 'outcome')}
+
+
+def fill_totals(apps, schema_editor):
+    """
+    Итоги шапок по строкам. Документы без строк сохраняют введённую сумму.
+    На PostgreSQL — один UPDATE ... FROM (GROUP BY) на таблицу вместо подзапросов на каждую строку.
+    """
+    for doc_name, (item_name, field) in DOCUMENTS.items():
+        doc = apps.get_model('api', doc_name)
+        item = apps.get_model('api', item_name)
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(
+                f'UPDATE {doc._meta.db_table} AS d '
+                f'SET items_count = t.n, total_qty = t.qty, total_amount = t.amount '
+                f'FROM (SELECT {field}_id AS doc_id, COUNT(*) AS n, COALESCE(SUM("count"), 0) AS qty, '
+                f'COALESCE(SUM("count" * price), 0) AS amount FROM {item._meta.db_table} GROUP BY {field}_id) AS t '
+                f'WHERE t.doc_id = d.id'
+            )
+            continue
+        items = item.objects.filter(**{field: OuterRef('pk')}).order_by().values(field)
+        amount = ExpressionWrapper(F('count') * F('price'), output_field=DecimalField(max_digits=20, decimal_places=2))
+        doc.objects.filter(pk__in=item.objects.values(field)).update(
+            items_count=Subquery(items.annotate(v=Count('id')).values('v')),
+            total_qty=Subquery(items.annotate(v=Sum('count')).values('v')),
+            total_amount=Subquery(items.annotate(v=Sum(amount)).values('v')),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0027_product_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='income',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Кол-во строк'),
+        ),
+        migrations.AddField(
+            model_name='income',
+            name='total_qty',
+            field=models.IntegerField(default=0, verbose_name='Общее кол-во'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Кол-во строк'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_qty',
+            field=models.IntegerField(default=0, verbose_name='Общее кол-во'),
+        ),
+        migrations.AddField(
+            model_name='outcome',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Кол-во строк'),
+        ),
+        migrations.AddField(
+            model_name='outcome',
+            name='total_qty',
+            field=models.IntegerField(default=0, verbose_name='Общее кол-во'),
+        ),
+        migrations.AlterField(
+            model_name='income',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Общая сумма'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Общая сумма'),
+        ),
+        migrations.AlterField(
+            model_name='outcome',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Общая сумма'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-19 19:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0028_document_totals'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='incomeitem',
+            name='income',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='api.income', verbose_name='Приход'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-19 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0029_incomeitem_related_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movement',
+            name='received_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Получено'),
+        ),
+        migrations.AddField(
+            model_name='movement',
+            name='sent_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Отправлено'),
+        ),
+        migrations.AddField(
+            model_name='warehouseproduct',
+            name='in_transit',
+            field=models.IntegerField(default=0, verbose_name='В пути'),
+        ),
+    ]
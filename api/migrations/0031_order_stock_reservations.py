@@ -0,0 +1,48 @@
+# Generated by Django 5.0.6 on 2026-10-19 19:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0030_movement_stock_postings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='warehouse',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.warehouse', verbose_name='Склад'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='reserved_qty',
+            field=models.IntegerField(default=0, verbose_name='Зарезервировано'),
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField(default=0, verbose_name='Счётчик')),
+                ('reserved', models.IntegerField(default=0, verbose_name='Зарезервировано')),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.product', verbose_name='Продукт')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.warehouse', verbose_name='Склад')),
+            ],
+            options={
+                'verbose_name': 'Резерв товара',
+                'verbose_name_plural': 'Резервы товаров',
+            },
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='reservation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.stockreservation', verbose_name='Резерв'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockreservation',
+            constraint=models.UniqueConstraint(fields=('warehouse', 'product', 'slot'), name='stock_reservation_slot_unique'),
+        ),
+    ]
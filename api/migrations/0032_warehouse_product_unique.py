@@ -0,0 +1,66 @@
+# Generated by Django 5.0.6 on 2026-10-19 19:46
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Дубли (склад, товар) сливаются в строку с меньшим id: количества и «в пути» складываются,
+    цена — средневзвешенная по положительным остаткам (если их нет — цена оставшейся строки).
+    """
+    wp = apps.get_model('api', 'WarehouseProduct')
+    table = wp._meta.db_table
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'UPDATE {table} AS w '
+            f'SET "count" = g.qty, in_transit = g.transit, '
+            f'price = COALESCE(ROUND(g.amount / NULLIF(g.positive, 0), 2), w.price), updated = now() '
+            f'FROM (SELECT MIN(id) AS keep_id, SUM("count") AS qty, SUM(in_transit) AS transit, '
+            f'SUM(CASE WHEN "count" > 0 THEN "count" * price ELSE 0 END) AS amount, '
+            f'SUM(GREATEST("count", 0)) AS positive '
+            f'FROM {table} GROUP BY warehouse_id, product_id HAVING COUNT(*) > 1) AS g '
+            f'WHERE w.id = g.keep_id'
+        )
+        schema_editor.execute(
+            f'DELETE FROM {table} AS w USING {table} AS keep '
+            f'WHERE keep.warehouse_id IS NOT DISTINCT FROM w.warehouse_id AND keep.product_id = w.product_id '
+            f'AND keep.id < w.id'
+        )
+        return
+    groups = (wp.objects.values('warehouse_id', 'product_id').annotate(n=Count('id'))
+              .filter(n__gt=1).order_by())
+    now = timezone.now()
+    for group in groups:
+        rows = list(wp.objects.filter(warehouse_id=group['warehouse_id'], product_id=group['product_id'])
+                    .order_by('id'))
+        keep = rows[0]
+        positive = sum(row.count for row in rows if row.count > 0)
+        if positive:
+            amount = sum(row.count * row.price for row in rows if row.count > 0)
+            keep.price = (amount / positive).quantize(Decimal('0.01'))
+        keep.count = sum(row.count for row in rows)
+        keep.in_transit = sum(row.in_transit for row in rows)
+        keep.updated = now
+        keep.save(update_fields=['count', 'in_transit', 'price', 'updated'])
+        wp.objects.filter(pk__in=[row.pk for row in rows[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0031_order_stock_reservations'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='warehouseproduct',
+            constraint=models.UniqueConstraint(fields=('warehouse', 'product'), name='warehouse_product_unique'),
+        ),
+    ]
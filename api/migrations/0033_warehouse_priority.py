@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0032_warehouse_product_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='warehouse',
+            name='priority',
+            field=models.PositiveSmallIntegerField(default=100, verbose_name='Приоритет'),
+        ),
+    ]
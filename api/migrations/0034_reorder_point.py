@@ -0,0 +1,33 @@
+# Generated by Django 5.0.6 on 2026-10-19 19:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0033_warehouse_priority'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='income',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Оприходовано'),
+        ),
+        migrations.AddField(
+            model_name='warehouseproduct',
+            name='policy_updated',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Точка заказа пересчитана'),
+        ),
+        migrations.AddField(
+            model_name='warehouseproduct',
+            name='reorder_point',
+            field=models.IntegerField(default=0, verbose_name='Точка заказа'),
+        ),
+        migrations.AddField(
+            model_name='warehouseproduct',
+            name='safety_stock',
+            field=models.IntegerField(default=0, verbose_name='Страховой запас'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-19 19:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0034_reorder_point'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movementitem',
+            name='cost',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True, verbose_name='Себестоимость'),
+        ),
+        migrations.AddField(
+            model_name='outcome',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Списано'),
+        ),
+        migrations.AddField(
+            model_name='outcomeitem',
+            name='cost',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True, verbose_name='Себестоимость'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.6 on 2026-10-19 21:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0035_item_cost'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.core.management import call_command
+from django.db import migrations
+
+
+# Таблица общего кэша (settings.CACHES, DatabaseCache): на ней версии справочников api.refcache.
+# createcachetable сам пропускает уже созданную таблицу и кэши, которые живут не в БД (Redis).
+def create_cache_table(apps, schema_editor):
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0036_report_updated'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 20:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0037_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportviewrefresh',
+            name='outcome_deleted',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Удалён расход'),
+        ),
+    ]
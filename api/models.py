@@ -54,14 +54,14 @@ class Product(models.Model):
         kg = 'kg', 'Кг.'
 
     category = models.ForeignKey(ProductCategory, on_delete=models.CASCADE, verbose_name='Категория')
-    code = models.CharField(max_length=255, verbose_name='Код продукта', null=True)
+    code = models.CharField(max_length=255, verbose_name='Код продукта', null=True, unique=True)
     name = models.CharField(max_length=255, verbose_name='Название')
     unit_type = models.CharField(max_length=255, verbose_name='Ед. изм', choices=UnitType.choices, default=UnitType.pcs)
     price = models.DecimalField(decimal_places=2, max_digits=15, default=0, verbose_name='Цена')
     status = models.CharField(max_length=255, verbose_name='Статус', null=True)
     comment = models.TextField(verbose_name='Коммент', null=True, blank=True)
     created = models.DateTimeField(auto_now_add=True)
-    updated = models.DateTimeField(auto_now=True)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
     user = models.ForeignKey('user.User', on_delete=models.CASCADE, verbose_name='Пользователь', null=True)
 
     def __str__(self):
@@ -79,6 +79,8 @@ class Warehouse(models.Model):
     responsible = models.ForeignKey('user.User', on_delete=models.CASCADE, verbose_name='Ответственный',
                                     related_name='responsible_warehouses', null=True)
     user = models.ForeignKey('user.User', on_delete=models.CASCADE, verbose_name='Пользователь')
+    # меньше — предпочтительнее, когда заказ распределяется по складам (api.allocation)
+    priority = models.PositiveSmallIntegerField(default=100, verbose_name='Приоритет')
 
     def __str__(self):
         return self.name
@@ -92,10 +94,16 @@ class WarehouseProduct(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='Продукт')
     warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, verbose_name='Склад', null=True)
     count = models.IntegerField(verbose_name='Кол-во')
+    # отправлено на этот склад перемещениями, но ещё не получено (в count не входит)
+    in_transit = models.IntegerField(verbose_name='В пути', default=0)
     status = models.CharField(max_length=255, verbose_name='Статус', null=True)
     price = models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Цена', default=0)
+    # страховой запас и точка заказа, их пересчитывает api.reorder (команда compute_reorder_points)
+    safety_stock = models.IntegerField(verbose_name='Страховой запас', default=0)
+    reorder_point = models.IntegerField(verbose_name='Точка заказа', default=0)
+    policy_updated = models.DateTimeField(verbose_name='Точка заказа пересчитана', null=True, blank=True)
     created = models.DateTimeField(auto_now_add=True)
-    updated = models.DateTimeField(auto_now=True)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
     user = models.ForeignKey('user.User', on_delete=models.CASCADE, verbose_name='Пользователь', null=True)
 
     def __str__(self):
@@ -104,6 +112,36 @@ class WarehouseProduct(models.Model):
     class Meta:
         verbose_name = 'Продукт в складе'
         verbose_name_plural = 'Продукты в складе'
+        # одна строка остатка на пару: писатели делают upsert по (warehouse, product)
+        constraints = [
+            models.UniqueConstraint(fields=['warehouse', 'product'], name='warehouse_product_unique'),
+        ]
+
+
+class StockReservation(models.Model):
+    """
+    Резерв товара на складе под открытые заказы.
+
+    На пару (склад, товар) приходится до RESERVATION_STRIPES строк-счётчиков (slot):
+    строка заказа попадает в slot = id % RESERVATION_STRIPES, поэтому одновременные
+    заказы одного ходового товара обновляют разные строки и не ждут друг друга.
+    Резерв пары — сумма reserved по её строкам (api.reservations).
+    """
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, verbose_name='Склад')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='Продукт')
+    slot = models.PositiveSmallIntegerField(default=0, verbose_name='Счётчик')
+    reserved = models.IntegerField(default=0, verbose_name='Зарезервировано')
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.warehouse_id}/{self.product_id}/{self.slot}: {self.reserved}'
+
+    class Meta:
+        verbose_name = 'Резерв товара'
+        verbose_name_plural = 'Резервы товаров'
+        constraints = [
+            models.UniqueConstraint(fields=['warehouse', 'product', 'slot'], name='stock_reservation_slot_unique'),
+        ]
 
 
 class Income(models.Model):
@@ -121,16 +159,21 @@ class Income(models.Model):
     client = models.ForeignKey('user.User', on_delete=models.CASCADE, verbose_name='Клиент',
                                related_name='income_client')
     created = models.DateTimeField(auto_now_add=True)
-    updated = models.DateTimeField(auto_now=True)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
     user = models.ForeignKey('user.User', on_delete=models.CASCADE, verbose_name='Пользователь',
                              related_name='income_user')
     comment = models.TextField(verbose_name='Коммент', blank=True, null=True)
     status = models.CharField(max_length=255, verbose_name='Статус',
                               choices=Status.choices, default=Status.pending, null=True)
-    total_amount = models.DecimalField(decimal_places=2, max_digits=10, default=0, verbose_name='Общая сумма')
+    total_amount = models.DecimalField(decimal_places=2, max_digits=15, default=0, verbose_name='Общая сумма')
+    # Итоги по строкам, их ведут сигналы строк (api.signals, api.totals)
+    items_count = models.PositiveIntegerField(default=0, verbose_name='Кол-во строк')
+    total_qty = models.IntegerField(default=0, verbose_name='Общее кол-во')
     warehouse = models.ForeignKey('Warehouse', on_delete=models.CASCADE, verbose_name='Склад', null=True)
     reason = models.CharField(verbose_name='Причина', choices=Reason.choices, max_length=255, default=Reason.order)
     reason_id = models.IntegerField(verbose_name='Айди причины', default=0)
+    # момент проводки на склад (stock.post_incomes): created -> finished_at — срок поставки
+    finished_at = models.DateTimeField(verbose_name='Оприходовано', null=True, blank=True)
 
     def __str__(self):
         return f'{self.id}'
@@ -141,7 +184,7 @@ class Income(models.Model):
 
 
 class IncomeItem(models.Model):
-    income = models.ForeignKey(Income, on_delete=models.CASCADE, verbose_name='Приход')
+    income = models.ForeignKey(Income, on_delete=models.CASCADE, verbose_name='Приход', related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='Продукт')
     count = models.IntegerField(verbose_name='Кол-во')
     price = models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Цена')
@@ -172,16 +215,21 @@ class Outcome(models.Model):
     client = models.ForeignKey('user.User', on_delete=models.CASCADE, verbose_name='Клиент',
                                related_name='outcome_client')
     created = models.DateTimeField(auto_now_add=True)
-    updated = models.DateTimeField(auto_now=True)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
     status = models.CharField(max_length=255, verbose_name='Статус',
                               choices=Status.choices, default=Status.pending, null=True)
     user = models.ForeignKey('user.User', on_delete=models.CASCADE, verbose_name='Пользователь',
                              related_name='outcome_user')
     comment = models.TextField(verbose_name='Коммент', blank=True, null=True)
-    total_amount = models.DecimalField(decimal_places=2, max_digits=10, default=0, verbose_name='Общая сумма')
+    total_amount = models.DecimalField(decimal_places=2, max_digits=15, default=0, verbose_name='Общая сумма')
+    # Итоги по строкам, их ведут сигналы строк (api.signals, api.totals)
+    items_count = models.PositiveIntegerField(default=0, verbose_name='Кол-во строк')
+    total_qty = models.IntegerField(default=0, verbose_name='Общее кол-во')
     warehouse = models.ForeignKey('Warehouse', on_delete=models.CASCADE, verbose_name='Склад', null=True)
     reason = models.CharField(verbose_name='Причина', choices=Reason.choices, max_length=255, default=Reason.order)
     reason_id = models.IntegerField(verbose_name='Айди причины', default=0)
+    # момент списания со склада (stock.post_outcomes) — порядок событий для FIFO (api.valuation)
+    finished_at = models.DateTimeField(verbose_name='Списано', null=True, blank=True)
 
     def __str__(self):
         return f'{self.id}'
@@ -197,6 +245,8 @@ class OutcomeItem(models.Model):
     count = models.IntegerField(verbose_name='Кол-во')
     status = models.CharField(max_length=255, verbose_name='Статус', null=True)
     price = models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Цена')
+    # себестоимость единицы на момент проводки (средневзвешенная цена остатка, api.stock)
+    cost = models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Себестоимость', null=True, blank=True)
     user = models.ForeignKey('user.User', on_delete=models.CASCADE, verbose_name='Пользователь')
 
     def __str__(self):
@@ -223,9 +273,12 @@ class Movement(models.Model):
                                      related_name='warehouse_to')
     user = models.ForeignKey('user.User', on_delete=models.CASCADE, verbose_name='Пользователь')
     created = models.DateTimeField(auto_now_add=True)
-    updated = models.DateTimeField(auto_now=True)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
     status = models.CharField(max_length=255, verbose_name='Статус', choices=Status.choices, default=Status.pending)
     comment = models.TextField(verbose_name='Коммент', blank=True, null=True)
+    # когда проведены списание со склада-отправителя и приход на склад-получатель (api.stock)
+    sent_at = models.DateTimeField(verbose_name='Отправлено', null=True, blank=True)
+    received_at = models.DateTimeField(verbose_name='Получено', null=True, blank=True)
 
     def __str__(self):
         return f'{self.id}'
@@ -240,6 +293,8 @@ class MovementItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='Продукт')
     count = models.IntegerField(verbose_name='Кол-во', default=0)
     comment = models.TextField(verbose_name='Коммент', blank=True, null=True)
+    # себестоимость единицы на складе-отправителе в момент отправки
+    cost = models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Себестоимость', null=True, blank=True)
     user = models.ForeignKey('user.User', on_delete=models.CASCADE, verbose_name='Пользователь')
 
     def __str__(self):
@@ -262,10 +317,16 @@ class Order(models.Model):
     client = models.ForeignKey('user.User', on_delete=models.CASCADE, verbose_name='Клиент',
                                related_name='order_client')
     user = models.ForeignKey('user.User', on_delete=models.CASCADE, verbose_name='Пользователь')
+    # склад, с которого резервируется товар заказа (api.reservations)
+    warehouse = models.ForeignKey('Warehouse', on_delete=models.SET_NULL, verbose_name='Склад', null=True,
+                                  blank=True)
     created = models.DateTimeField(auto_now_add=True)
-    updated = models.DateTimeField(auto_now=True)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
     comment = models.TextField(verbose_name='Комментарии', null=True, blank=True)
-    total_amount = models.DecimalField(decimal_places=2, max_digits=10, default=0, verbose_name='Общая сумма')
+    total_amount = models.DecimalField(decimal_places=2, max_digits=15, default=0, verbose_name='Общая сумма')
+    # Итоги по строкам, их ведут сигналы строк (api.signals, api.totals)
+    items_count = models.PositiveIntegerField(default=0, verbose_name='Кол-во строк')
+    total_qty = models.IntegerField(default=0, verbose_name='Общее кол-во')
     status = models.CharField(max_length=255, verbose_name='Статус', choices=Status.choices, default=Status.pending)
 
     def __str__(self):
@@ -288,6 +349,10 @@ class OrderItem(models.Model):
     comment = models.TextField(verbose_name='Коммент', null=True, blank=True)
     price = models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Цена')
     status = models.CharField(max_length=255, verbose_name='Статус', choices=Status.choices, default=Status.pending)
+    # сколько строка держит в резерве и в какой строке-счётчике (ведёт api.reservations)
+    reservation = models.ForeignKey('StockReservation', on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='+', verbose_name='Резерв')
+    reserved_qty = models.IntegerField(default=0, verbose_name='Зарезервировано')
 
     def __str__(self):
         return f'{self.id}'
@@ -305,6 +370,8 @@ class Report(models.Model):
 
     client = models.ForeignKey('user.User', on_delete=models.CASCADE, verbose_name='Клиент')
     created = models.DateTimeField(auto_now_add=True)
+    # меняется и при правке строк (signals.touch_document) — по нему ETag планов
+    updated = models.DateTimeField(auto_now=True)
     comment = models.TextField(verbose_name='Коммент', null=True, blank=True)
     status = models.CharField(max_length=255, verbose_name='Статус', choices=Status.choices, default=Status.pending)
     period = models.IntegerField(verbose_name='Период(месяц)', default=0)
@@ -364,4 +431,46 @@ class Catalog(models.Model):
 
     class Meta:
         verbose_name = 'Каталог'
-        verbose_name_plural = 'Каталоги'
\ No newline at end of file
+        verbose_name_plural = 'Каталоги'
+
+class SalesDaily(models.Model):
+    """
+    Дневной срез продаж (materialized view api_sales_daily_mv, только PostgreSQL).
+    Строка = день × клиент × склад × статус расхода. Создаётся миграцией,
+    обновляется командой refresh_report_views.
+    """
+    id = models.CharField(max_length=32, primary_key=True)
+    day = models.DateField()
+    client = models.ForeignKey('user.User', on_delete=models.DO_NOTHING, db_constraint=False,
+                               related_name='+', null=True)
+    warehouse = models.ForeignKey('Warehouse', on_delete=models.DO_NOTHING, db_constraint=False,
+                                  related_name='+', null=True)
+    status = models.CharField(max_length=255, null=True)
+    qty = models.IntegerField()
+    amount = models.DecimalField(decimal_places=2, max_digits=20)
+    orders = models.IntegerField()
+    first_sale = models.DateTimeField()
+    last_sale = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'api_sales_daily_mv'
+        verbose_name = 'Продажи по дням'
+        verbose_name_plural = 'Продажи по дням'
+
+
+class ReportViewRefresh(models.Model):
+    """Когда materialized view обновлялась в последний раз и до какого дня включительно она полная."""
+    name = models.CharField(max_length=255, unique=True, verbose_name='Представление')
+    updated = models.DateTimeField(verbose_name='Обновлено')
+    covered_until = models.DateField(verbose_name='Полные данные по')
+    duration_ms = models.IntegerField(default=0, verbose_name='Длительность, мс')
+    # удаление расхода не меняет ничьего updated — отмечаем его здесь (signals.mark_outcome_deleted)
+    outcome_deleted = models.DateTimeField(verbose_name='Удалён расход', null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.name}'
+
+    class Meta:
+        verbose_name = 'Обновление отчётного представления'
+        verbose_name_plural = 'Обновления отчётных представлений'
@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q
+
+from .models import Product, ProductCategory, Status, UnitType, Warehouse
+
+VERSION_KEY = 'refcache:version:{}'
+# Ключей в одном IN (...) при доборе строк, которых нет в памяти
+FETCH_BATCH = 1000
+
+
+def _code(value):
+    return str(value).strip() if value is not None else ''
+
+
+def _name(value):
+    return str(value).strip().casefold() if value is not None else ''
+
+
+class ReferenceCache:
+    """
+    Справочник целиком в памяти процесса: строки — namedtuple, индексы — dict.
+
+    Актуальность держится на счётчике версии в общем кэше Django (settings.CACHES):
+    сигналы post_save/post_delete увеличивают его, а процесс перечитывает таблицу, когда
+    версия изменилась или данным больше REFCACHE_MAX_AGE секунд. Версию сверяем не чаще
+    раза в REFCACHE_CHECK_SECONDS — обычный поиск вообще не обращается ни к БД, ни к кэшу.
+    Массовые операции (bulk_create, update) сигналов не шлют — после них нужно вызвать
+    invalidate(), иначе изменения дойдут до процессов только через REFCACHE_MAX_AGE.
+
+    Ключи, которых нет в памяти, добираются одним запросом: если строки в БД нашлись
+    (версия ещё не дошла до процесса), таблица перечитывается.
+    """
+
+    def __init__(self, name, model, fields, indexes=None):
+        self.name = name
+        self.model = model
+        self.fields = ('id',) + tuple(f for f in fields if f != 'id')
+        self.row = namedtuple(f'{model.__name__}Ref', self.fields)
+        # индекс -> (поле, нормализация ключа); при повторе ключа побеждает меньший id
+        self.indexes = {'pk': ('id', int), **(indexes or {})}
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked = 0.0
+        self._loaded = 0.0
+        self._data = None
+
+    @property
+    def version_key(self):
+        return VERSION_KEY.format(self.name)
+
+    def _shared_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, 1, None)
+            version = cache.get(self.version_key, 1)
+        return version
+
+    def _load(self):
+        # всегда из default: реплика после записи может ещё отдавать старые строки
+        queryset = self.model._default_manager.using(DEFAULT_DB_ALIAS).order_by('id').values_list(*self.fields)
+        rows = [self.row(*values) for values in queryset]
+        data = {'rows': rows}
+        for index, (field, normalize) in self.indexes.items():
+            position = self.fields.index(field)
+            # обход с конца: при дублях ключа остаётся строка с наименьшим id
+            data[index] = {normalize(row[position]): row for row in reversed(rows) if row[position] is not None}
+        return data
+
+    def _current(self):
+        now = time.monotonic()
+        if self._data is not None and now - self._checked < settings.REFCACHE_CHECK_SECONDS:
+            return self._data
+        with self._lock:
+            version = self._shared_version()
+            if self._data is None or version != self._version or now - self._loaded >= settings.REFCACHE_MAX_AGE:
+                self._data = self._load()
+                self._version = version
+                self._loaded = now
+            self._checked = now
+            return self._data
+
+    def get(self, key, by='pk', default=None):
+        row = self.get_many([key], by=by).get(key)
+        return default if row is None else row
+
+    def get_many(self, keys, by='pk'):
+        """{ключ: строка} для найденных ключей; ненайденных в результате нет."""
+        field, normalize = self.indexes[by]
+        normalized = {}
+        for key in keys:
+            try:
+                normalized[key] = normalize(key)
+            except (TypeError, ValueError):
+                continue
+        index = self._current()[by]
+        missing = {value for value in normalized.values() if value not in index}
+        if missing:
+            fetched = self._fetch(field, normalize, missing)
+            if fetched:
+                index = {**index, **fetched}
+                # внутри транзакции строки могут быть ещё не закоммичены — в память их не берём
+                if not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+                    with self._lock:
+                        self._data = None
+        return {key: index[value] for key, value in normalized.items() if value in index}
+
+    def _fetch(self, field, normalize, values):
+        """Строки для ключей, которых нет в памяти: версия могла ещё не дойти до процесса."""
+        manager = self.model._default_manager.using(DEFAULT_DB_ALIAS)
+        if normalize is _name:
+            condition = Q()
+            for value in values:
+                condition |= Q(**{f'{field}__iexact': value})
+            conditions = [condition]
+        else:
+            values = list(values)
+            conditions = [Q(**{f'{field}__in': values[i:i + FETCH_BATCH]}) for i in range(0, len(values), FETCH_BATCH)]
+        position = self.fields.index(field)
+        fetched = {}
+        for condition in conditions:
+            # по убыванию id: при дублях ключа остаётся строка с наименьшим id
+            for values_row in manager.filter(condition).order_by('-id').values_list(*self.fields):
+                row = self.row._make(values_row)
+                fetched[normalize(row[position])] = row
+        return fetched
+
+    def all(self):
+        return list(self._current()['rows'])
+
+    def first(self):
+        rows = self._current()['rows']
+        return rows[0] if rows else None
+
+    def invalidate(self):
+        """
+        Сбрасывает справочник во всех процессах (через версию) после коммита.
+
+        До коммита другие процессы ещё видят старые строки — перечитай они таблицу
+        раньше, новая версия закрепила бы устаревшие данные. Откат ничего не сбрасывает.
+        """
+        transaction.on_commit(self._bump)
+
+    def _bump(self):
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.add(self.version_key, 2, None)
+        with self._lock:
+            self._data = None
+
+
+PRODUCTS = ReferenceCache('product', Product, ('code', 'name', 'price', 'category_id', 'unit_type', 'status'),
+                          indexes={'code': ('code', _code)})
+CATEGORIES = ReferenceCache('category', ProductCategory, ('name', 'status'), indexes={'name': ('name', _name)})
+WAREHOUSES = ReferenceCache('warehouse', Warehouse, ('name', 'responsible_id', 'priority'),
+                            indexes={'name': ('name', _name)})
+UNIT_TYPES = ReferenceCache('unit_type', UnitType, ('name', 'status'), indexes={'name': ('name', _name)})
+STATUSES = ReferenceCache('status', Status, ('name', 'status'))
+
+REGISTRY = {ref.model: ref for ref in (PRODUCTS, CATEGORIES, WAREHOUSES, UNIT_TYPES, STATUSES)}
+
+
+def invalidate(*models):
+    """Сброс справочников моделей (без аргументов — всех)."""
+    for model in models or REGISTRY:
+        ref = REGISTRY.get(model)
+        if ref is not None:
+            ref.invalidate()
+
+
+def product_ids(codes):
+    """{код: id товара} для известных кодов — без запроса к БД."""
+    return {code: row.id for code, row in PRODUCTS.get_many(codes, by='code').items()}
+
+
+def default_warehouse():
+    """Склад по умолчанию — с наименьшим id."""
+    return WAREHOUSES.first()
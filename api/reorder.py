@@ -0,0 +1,201 @@
+from collections import defaultdict
+from datetime import timedelta
+from statistics import NormalDist
+
+import numpy as np
+from django.db import transaction
+from django.db.models import BooleanField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Income, IncomeItem, Outcome, OutcomeItem, WarehouseProduct
+
+# Окно спроса (дни) для среднего и разброса дневных отгрузок
+WINDOW_DAYS = 90
+# За сколько дней берутся проведённые приходы для срока поставки
+LEAD_TIME_HISTORY_DAYS = 365
+# Срок поставки, если по складу ещё не было ни одного прихода
+DEFAULT_LEAD_TIME_DAYS = 7
+# Приход, проведённый в день создания, всё равно покрывает не меньше суток спроса
+MIN_LEAD_TIME_DAYS = 1
+# Вероятность не уйти в ноль за время поставки
+SERVICE_LEVEL = 0.95
+BATCH_SIZE = 1000
+
+
+def below_reorder(queryset):
+    """Остатки (WarehouseProduct) с флагом below_reorder: count + in_transit < reorder_point."""
+    flag = ExpressionWrapper(Q(reorder_point__gt=F('count') + F('in_transit')), output_field=BooleanField())
+    return queryset.annotate(below_reorder=flag)
+
+
+def _keys(warehouse_ids, product_ids):
+    """Пара (склад, товар) одним int64 — для np.unique/searchsorted."""
+    return (np.asarray(warehouse_ids, dtype=np.int64) << 32) | np.asarray(product_ids, dtype=np.int64)
+
+
+def _moments(groups, values, size):
+    """(n, среднее, стандартное отклонение) значений по группам 0..size-1."""
+    n = np.bincount(groups, minlength=size)
+    total = np.bincount(groups, weights=values, minlength=size)
+    squares = np.bincount(groups, weights=values ** 2, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(n > 0, total / n, 0.0)
+        var = np.where(n > 1, (squares - n * mean ** 2) / (n - 1), 0.0)
+    return n, mean, np.sqrt(np.maximum(var, 0.0))
+
+
+def _lookup(sorted_keys, keys):
+    """Позиции keys в отсортированном sorted_keys; отсутствующие — -1."""
+    if not len(sorted_keys):
+        return np.full(len(keys), -1, dtype=np.int64)
+    position = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return np.where(sorted_keys[position] == keys, position, -1)
+
+
+def _demand(window_days, today):
+    """Пары (склад, товар) со спросом, средний дневной спрос и его стандартное отклонение."""
+    rows = list(
+        OutcomeItem.objects.filter(outcome__status=Outcome.Status.finished, outcome__warehouse__isnull=False,
+                                   outcome__created__date__gt=today - timedelta(days=window_days),
+                                   outcome__created__date__lte=today)
+        .values_list('outcome__warehouse_id', 'product_id', TruncDate('outcome__created'))
+        .annotate(qty=Sum('count')).order_by()
+    )
+    if not rows:
+        return np.array([], dtype=np.int64), np.array([]), np.array([])
+    warehouses, products, _, qty = zip(*rows)
+    keys, groups = np.unique(_keys(warehouses, products), return_inverse=True)
+    qty = np.array(qty, dtype=np.float64)
+    # дни без отгрузок — тоже наблюдения (нули): считаем по всем window_days дням окна
+    total = np.bincount(groups, weights=qty, minlength=len(keys))
+    squares = np.bincount(groups, weights=qty ** 2, minlength=len(keys))
+    mean = total / window_days
+    var = (squares - window_days * mean ** 2) / max(window_days - 1, 1)
+    return keys, mean, np.sqrt(np.maximum(var, 0.0))
+
+
+def _lead_times(keys, history_days, today):
+    """
+    Средний срок поставки и его отклонение (дни) для пар keys по проведённым приходам:
+    created -> finished_at (у старых приходов — updated). Нет приходов товара на склад —
+    берётся статистика склада, нет и её — всей сети, иначе DEFAULT_LEAD_TIME_DAYS.
+    """
+    incomes = list(
+        Income.objects.filter(status=Income.Status.finished, warehouse__isnull=False,
+                              created__date__gt=today - timedelta(days=history_days))
+        .values_list('id', 'warehouse_id', 'created', Coalesce('finished_at', 'updated')).order_by('id')
+    )
+    mean = np.full(len(keys), float(DEFAULT_LEAD_TIME_DAYS))
+    std = np.zeros(len(keys))
+    if not incomes:
+        return mean, std
+
+    income_ids = np.array([row[0] for row in incomes], dtype=np.int64)
+    income_warehouses = np.array([row[1] for row in incomes], dtype=np.int64)
+    days = np.array([max((end - start).total_seconds(), 0) / 86400 for _, _, start, end in incomes])
+
+    # вся сеть, затем склад, затем пара — более точная статистика перекрывает общую;
+    # разброс берётся только там, где приходов больше одного
+    mean[:] = days.mean()
+    std[:] = days.std(ddof=1) if len(days) > 1 else 0.0
+    warehouse_ids, groups = np.unique(income_warehouses, return_inverse=True)
+    n, w_mean, w_std = _moments(groups, days, len(warehouse_ids))
+    position = _lookup(warehouse_ids, keys >> 32)
+    found = position >= 0
+    mean[found] = w_mean[position[found]]
+    several = found & (n[np.maximum(position, 0)] > 1)
+    std[several] = w_std[position[several]]
+
+    lines = list(
+        IncomeItem.objects.filter(income_id__in=income_ids.tolist()).values_list('income_id', 'product_id')
+        .distinct().order_by()
+    )
+    if lines:
+        line_incomes, line_products = (np.array(column, dtype=np.int64) for column in zip(*lines))
+        line = np.searchsorted(income_ids, line_incomes)
+        pair_keys, groups = np.unique(_keys(income_warehouses[line], line_products), return_inverse=True)
+        n, p_mean, p_std = _moments(groups, days[line], len(pair_keys))
+        position = _lookup(pair_keys, keys)
+        found = position >= 0
+        mean[found] = p_mean[position[found]]
+        # одного прихода мало для разброса — остаётся разброс склада
+        several = found & (n[np.maximum(position, 0)] > 1)
+        std[several] = p_std[position[several]]
+    return mean, std
+
+
+def compute(window_days=WINDOW_DAYS, service_level=SERVICE_LEVEL, history_days=LEAD_TIME_HISTORY_DAYS):
+    """
+    Страховой запас и точка заказа по всем парам (склад, товар) со спросом за окно.
+
+    d, σd — средний дневной спрос и его отклонение, L, σL — срок поставки в днях и его
+    отклонение, z — квантиль нормального распределения для service_level:
+        safety_stock = ceil(z · sqrt(L · σd² + d² · σL²)),  reorder_point = ceil(d · L) + safety_stock.
+    Спрос и сроки читаются тремя запросами на весь каталог, расчёт — массивами NumPy.
+    Возвращает {склад, товар, daily_demand, demand_std, lead_time, lead_time_std, safety_stock, reorder_point}
+    массивами одинаковой длины.
+    """
+    if not 0 < service_level < 1:
+        raise ValueError("service_level должен быть в интервале (0, 1)")
+    today = timezone.localdate()
+    keys, demand, demand_std = _demand(window_days, today)
+    lead_time, lead_time_std = _lead_times(keys, history_days, today)
+    lead_time = np.maximum(lead_time, MIN_LEAD_TIME_DAYS)
+    z = NormalDist().inv_cdf(service_level)
+    safety = np.ceil(z * np.sqrt(lead_time * demand_std ** 2 + demand ** 2 * lead_time_std ** 2) - 1e-9)
+    safety = np.maximum(safety, 0).astype(np.int64)
+    return {
+        'warehouse': keys >> 32,
+        'product': keys & 0xFFFFFFFF,
+        'daily_demand': demand,
+        'demand_std': demand_std,
+        'lead_time': lead_time,
+        'lead_time_std': lead_time_std,
+        'safety_stock': safety,
+        'reorder_point': np.ceil(demand * lead_time - 1e-9).astype(np.int64) + safety,
+    }
+
+
+def recompute(window_days=WINDOW_DAYS, service_level=SERVICE_LEVEL, history_days=LEAD_TIME_HISTORY_DAYS):
+    """
+    Пересчитывает и сохраняет safety_stock / reorder_point у остатков.
+
+    Пары со спросом без строки остатка заводятся с count=0 (им и нужен заказ), пары без
+    спроса обнуляются одним UPDATE. Возвращает сводку для команды.
+    """
+    policy = compute(window_days, service_level, history_days)
+    pairs = list(zip(policy['warehouse'].tolist(), policy['product'].tolist()))
+    values = dict(zip(pairs, zip(policy['safety_stock'].tolist(), policy['reorder_point'].tolist())))
+    stamp = timezone.now()
+
+    with transaction.atomic():
+        by_warehouse = defaultdict(set)
+        for warehouse_id, product_id in pairs:
+            by_warehouse[warehouse_id].add(product_id)
+        condition = Q()
+        for warehouse_id, product_ids in by_warehouse.items():
+            condition |= Q(warehouse_id=warehouse_id, product_id__in=product_ids)
+        rows = WarehouseProduct.objects.filter(condition) if pairs else WarehouseProduct.objects.none()
+        existing = {(w, p): pk for pk, w, p in rows.values_list('id', 'warehouse_id', 'product_id') if (w, p) in values}
+        missing = [pair for pair in pairs if pair not in existing]
+        WarehouseProduct.objects.bulk_create(
+            [WarehouseProduct(warehouse_id=w, product_id=p, count=0, safety_stock=values[(w, p)][0],
+                              reorder_point=values[(w, p)][1], policy_updated=stamp) for w, p in missing],
+            batch_size=BATCH_SIZE, ignore_conflicts=True)
+        WarehouseProduct.objects.bulk_update(
+            [WarehouseProduct(pk=pk, safety_stock=values[pair][0], reorder_point=values[pair][1],
+                              policy_updated=stamp, updated=stamp) for pair, pk in existing.items()],
+            ['safety_stock', 'reorder_point', 'policy_updated', 'updated'], batch_size=BATCH_SIZE)
+        reset = (WarehouseProduct.objects.exclude(policy_updated=stamp).exclude(safety_stock=0, reorder_point=0)
+                 .update(safety_stock=0, reorder_point=0, policy_updated=stamp, updated=stamp))
+        below = below_reorder(WarehouseProduct.objects.all()).filter(below_reorder=True).count()
+
+    return {
+        'pairs': len(pairs),
+        'created': len(missing),
+        'reset': reset,
+        'below_reorder': below,
+        'service_level': service_level,
+        'z': round(NormalDist().inv_cdf(service_level), 3),
+    }
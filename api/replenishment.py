@@ -0,0 +1,173 @@
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import refcache, reservations
+from .models import Income, IncomeItem, Movement, MovementItem, Outcome, OutcomeItem, Warehouse, WarehouseProduct
+
+WINDOW_DAYS = 60
+COVER_DAYS = 14
+# Перемещения, которые ещё не отправлены: их количества уже «обещаны» складу-получателю
+OPEN_MOVEMENTS = (Movement.Status.pending, Movement.Status.collected)
+
+
+class _Index:
+    """Номер строки/столбца матрицы по id склада или товара."""
+
+    def __init__(self, ids):
+        self.ids = np.array(sorted(set(ids)), dtype=np.int64)
+        self.position = {pk: i for i, pk in enumerate(self.ids.tolist())}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def take(self, keys):
+        """Позиции для массива id; чужие id — -1."""
+        return np.array([self.position.get(pk, -1) for pk in keys], dtype=np.int64)
+
+
+def _matrix(rows, warehouses, products):
+    """Сумма значений по (склад, товар) из строк [(склад, товар, значение)] в матрицу склады × товары."""
+    result = np.zeros((len(warehouses), len(products)), dtype=np.int64)
+    if rows:
+        w_ids, p_ids, values = zip(*rows)
+        w, p = warehouses.take(w_ids), products.take(p_ids)
+        known = (w >= 0) & (p >= 0)
+        np.add.at(result, (w[known], p[known]), np.array(values, dtype=np.int64)[known])
+    return result
+
+
+def fair_share(need, free):
+    """
+    Делит свободный остаток центрального склада между складами.
+
+    need — потребность (склады × товары), free — свободно по товарам. Если хватает всем,
+    каждый получает свою потребность; иначе — пропорционально потребности, округление
+    вниз, а остаток штук раздаётся по наибольшей дробной части (метод наибольших остатков).
+    """
+    total = need.sum(axis=0)
+    scarce = total > free
+    alloc = need.copy()
+    if scarce.any():
+        share = need[:, scarce] * (free[scarce] / total[scarce])
+        base = np.floor(share).astype(np.int64)
+        remainder = free[scarce] - base.sum(axis=0)
+        # ранг строки внутри столбца по убыванию дробной части: первые remainder получают +1
+        order = np.argsort(-(share - base), axis=0, kind='stable')
+        rank = np.argsort(order, axis=0, kind='stable')
+        alloc[:, scarce] = base + (rank < remainder)
+    return alloc, scarce
+
+
+def plan(central_id=None, warehouse_ids=None, window_days=WINDOW_DAYS, cover_days=COVER_DAYS):
+    """
+    План пополнения складов дилеров с центрального склада.
+
+    По каждой паре (склад, товар) матрицами NumPy: суточный расход = отгрузки за окно / window_days,
+    цель = расход × cover_days + страховой запас, позиция = остаток + в пути + ожидаемые приходы
+    ± неотправленные перемещения, потребность = max(0, цель - позиция). Свободный остаток центрального
+    (count - reserved - неотправленные перемещения с него) делится между складами fair_share.
+    below_reorder у строки — остаток + в пути ниже точки заказа (api.reorder).
+    Данные читаются пятью агрегирующими запросами на всю сеть.
+    """
+    central = refcache.WAREHOUSES.get(central_id) if central_id else refcache.default_warehouse()
+    if central is None:
+        raise ValueError("Центральный склад не найден")
+    dealer_ids = warehouse_ids or [row.id for row in refcache.WAREHOUSES.all()]
+    dealer_ids = [pk for pk in dealer_ids if pk != central.id]
+    today = timezone.localdate()
+
+    usage = list(
+        OutcomeItem.objects.filter(outcome__warehouse_id__in=dealer_ids, outcome__status=Outcome.Status.finished,
+                                   outcome__created__date__gt=today - timedelta(days=window_days),
+                                   outcome__created__date__lte=today)
+        .values_list('outcome__warehouse_id', 'product_id').annotate(qty=Sum('count')).order_by()
+    )
+    warehouses = _Index(dealer_ids)
+    products = _Index(product_id for _, product_id, _ in usage)
+    result = {'central': central.id, 'window_days': window_days, 'cover_days': cover_days,
+              'products': len(products), 'scarce_products': 0, 'below_reorder': 0, 'qty': 0, 'movements': []}
+    if not len(warehouses) or not len(products):
+        return result
+
+    product_ids = products.ids.tolist()
+    stock_rows = list(
+        reservations.with_available(WarehouseProduct.objects.filter(warehouse_id__in=[central.id, *dealer_ids],
+                                                                    product_id__in=product_ids))
+        .order_by().values_list('warehouse_id', 'product_id', 'count', 'in_transit', 'reserved', 'safety_stock',
+                                'reorder_point')
+    )
+    incoming = (IncomeItem.objects.filter(income__warehouse_id__in=dealer_ids, product_id__in=product_ids,
+                                          income__status__in=[Income.Status.pending, Income.Status.active])
+                .values_list('income__warehouse_id', 'product_id').annotate(qty=Sum('count')).order_by())
+    moving = list(
+        MovementItem.objects.filter(movement__status__in=OPEN_MOVEMENTS, product_id__in=product_ids)
+        .values_list('movement__warehouse_from_id', 'movement__warehouse_to_id', 'product_id')
+        .annotate(qty=Sum('count')).order_by()
+    )
+
+    rate = _matrix(usage, warehouses, products) / window_days
+    on_hand = _matrix([(w, p, count + in_transit) for w, p, count, in_transit, *_ in stock_rows], warehouses, products)
+    safety = _matrix([(w, p, ss) for w, p, *_, ss, _ in stock_rows], warehouses, products)
+    below = on_hand < _matrix([(w, p, rop) for w, p, *_, rop in stock_rows], warehouses, products)
+    target = np.ceil(rate * cover_days).astype(np.int64) + safety
+    position = (on_hand
+                + _matrix(list(incoming), warehouses, products)
+                + _matrix([(to, p, qty) for _, to, p, qty in moving], warehouses, products)
+                - _matrix([(src, p, qty) for src, _, p, qty in moving], warehouses, products))
+    need = np.maximum(target - position, 0)
+
+    central_index = _Index([central.id])
+    free = (_matrix([(w, p, count - reserved) for w, p, count, _, reserved, *_ in stock_rows], central_index, products)
+            - _matrix([(src, p, qty) for src, _, p, qty in moving], central_index, products))[0]
+    alloc, scarce = fair_share(need, np.maximum(free, 0))
+
+    result['scarce_products'] = int(scarce.sum())
+    result['below_reorder'] = int(below.sum())
+    result['qty'] = int(alloc.sum())
+    for row in np.flatnonzero(alloc.sum(axis=1)):
+        columns = np.flatnonzero(alloc[row])
+        result['movements'].append({
+            'warehouse_to': int(warehouses.ids[row]),
+            'items': [{'product': int(products.ids[col]), 'qty': int(alloc[row, col]),
+                       'need': int(need[row, col]), 'daily_rate': round(float(rate[row, col]), 3),
+                       'below_reorder': bool(below[row, col])}
+                      for col in columns],
+        })
+    return result
+
+
+def create_movements(result, user):
+    """Черновики Movement (pending) с центрального склада по плану: два bulk_create."""
+    movements = [Movement(warehouse_from_id=result['central'], warehouse_to_id=row['warehouse_to'], user=user,
+                          status=Movement.Status.pending,
+                          comment=f"Пополнение: покрытие {result['cover_days']} дн.")
+                 for row in result['movements']]
+    Movement.objects.bulk_create(movements)
+    MovementItem.objects.bulk_create([
+        MovementItem(movement=movement, product_id=item['product'], count=item['qty'], user=user)
+        for movement, row in zip(movements, result['movements']) for item in row['items']
+    ])
+    for movement, row in zip(movements, result['movements']):
+        row['movement'] = movement.pk
+    return movements
+
+
+def replenish(user, central_id=None, warehouse_ids=None, window_days=WINDOW_DAYS, cover_days=COVER_DAYS,
+              dry_run=False):
+    """
+    План и (если не dry_run) черновики перемещений. Строка центрального склада блокируется:
+    два одновременных прогона не распределят один и тот же остаток дважды.
+    """
+    with transaction.atomic():
+        if not dry_run:
+            central = central_id or getattr(refcache.default_warehouse(), 'id', None)
+            list(Warehouse.objects.select_for_update().filter(pk=central))
+        result = plan(central_id, warehouse_ids, window_days, cover_days)
+        if not dry_run and result['movements']:
+            create_movements(result, user)
+    result['dry_run'] = dry_run
+    return result
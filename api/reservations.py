@@ -0,0 +1,184 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Order, OrderItem, StockReservation, WarehouseProduct
+
+# Заказы в этих статусах держат товар в резерве; после отправки или отмены резерв снимается
+RESERVING = (Order.Status.pending, Order.Status.collected)
+BATCH_SIZE = 1000
+# Строк в одной проверке наличия (POST stock/availability/)
+AVAILABILITY_MAX_LINES = 1000
+
+
+def _slot(item_id):
+    return item_id % settings.RESERVATION_STRIPES
+
+
+def _stripe_ids(keys):
+    """{(склад, товар, slot): id строки-счётчика}; недостающие строки создаются."""
+    keys = set(keys)
+    found = {}
+
+    def fetch(wanted):
+        by_warehouse = defaultdict(set)
+        for warehouse_id, product_id, _ in wanted:
+            by_warehouse[warehouse_id].add(product_id)
+        condition = Q()
+        for warehouse_id, product_ids in by_warehouse.items():
+            condition |= Q(warehouse_id=warehouse_id, product_id__in=product_ids)
+        rows = StockReservation.objects.filter(condition).values_list('warehouse_id', 'product_id', 'slot', 'id')
+        found.update({(w, p, s): pk for w, p, s, pk in rows if (w, p, s) in wanted})
+
+    if keys:
+        fetch(keys)
+    missing = keys - found.keys()
+    if missing:
+        # параллельный заказ мог создать ту же строку — конфликт пропускаем и перечитываем
+        StockReservation.objects.bulk_create(
+            [StockReservation(warehouse_id=w, product_id=p, slot=s) for w, p, s in missing],
+            batch_size=BATCH_SIZE, ignore_conflicts=True)
+        fetch(missing)
+    return found
+
+
+def _add(deltas):
+    """reserved += delta для строк-счётчиков: один UPDATE на пачку, по возрастанию id."""
+    deltas = sorted((pk, delta) for pk, delta in deltas.items() if delta)
+    for i in range(0, len(deltas), BATCH_SIZE):
+        batch = deltas[i:i + BATCH_SIZE]
+        delta = Case(*[When(pk=pk, then=Value(value)) for pk, value in batch], output_field=IntegerField())
+        StockReservation.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+            reserved=F('reserved') + delta, updated=timezone.now())
+
+
+def _sync(items):
+    """Приводит резерв строк заказов к статусу заказа, складу, товару и количеству."""
+    wanted = {}
+    for item in items:
+        order = item.order
+        if (order.status in RESERVING and order.warehouse_id and item.status != OrderItem.Status.cancelled
+                and item.count > 0):
+            wanted[item.pk] = ((order.warehouse_id, item.product_id, _slot(item.pk)), item.count)
+    stripes = _stripe_ids(key for key, _ in wanted.values())
+
+    deltas, changed = defaultdict(int), []
+    for item in items:
+        key, qty = wanted.get(item.pk, (None, 0))
+        stripe = stripes[key] if key else None
+        if stripe == item.reservation_id and qty == item.reserved_qty:
+            continue
+        if item.reservation_id:
+            deltas[item.reservation_id] -= item.reserved_qty
+        if stripe:
+            deltas[stripe] += qty
+        item.reservation_id, item.reserved_qty = stripe, qty
+        changed.append(item)
+    _add(deltas)
+    OrderItem.objects.bulk_update(changed, ['reservation', 'reserved_qty'], batch_size=BATCH_SIZE)
+    return len(changed)
+
+
+def _locked_items(condition):
+    return list(OrderItem.objects.select_for_update(of=('self',)).filter(condition).select_related('order')
+                .only('id', 'product_id', 'count', 'status', 'reservation_id', 'reserved_qty',
+                      'order__status', 'order__warehouse_id').order_by('id'))
+
+
+def sync_orders(order_ids):
+    """
+    Пересчёт резерва по заказам — после смены статуса или склада и после
+    массовой записи строк (bulk_create сигналов не шлёт). Возвращает число изменённых строк.
+    """
+    order_ids = list(order_ids)
+    changed = 0
+    with transaction.atomic():
+        for i in range(0, len(order_ids), BATCH_SIZE):
+            changed += _sync(_locked_items(Q(order_id__in=order_ids[i:i + BATCH_SIZE])))
+    return changed
+
+
+def sync_items(item_ids):
+    """Пересчёт резерва отдельных строк заказа (сигналы OrderItem)."""
+    with transaction.atomic():
+        return _sync(_locked_items(Q(pk__in=list(item_ids))))
+
+
+def release(item):
+    """Снимает резерв удаляемой строки заказа."""
+    if item.reservation_id and item.reserved_qty:
+        _add({item.reservation_id: -item.reserved_qty})
+
+
+def rebuild():
+    """
+    Резерв заново по всем открытым заказам: счётчики обнуляются, строки
+    раскладываются по ним пачками. Для сверки после массовых операций.
+    """
+    with transaction.atomic():
+        StockReservation.objects.exclude(reserved=0).update(reserved=0, updated=timezone.now())
+        OrderItem.objects.exclude(reservation=None, reserved_qty=0).update(reservation=None, reserved_qty=0)
+        order_ids = Order.objects.filter(status__in=RESERVING).exclude(warehouse=None).order_by('id')
+        return sync_orders(order_ids.values_list('id', flat=True))
+
+
+def reserved_total(warehouse='warehouse_id', product='product_id'):
+    """Подзапрос: резерв пары (склад, товар) — сумма строк-счётчиков по уникальному индексу."""
+    stripes = (StockReservation.objects.filter(warehouse_id=OuterRef(warehouse), product_id=OuterRef(product))
+               .order_by().values('warehouse_id', 'product_id').annotate(total=Sum('reserved')).values('total'))
+    return Coalesce(Subquery(stripes, output_field=IntegerField()), 0)
+
+
+def with_available(queryset):
+    """Остатки (WarehouseProduct) с полями reserved и available = count - reserved."""
+    return queryset.annotate(reserved=reserved_total(), available=F('count') - F('reserved'))
+
+
+def available(warehouse_id, product_id):
+    """Свободный остаток товара на складе (count - reserved) одним запросом; нет позиции — 0."""
+    row = (with_available(WarehouseProduct.objects.filter(warehouse_id=warehouse_id, product_id=product_id))
+           .order_by('id').values_list('available', flat=True).first())
+    return row or 0
+
+
+def availability(lines, warehouse_ids=None):
+    """
+    Свободный остаток под строки корзины [(товар, кол-во)] по всем складам
+    (или только warehouse_ids) — один запрос к остаткам на всю корзину.
+
+    Строки проверяются независимо: повтор товара в корзине не уменьшает остаток
+    для следующей строки. Результат — в порядке строк:
+    {product, qty, available, enough, warehouse, warehouses: [{warehouse, count, reserved, available}]},
+    где warehouse — склад, с которого строку можно отгрузить целиком (с наибольшим остатком).
+    """
+    product_ids = {product_id for product_id, _ in lines}
+    queryset = WarehouseProduct.objects.filter(product_id__in=product_ids, warehouse__isnull=False)
+    if warehouse_ids is not None:
+        queryset = queryset.filter(warehouse_id__in=warehouse_ids)
+    rows = with_available(queryset).order_by().values_list('product_id', 'warehouse_id', 'count', 'reserved',
+                                                           'available')
+    stock = defaultdict(list)
+    for product_id, warehouse_id, count, reserved, free in rows:
+        stock[product_id].append({'warehouse': warehouse_id, 'count': count, 'reserved': reserved,
+                                  'available': max(free, 0)})
+    for warehouses in stock.values():
+        warehouses.sort(key=lambda row: (-row['available'], row['warehouse']))
+
+    result = []
+    for product_id, qty in lines:
+        warehouses = stock.get(product_id, [])
+        total = sum(row['available'] for row in warehouses)
+        best = warehouses[0] if warehouses and warehouses[0]['available'] >= qty else None
+        result.append({
+            'product': product_id,
+            'qty': qty,
+            'available': total,
+            'enough': total >= qty,
+            'warehouse': best['warehouse'] if best else None,
+            'warehouses': [row for row in warehouses if row['available'] > 0],
+        })
+    return result
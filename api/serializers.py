@@ -1,4 +1,8 @@
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
+
+from . import refcache, reservations, stock, totals, transitions
 from .models import (
     Status, UnitType, ProductCategory, Product,
     Warehouse, WarehouseProduct,
@@ -6,6 +10,83 @@ from .models import (
 )
 
 
+class DocumentItemSerializer(serializers.ModelSerializer):
+    """
+    Строка внутри шапки документа (поле items). Товары проверяет шапка — пачкой,
+    по справочнику в памяти; цена по умолчанию — из карточки товара.
+    """
+    product = serializers.IntegerField(source='product_id')
+    product_name = serializers.SerializerMethodField()
+
+    def get_product_name(self, obj):
+        product = refcache.PRODUCTS.get(obj.product_id)
+        return product.name if product else None
+
+
+class NestedItemsMixin:
+    """
+    Создание документа вместе со строками: POST шапки с массивом items.
+
+    Строки вставляются одним bulk_create в той же транзакции, что и шапка; итоги
+    шапки пересчитываются одним UPDATE (сигналы строк при bulk_create не срабатывают).
+    Менять строки существующего документа — по-прежнему через эндпоинты строк:
+    items в PUT/PATCH шапки игнорируется (клиенты отправляют документ целиком, как получили).
+    """
+    item_parent_field = None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if isinstance(self.parent, serializers.ListSerializer):
+            fields.pop('items', None)  # в списках строк нет — там items_count
+        return fields
+
+    def validate_items(self, items):
+        if self.instance is not None:
+            return items  # отбрасывается в update()
+        ids = {item['product_id'] for item in items}
+        products = refcache.PRODUCTS.get_many(ids)
+        unknown = sorted(ids - set(products))
+        if unknown:
+            raise serializers.ValidationError(f"Товары не найдены: {', '.join(map(str, unknown))}")
+        item_model = self.fields['items'].child.Meta.model
+        if any(f.name == 'price' for f in item_model._meta.fields):
+            for item in items:
+                if item.get('price') is None:
+                    item['price'] = products[item['product_id']].price
+        return items
+
+    def create(self, validated_data):
+        items = validated_data.pop('items', [])
+        with transaction.atomic():
+            instance = super().create(validated_data)
+            if items:
+                self.create_items(instance, items)
+        return instance
+
+    def update(self, instance, validated_data):
+        validated_data.pop('items', None)
+        return super().update(instance, validated_data)
+
+    def create_items(self, instance, items):
+        item_model = self.fields['items'].child.Meta.model
+        defaults = {self.item_parent_field: instance}
+        if any(f.name == 'user' for f in item_model._meta.fields):
+            request = self.context.get('request')
+            user = getattr(request, 'user', None)
+            defaults['user'] = user if user is not None and user.is_authenticated else instance.user
+        item_model.objects.bulk_create([item_model(**defaults, **item) for item in items])
+
+        model = type(instance)
+        if model in totals.DOCUMENTS:
+            totals.recalculate(model, [instance.pk])
+            instance.refresh_from_db(fields=[*totals.TOTAL_FIELDS, 'updated'])
+        else:
+            model.objects.filter(pk=instance.pk).update(updated=timezone.now())
+        if model is Order:
+            # bulk_create не шлёт сигналов строк — резерв заказа ставим сами
+            reservations.sync_orders([instance.pk])
+
+
 class StatusSerializer(serializers.ModelSerializer):
     class Meta:
         model = Status
@@ -44,10 +125,15 @@ class WarehouseSerializer(serializers.ModelSerializer):
 class WarehouseProductSerializer(serializers.ModelSerializer):
     product_name = serializers.SerializerMethodField()
     unit_type_name = serializers.SerializerMethodField()
+    # есть, когда queryset собран через reservations.with_available
+    reserved = serializers.IntegerField(read_only=True)
+    available = serializers.IntegerField(read_only=True)
+    below_reorder = serializers.BooleanField(read_only=True)
 
     class Meta:
         model = WarehouseProduct
         fields = '__all__'
+        read_only_fields = ('safety_stock', 'reorder_point', 'policy_updated')
 
     def get_product_name(self, obj):
         return obj.product.name
@@ -56,7 +142,17 @@ class WarehouseProductSerializer(serializers.ModelSerializer):
         return obj.product.get_unit_type_display()
 
 
-class IncomeSerializer(serializers.ModelSerializer):
+class IncomeItemNestedSerializer(DocumentItemSerializer):
+    class Meta:
+        model = IncomeItem
+        exclude = ('income',)
+        read_only_fields = ('user',)
+        extra_kwargs = {'price': {'required': False}}
+
+
+class IncomeSerializer(NestedItemsMixin, serializers.ModelSerializer):
+    item_parent_field = 'income'
+    items = IncomeItemNestedSerializer(many=True, required=False)
     user_fullname = serializers.SerializerMethodField()
     client_fullname = serializers.SerializerMethodField()
     status_value = serializers.SerializerMethodField()
@@ -64,6 +160,7 @@ class IncomeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Income
         fields = '__all__'
+        read_only_fields = ('items_count', 'total_qty', 'total_amount', 'finished_at')
 
     def get_user_fullname(self, obj):
         return obj.user.get_full_name()
@@ -78,25 +175,18 @@ class IncomeSerializer(serializers.ModelSerializer):
         old_status = instance.status
         new_status = validated_data.get('status', old_status)
 
-        instance = super().update(instance, validated_data)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
 
-        if old_status != 'finished' and new_status == 'finished':
-            self.create_or_update_product(instance)
+            if old_status != 'finished' and new_status == 'finished':
+                self.create_or_update_product(instance)
 
         return instance
 
     def create_or_update_product(self, income):
-        income_items = IncomeItem.objects.filter(income=income)
-        for income_item in income_items:
-            warehouse_product, created = WarehouseProduct.objects.get_or_create(
-                product=income_item.product,
-                warehouse=income.warehouse,
-                defaults={'count': income_item.count,
-                          'price': income_item.price, }
-            )
-            if not created:
-                warehouse_product.count += income_item.count
-                warehouse_product.save()
+        errors = stock.post_incomes([income])
+        if errors:
+            raise serializers.ValidationError(errors[income.pk])
 
 
 class IncomeItemSerializer(serializers.ModelSerializer):
@@ -110,7 +200,17 @@ class IncomeItemSerializer(serializers.ModelSerializer):
         return obj.product.name
 
 
-class OutcomeSerializer(serializers.ModelSerializer):
+class OutcomeItemNestedSerializer(DocumentItemSerializer):
+    class Meta:
+        model = OutcomeItem
+        exclude = ('outcome',)
+        read_only_fields = ('user', 'cost')
+        extra_kwargs = {'price': {'required': False}}
+
+
+class OutcomeSerializer(NestedItemsMixin, serializers.ModelSerializer):
+    item_parent_field = 'outcome'
+    items = OutcomeItemNestedSerializer(many=True, required=False)
     user_fullname = serializers.SerializerMethodField()
     client_fullname = serializers.SerializerMethodField()
     status_value = serializers.SerializerMethodField()
@@ -118,6 +218,7 @@ class OutcomeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Outcome
         fields = '__all__'
+        read_only_fields = ('items_count', 'total_qty', 'total_amount', 'finished_at')
 
     def get_user_fullname(self, obj):
         return obj.user.get_full_name()
@@ -132,28 +233,14 @@ class OutcomeSerializer(serializers.ModelSerializer):
         prev_status = instance.status
         new_status = validated_data.get('status', instance.status)
 
-        instance = super().update(instance, validated_data)
-
-        # логика вычитания товара при смене статуса на finished
-        if prev_status != 'finished' and new_status == 'finished':
-            warehouse = instance.warehouse
-            for item in instance.items.all():
-                try:
-                    wp = WarehouseProduct.objects.get(
-                        product=item.product,
-                        warehouse=warehouse
-                    )
-                    if wp.count >= item.count:
-                        wp.count -= item.count
-                        wp.save()
-                    else:
-                        raise serializers.ValidationError(
-                            f"Недостаточно товара {item.product.name} на складе"
-                        )
-                except WarehouseProduct.DoesNotExist:
-                    raise serializers.ValidationError(
-                        f"Товар {item.product.name} не найден на складе"
-                    )
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+
+            # логика вычитания товара при смене статуса на finished
+            if prev_status != 'finished' and new_status == 'finished':
+                errors = stock.post_outcomes([instance])
+                if errors:
+                    raise serializers.ValidationError(errors[instance.pk])
 
         return instance
 
@@ -164,12 +251,22 @@ class OutcomeItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OutcomeItem
         fields = '__all__'
+        read_only_fields = ('cost',)
 
     def get_product_name(self, obj):
         return obj.product.name
 
 
-class MovementSerializer(serializers.ModelSerializer):
+class MovementItemNestedSerializer(DocumentItemSerializer):
+    class Meta:
+        model = MovementItem
+        exclude = ('movement',)
+        read_only_fields = ('user', 'cost')
+
+
+class MovementSerializer(NestedItemsMixin, serializers.ModelSerializer):
+    item_parent_field = 'movement'
+    items = MovementItemNestedSerializer(many=True, required=False)
     user_fullname = serializers.SerializerMethodField()
     warehouse_from_name = serializers.SerializerMethodField()
     warehouse_to_name = serializers.SerializerMethodField()
@@ -177,6 +274,28 @@ class MovementSerializer(serializers.ModelSerializer):
     class Meta:
         model = Movement
         fields = '__all__'
+        read_only_fields = ('sent_at', 'received_at')
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            # статус и отметки проводок — по заблокированной строке, а не по прочитанной до запроса
+            locked = Movement.objects.select_for_update().get(pk=instance.pk)
+            instance.status, instance.sent_at, instance.received_at = locked.status, locked.sent_at, locked.received_at
+            prev_status = locked.status
+            new_status = validated_data.get('status', prev_status)
+            if new_status != prev_status and not transitions.allowed(Movement, prev_status, new_status):
+                raise serializers.ValidationError({'status': f"Переход {prev_status} → {new_status} не разрешён"})
+
+            instance = super().update(instance, validated_data)
+
+            # отправка списывает со склада-отправителя, получение зачисляет на склад-получатель
+            posting = transitions.POSTINGS.get((Movement, new_status))
+            if posting and prev_status != new_status:
+                errors = posting([instance])
+                if errors:
+                    raise serializers.ValidationError(errors[instance.pk])
+
+        return instance
 
     def get_user_fullname(self, obj):
         return obj.user.get_full_name()
@@ -194,26 +313,34 @@ class MovementItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = MovementItem
         fields = '__all__'
+        read_only_fields = ('cost',)
 
     def get_product_name(self, obj):
         return obj.product.name
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderItemNestedSerializer(DocumentItemSerializer):
+    class Meta:
+        model = OrderItem
+        exclude = ('order', 'reservation')
+        read_only_fields = ('reserved_qty',)
+        extra_kwargs = {'price': {'required': False}}
+
+
+class OrderSerializer(NestedItemsMixin, serializers.ModelSerializer):
+    item_parent_field = 'order'
+    items = OrderItemNestedSerializer(many=True, required=False)
     client_name = serializers.SerializerMethodField()
     user_name = serializers.SerializerMethodField()
-    items_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Order
         fields = '__all__'
+        read_only_fields = ('items_count', 'total_qty', 'total_amount')
 
     def get_client_name(self, obj):
         return obj.client.get_full_name()
 
-    def get_items_count(self, obj):
-        return obj.items.count()
-
     def get_user_name(self, obj):
         return obj.user.get_full_name()
 
@@ -225,6 +352,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = '__all__'
+        read_only_fields = ('reservation', 'reserved_qty')
 
     def get_product_name(self, obj):
         return obj.product.name
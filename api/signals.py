@@ -0,0 +1,68 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import matviews, refcache, reservations, totals
+from .models import IncomeItem, OutcomeItem, MovementItem, Order, OrderItem, Outcome, ReportItem
+
+
+# Строки документов не имеют своего `updated`, поэтому любое их изменение
+# «касается» шапки документа — на этом держатся ETag отчётов.
+# У заказов, приходов и расходов тем же UPDATE пересчитываются итоги шапки.
+ITEM_PARENTS = {
+    IncomeItem: 'income',
+    OutcomeItem: 'outcome',
+    MovementItem: 'movement',
+    OrderItem: 'order',
+    ReportItem: 'report',
+}
+
+
+@receiver([post_save, post_delete], sender=IncomeItem)
+@receiver([post_save, post_delete], sender=OutcomeItem)
+@receiver([post_save, post_delete], sender=MovementItem)
+@receiver([post_save, post_delete], sender=OrderItem)
+@receiver([post_save, post_delete], sender=ReportItem)
+def touch_document(sender, instance, **kwargs):
+    field = ITEM_PARENTS[sender]
+    parent_model = sender._meta.get_field(field).related_model
+    parent_id = getattr(instance, f'{field}_id')
+    if not parent_id:
+        return
+    if parent_model in totals.DOCUMENTS:
+        totals.recalculate(parent_model, [parent_id])
+    else:
+        parent_model.objects.filter(pk=parent_id).update(updated=timezone.now())
+
+
+# Удалённый расход не виден по updated — отчёты из materialized view уходят на живой запрос
+@receiver(post_delete, sender=Outcome)
+def mark_outcome_deleted(sender, instance, **kwargs):
+    matviews.mark_outcome_deleted()
+
+
+# Резерв товара под открытые заказы (api.reservations)
+@receiver(post_save, sender=Order)
+def sync_order_reservation(sender, instance, created, **kwargs):
+    if not created:
+        reservations.sync_orders([instance.pk])
+
+
+@receiver(post_save, sender=OrderItem)
+def sync_item_reservation(sender, instance, **kwargs):
+    reservations.sync_items([instance.pk])
+
+
+@receiver(post_delete, sender=OrderItem)
+def release_item_reservation(sender, instance, **kwargs):
+    reservations.release(instance)
+
+
+def invalidate_reference(sender, **kwargs):
+    refcache.invalidate(sender)
+
+
+# Справочники в памяти процессов (api.refcache) сбрасываются увеличением версии
+for _model in refcache.REGISTRY:
+    post_save.connect(invalidate_reference, sender=_model, dispatch_uid=f'refcache-save-{_model.__name__}')
+    post_delete.connect(invalidate_reference, sender=_model, dispatch_uid=f'refcache-delete-{_model.__name__}')
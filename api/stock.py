@@ -0,0 +1,459 @@
+import csv
+import io
+import os
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from api import refcache
+from api.models import Income, IncomeItem, Movement, MovementItem, Outcome, OutcomeItem, Product, ProductCategory, \
+    WarehouseProduct
+
+BATCH_SIZE = 2000
+CENT = Decimal('0.01')
+
+# Допустимые заголовки колонок файла остатков (без учёта регистра)
+COLUMNS = {
+    'code': ('code', 'код', 'item code', 'код модели'),
+    'name': ('name', 'название', 'наименование', 'item description'),
+    'count': ('count', 'qty', 'кол-во', 'количество', 'остаток'),
+    'price': ('price', 'цена'),
+}
+REQUIRED = ('code', 'count')
+
+
+class StockFileError(ValueError):
+    """Файл остатков не читается или в нём нет обязательных колонок."""
+
+
+def _header_map(header):
+    names = [str(value).strip().lower() if value is not None else '' for value in header]
+    found = {}
+    for key, aliases in COLUMNS.items():
+        for idx, name in enumerate(names):
+            if name in aliases:
+                found[key] = idx
+                break
+    missing = [key for key in REQUIRED if key not in found]
+    if missing:
+        raise StockFileError(f"В файле не найдены колонки: {', '.join(missing)}")
+    return found
+
+
+def _iter_rows(file, filename):
+    """Строки файла (xlsx — потоково, csv); первая строка — заголовок."""
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext == '.csv':
+        raw = file.read()
+        text = raw.decode('utf-8-sig') if isinstance(raw, bytes) else raw
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=',;\t')
+        yield from csv.reader(io.StringIO(text), dialect)
+        return
+    try:
+        wb = load_workbook(file, read_only=True, data_only=True)
+    except Exception as e:
+        raise StockFileError(f"Ошибка при чтении файла: {e}")
+    try:
+        yield from wb.active.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def read_stock_file(file, filename=None):
+    """
+    Читает файл остатков: колонки code и count обязательны, name и price — нет.
+
+    Возвращает ({code: {'name', 'count', 'price'}}, ошибки). Повтор кода в файле —
+    количества складываются (одна позиция разными партиями), цена берётся последняя.
+    """
+    rows = _iter_rows(file, filename or getattr(file, 'name', ''))
+    header = next(rows, None)
+    if header is None:
+        raise StockFileError("Файл пустой")
+    columns = _header_map(header)
+
+    def cell(row, key):
+        idx = columns.get(key)
+        return row[idx] if idx is not None and idx < len(row) else None
+
+    lines, errors, repeated = {}, [], 0
+    for line_no, row in enumerate(rows, start=2):
+        code = cell(row, 'code')
+        code = str(code).strip() if code is not None else ''
+        if code.endswith('.0') and code[:-2].isdigit():  # числовые коды из Excel
+            code = code[:-2]
+        if not code:
+            if any(value not in (None, '') for value in row):
+                errors.append(f"Строка {line_no}: нет кода")
+            continue
+        try:
+            count = int(Decimal(str(cell(row, 'count') or 0).replace(',', '.').strip() or 0))
+        except InvalidOperation:
+            errors.append(f"Строка {line_no}: некорректное количество '{cell(row, 'count')}'")
+            continue
+        price = cell(row, 'price')
+        try:
+            price = Decimal(str(price).replace(',', '.')).quantize(Decimal('0.01')) if price not in (None, '') else None
+        except InvalidOperation:
+            errors.append(f"Строка {line_no}: некорректная цена '{price}'")
+            price = None
+        name = cell(row, 'name')
+        if code in lines:
+            repeated += 1
+            lines[code]['count'] += count
+            if price is not None:
+                lines[code]['price'] = price
+        else:
+            lines[code] = {'name': str(name).strip() if name else code, 'count': count, 'price': price}
+    if repeated:
+        errors.append(f"Повторяющихся кодов: {repeated} (количества сложены)")
+    return lines, errors
+
+
+def load_stock(warehouse, lines, user=None, zero_missing=True, create_products=False, category_name=None,
+               dry_run=False):
+    """
+    Приводит остатки склада к файлу.
+
+    Одним запросом читаются все строки WarehouseProduct склада (под блокировкой),
+    затем в одной транзакции пачками: изменившиеся — upsert по id, новые — upsert
+    по (склад, товар), позиции склада, которых нет в файле, — обнуляются (zero_missing).
+    Повторный запуск с тем же файлом ничего не меняет.
+    Возвращает сводку сверки.
+    """
+    summary = {
+        'warehouse': warehouse.pk, 'lines': len(lines), 'created': 0, 'updated': 0, 'zeroed': 0,
+        'unchanged': 0, 'products_created': 0, 'unknown_codes': [],
+        'qty_before': 0, 'qty_after': 0, 'dry_run': dry_run,
+    }
+    now = timezone.now()
+    with transaction.atomic():
+        products = refcache.product_ids(lines)
+        prices, pending = {}, 0
+        unknown = [code for code in lines if code not in products]
+        if unknown and create_products:
+            category, _ = ProductCategory.objects.get_or_create(name=category_name or 'Без категории')
+            new_products = [
+                Product(code=code, name=lines[code]['name'][:255], category=category, status='active',
+                        price=lines[code]['price'] or 0, user=user)
+                for code in unknown
+            ]
+            if dry_run:
+                pending = len(new_products)  # в пробном прогоне товаров нет, но позиции будут созданы
+            else:
+                Product.objects.bulk_create(new_products, batch_size=BATCH_SIZE)
+                refcache.invalidate(Product)
+                products.update({p.code: p.pk for p in new_products})
+            summary['products_created'] = len(new_products)
+            unknown = []
+        summary['unknown_codes'] = unknown
+
+        wanted = {products[code]: line for code, line in lines.items() if code in products}
+
+        existing = WarehouseProduct.objects.select_for_update().filter(warehouse=warehouse).order_by('id')
+        to_update, seen = [], set()
+        for wp in existing:
+            summary['qty_before'] += wp.count
+            line = wanted.get(wp.product_id)
+            seen.add(wp.product_id)
+            if line is None:
+                if zero_missing and wp.count:
+                    wp.count, wp.updated = 0, now
+                    to_update.append(wp)
+                    summary['zeroed'] += 1
+                else:
+                    summary['unchanged'] += 1
+                    summary['qty_after'] += wp.count
+                continue
+            price = line['price'] if line['price'] is not None else wp.price
+            if wp.count != line['count'] or wp.price != price:
+                wp.count, wp.price, wp.updated = line['count'], price, now
+                to_update.append(wp)
+                summary['updated'] += 1
+            else:
+                summary['unchanged'] += 1
+            summary['qty_after'] += line['count']
+
+        if not dry_run:
+            missing_prices = [pid for pid, line in wanted.items() if pid not in seen and line['price'] is None]
+            prices = {pid: row.price for pid, row in refcache.PRODUCTS.get_many(missing_prices).items()}
+        to_create = [
+            WarehouseProduct(product_id=pid, warehouse=warehouse, count=line['count'], status='in_stock', user=user,
+                             price=line['price'] if line['price'] is not None else prices.get(pid, 0))
+            for pid, line in wanted.items() if pid not in seen
+        ]
+        summary['created'] = len(to_create) + pending
+        summary['qty_after'] += sum(wp.count for wp in to_create)
+        if dry_run:
+            return summary
+
+        # UPDATE через INSERT ... ON CONFLICT (id) DO UPDATE: bulk_update строит CASE WHEN
+        # на каждую строку и на десятках тысяч строк в разы медленнее
+        WarehouseProduct.objects.bulk_create(to_update, batch_size=BATCH_SIZE, update_conflicts=True,
+                                             unique_fields=['id'], update_fields=['count', 'price', 'updated'])
+        # позицию мог завести параллельный приход — файл задаёт остаток, поэтому перезаписываем
+        WarehouseProduct.objects.bulk_create(to_create, batch_size=BATCH_SIZE, update_conflicts=True,
+                                             unique_fields=['warehouse', 'product'],
+                                             update_fields=['count', 'price', 'updated'])
+    return summary
+
+
+# ------------- проводки документов -------------
+
+def lock_balances(keys):
+    """
+    {(склад, товар): WarehouseProduct} под select_for_update.
+
+    Строки блокируются в порядке id — один порядок для всех проводок, иначе
+    параллельные пачки документов могут взаимно ждать друг друга (deadlock).
+    """
+    by_warehouse = defaultdict(set)
+    for warehouse_id, product_id in keys:
+        by_warehouse[warehouse_id].add(product_id)
+    if not by_warehouse:
+        return {}
+    condition = Q()
+    for warehouse_id, product_ids in by_warehouse.items():
+        condition |= Q(warehouse_id=warehouse_id, product_id__in=product_ids)
+    rows = WarehouseProduct.objects.select_for_update().filter(condition).order_by('id')
+    return {(wp.warehouse_id, wp.product_id): wp for wp in rows}
+
+
+def ensure_balances(balances, new):
+    """
+    Дозаводит недостающие позиции: new — {(склад, товар): WarehouseProduct с count=0}.
+
+    INSERT ... ON CONFLICT (warehouse, product) DO NOTHING, затем блокировка вставленных
+    строк: если позицию тем временем создала параллельная проводка, берётся её строка.
+    Дополняет и возвращает balances.
+    """
+    new = [wp for key, wp in new.items() if key not in balances]
+    if new:
+        WarehouseProduct.objects.bulk_create(new, batch_size=BATCH_SIZE, ignore_conflicts=True)
+        balances.update(lock_balances({(wp.warehouse_id, wp.product_id) for wp in new}))
+    return balances
+
+
+def save_balances(balances):
+    """Изменённые остатки — одним upsert по id."""
+    now = timezone.now()
+    for wp in balances:
+        wp.updated = now
+    WarehouseProduct.objects.bulk_create(list(balances), batch_size=BATCH_SIZE, update_conflicts=True,
+                                         unique_fields=['id'],
+                                         update_fields=['count', 'in_transit', 'price', 'updated'])
+
+
+def blend_cost(wp, qty, amount):
+    """
+    Скользящая средневзвешенная цена остатка после поступления qty единиц на сумму amount.
+    Отрицательный остаток (списали раньше, чем оприходовали) в среднюю не входит.
+    """
+    if qty <= 0:
+        return
+    on_hand = max(wp.count, 0)
+    wp.price = ((Decimal(wp.price) * on_hand + amount) / (on_hand + qty)).quantize(CENT)
+
+
+def _document_lines(item_model, field, documents, cost_field=None):
+    """
+    {id документа: {товар: кол-во}} — строки всех документов одним запросом.
+    С cost_field — ещё {(id документа, товар): сумма count × cost_field} (строки без цены — None).
+    """
+    lines = defaultdict(lambda: defaultdict(int))
+    amounts = defaultdict(Decimal)
+    fields = (f'{field}_id', 'product_id', 'count') + ((cost_field,) if cost_field else ())
+    rows = item_model.objects.filter(**{f'{field}_id__in': [doc.pk for doc in documents]}).values_list(*fields)
+    for doc_id, product_id, count, *cost in rows:
+        lines[doc_id][product_id] += count
+        if cost_field:
+            key = (doc_id, product_id)
+            if cost[0] is None or amounts.get(key, 0) is None:
+                amounts[key] = None
+            else:
+                amounts[key] += count * cost[0]
+    return (lines, amounts) if cost_field else lines
+
+
+def _stamp_costs(item_model, field, documents, warehouse, balances):
+    """
+    Себестоимость строк проведённых документов = текущая средняя цена остатка на складе
+    warehouse(документ). Один bulk_update на пачку строк.
+    """
+    by_id = {doc.pk: doc for doc in documents}
+    rows = item_model.objects.filter(**{f'{field}_id__in': list(by_id)}).values_list('id', f'{field}_id', 'product_id')
+    item_model.objects.bulk_update(
+        [item_model(pk=pk, cost=balances[(warehouse(by_id[doc_id]), product_id)].price)
+         for pk, doc_id, product_id in rows],
+        ['cost'], batch_size=BATCH_SIZE)
+
+
+def _product_names(product_ids):
+    products = refcache.PRODUCTS.get_many(product_ids)
+    return ', '.join(products[pid].name if pid in products else str(pid) for pid in sorted(product_ids))
+
+
+def _shortage(balances, warehouse_id, wanted):
+    """Текст ошибки, если на складе нет позиции или не хватает количества, иначе None."""
+    missing = [pid for pid in wanted if (warehouse_id, pid) not in balances]
+    if missing:
+        return f"Товар не найден на складе: {_product_names(missing)}"
+    short = [pid for pid, count in wanted.items() if balances[(warehouse_id, pid)].count < count]
+    if short:
+        return f"Недостаточно товара на складе: {_product_names(short)}"
+    return None
+
+
+def post_incomes(incomes):
+    """
+    Приходует документы Income на склады: количества строк прибавляются к остаткам.
+
+    Строки всех документов читаются одним запросом, остатки — одним select_for_update,
+    записываются одним upsert. Цена остатка — скользящая средневзвешенная (blend_cost)
+    с ценами строк прихода. Проведённым ставится finished_at. Возвращает {id документа: ошибка} для непроведённых
+    (например, без склада). Вызывать внутри transaction.atomic().
+    """
+    errors = {income.pk: "Не указан склад" for income in incomes if not income.warehouse_id}
+    incomes = [income for income in incomes if income.pk not in errors]
+    lines, amounts = _document_lines(IncomeItem, 'income', incomes, cost_field='price')
+    balances = lock_balances({(income.warehouse_id, pid) for income in incomes for pid in lines[income.pk]})
+    ensure_balances(balances, {
+        (income.warehouse_id, pid): WarehouseProduct(warehouse_id=income.warehouse_id, product_id=pid, count=0,
+                                                     status='in_stock', user=income.user)
+        for income in incomes for pid in lines[income.pk]
+    })
+
+    changed = {}
+    for income in sorted(incomes, key=lambda doc: doc.pk):
+        for product_id, count in lines[income.pk].items():
+            wp = balances[(income.warehouse_id, product_id)]
+            blend_cost(wp, count, amounts[(income.pk, product_id)])
+            wp.count += count
+            changed[wp.pk] = wp
+    save_balances(changed.values())
+    Income.objects.filter(pk__in=[income.pk for income in incomes]).update(finished_at=timezone.now())
+    return errors
+
+
+def post_outcomes(outcomes):
+    """
+    Списывает документы Outcome со складов.
+
+    Документы проводятся по возрастанию id против заблокированных остатков: если
+    хоть одной позиции не хватает, документ целиком не проводится (ошибка в результате),
+    остальные — проводятся. Строкам проведённых ставится себестоимость (cost) — средняя
+    цена остатка, документам — finished_at. Возвращает {id документа: ошибка}.
+    Вызывать внутри transaction.atomic().
+    """
+    errors = {outcome.pk: "Не указан склад" for outcome in outcomes if not outcome.warehouse_id}
+    outcomes = [outcome for outcome in outcomes if outcome.pk not in errors]
+    lines = _document_lines(OutcomeItem, 'outcome', outcomes)
+    balances = lock_balances({(outcome.warehouse_id, pid) for outcome in outcomes for pid in lines[outcome.pk]})
+
+    changed, posted = {}, []
+    for outcome in sorted(outcomes, key=lambda doc: doc.pk):
+        wanted = lines[outcome.pk]
+        error = _shortage(balances, outcome.warehouse_id, wanted)
+        if error:
+            errors[outcome.pk] = error
+            continue
+        for product_id, count in wanted.items():
+            wp = balances[(outcome.warehouse_id, product_id)]
+            wp.count -= count
+            changed[wp.pk] = wp
+        posted.append(outcome)
+    save_balances(changed.values())
+    # списание среднюю цену не меняет — себестоимость строки равна цене остатка
+    _stamp_costs(OutcomeItem, 'outcome', posted, lambda outcome: outcome.warehouse_id, balances)
+    Outcome.objects.filter(pk__in=[outcome.pk for outcome in posted]).update(finished_at=timezone.now())
+    return errors
+
+
+def send_movements(movements):
+    """
+    Отправка перемещений: списание со склада-отправителя, количество «в пути»
+    (in_transit) — на позиции склада-получателя (создаётся, если её нет).
+
+    Остатки обоих складов блокируются одним select_for_update в порядке id
+    и записываются одним upsert. Перемещение, которому не хватает товара,
+    не проводится. Проведённым ставится sent_at, их строкам — себестоимость (cost)
+    по средней цене отправителя. Возвращает {id: ошибка}.
+    Вызывать внутри transaction.atomic().
+    """
+    # уже отправленные повторно не списываются (как receive_movements с received_at)
+    movements = [m for m in movements if not m.sent_at]
+    errors = {m.pk: "Склад отправителя и получателя совпадает"
+              for m in movements if m.warehouse_from_id == m.warehouse_to_id}
+    movements = [m for m in movements if m.pk not in errors]
+    lines = _document_lines(MovementItem, 'movement', movements)
+    keys = set()
+    for m in movements:
+        for product_id in lines[m.pk]:
+            keys.update({(m.warehouse_from_id, product_id), (m.warehouse_to_id, product_id)})
+    balances = lock_balances(keys)
+
+    changed, new, sent = {}, {}, []
+    for m in sorted(movements, key=lambda doc: doc.pk):
+        wanted = lines[m.pk]
+        error = _shortage(balances, m.warehouse_from_id, wanted)
+        if error:
+            errors[m.pk] = error
+            continue
+        for product_id, count in wanted.items():
+            source = balances[(m.warehouse_from_id, product_id)]
+            source.count -= count
+            changed[source.pk] = source
+            new.setdefault((m.warehouse_to_id, product_id), WarehouseProduct(
+                warehouse_id=m.warehouse_to_id, product_id=product_id, count=0, price=source.price,
+                status='in_stock', user=m.user))
+        sent.append(m)
+
+    # «в пути» не входит в count, поэтому получателей можно дозавести после всех списаний
+    ensure_balances(balances, new)
+    for m in sent:
+        for product_id, count in lines[m.pk].items():
+            target = balances[(m.warehouse_to_id, product_id)]
+            target.in_transit += count
+            changed[target.pk] = target
+    save_balances(changed.values())
+    _stamp_costs(MovementItem, 'movement', sent, lambda m: m.warehouse_from_id, balances)
+    Movement.objects.filter(pk__in=[m.pk for m in sent]).update(sent_at=timezone.now())
+    return errors
+
+
+def receive_movements(movements):
+    """
+    Получение перемещений: количество «в пути» переходит в остаток склада-получателя.
+
+    Проводятся только перемещения, отправка которых была проведена (sent_at) —
+    у отправленных до появления проводок остатки правились вручную. Себестоимость строк
+    (cost отправителя) входит в среднюю цену получателя. Полученным ставится received_at. Возвращает {id: ошибка}.
+    Вызывать внутри transaction.atomic().
+    """
+    movements = [m for m in movements if m.sent_at and not m.received_at]
+    lines, amounts = _document_lines(MovementItem, 'movement', movements, cost_field='cost')
+    balances = lock_balances({(m.warehouse_to_id, pid) for m in movements for pid in lines[m.pk]})
+    # позицию могли удалить, пока товар был в пути — заводим заново
+    ensure_balances(balances, {
+        (m.warehouse_to_id, pid): WarehouseProduct(warehouse_id=m.warehouse_to_id, product_id=pid, count=0,
+                                                   status='in_stock', user=m.user)
+        for m in movements for pid in lines[m.pk]
+    })
+
+    changed = {}
+    for m in sorted(movements, key=lambda doc: doc.pk):
+        for product_id, count in lines[m.pk].items():
+            target = balances[(m.warehouse_to_id, product_id)]
+            target.in_transit = max(0, target.in_transit - count)
+            # без себестоимости (отправлено до её учёта) — по цене получателя, средняя не меняется
+            amount = amounts[(m.pk, product_id)]
+            blend_cost(target, count, Decimal(target.price) * count if amount is None else amount)
+            target.count += count
+            changed[target.pk] = target
+    save_balances(changed.values())
+    Movement.objects.filter(pk__in=[m.pk for m in movements]).update(received_at=timezone.now())
+    return {}
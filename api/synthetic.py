@@ -0,0 +1,445 @@
+import io
+import random
+from bisect import bisect
+from contextlib import contextmanager
+from datetime import date, datetime, time as dtime, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api import totals
+from api.models import Product, ProductCategory, Warehouse, WarehouseProduct, Order, OrderItem, Outcome, \
+    OutcomeItem, Income, IncomeItem, Report, ReportItem
+from user.models import User
+
+# Масштабы набора данных: число строк OutcomeItem
+SCALES = {
+    '10k': 10_000,
+    '1m': 1_000_000,
+    '10m': 10_000_000,
+}
+
+# Все пользователи набора имеют такой префикс телефона; через них (CASCADE) набор и удаляется
+PHONE_PREFIX = 'bench-'
+OWNER_PHONE = f'{PHONE_PREFIX}owner'
+
+HISTORY_DAYS = 730
+
+# Сезонность по месяцам (пик — лето, сезон кондиционеров) и по дням недели (пн..вс)
+SEASONALITY = (0.75, 0.8, 0.95, 1.05, 1.2, 1.4, 1.5, 1.4, 1.1, 0.95, 0.9, 1.1)
+WEEKDAYS = (1.0, 1.05, 1.05, 1.0, 1.1, 0.7, 0.3)
+YEARLY_GROWTH = 0.15
+
+# Перекос спроса: вес k-го по популярности дилера / товара ~ 1 / k^s
+DEALER_SKEW = 1.0
+PRODUCT_SKEW = 1.07
+
+ORDER_STATUSES = (
+    (Order.Status.pending, Order.Status.collected, Order.Status.delivering, Order.Status.delivered,
+     Order.Status.sent, Order.Status.cancelled),
+    (10, 10, 15, 40, 15, 10),
+)
+# Доля заказов каждого статуса, по которым была отгрузка (Outcome)
+REALIZED_SHARE = {
+    Order.Status.collected: 0.3,
+    Order.Status.delivering: 0.8,
+    Order.Status.delivered: 1.0,
+    Order.Status.sent: 1.0,
+}
+
+
+def dataset_exists():
+    return User.objects.filter(phone_number=OWNER_PHONE).exists()
+
+
+def clear_dataset():
+    """Удалить синтетический набор (все документы и справочники его пользователей)."""
+    User.objects.filter(phone_number__startswith=PHONE_PREFIX).delete()
+
+
+def dimensions(items):
+    """Размеры справочников для заданного числа OutcomeItem — растут вместе с объёмом."""
+    return {
+        'dealers': min(500, max(5, items // 20_000)),
+        'warehouses': min(12, 3 + items // 1_000_000),
+        'categories': 12,
+        'products': min(5000, max(80, items // 2_000)),
+    }
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """
+    bulk_create затирает created/updated текущим временем (auto_now, auto_now_add).
+    На время генерации отключаем их, чтобы документы легли на нужные даты.
+    """
+    saved = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                saved.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+# ------------- распределения -------------
+
+class Sampler:
+    """Выбор из population по весам за O(log n): накопленные веса + bisect."""
+
+    def __init__(self, rng, population, weights):
+        self.rng = rng
+        self.population = list(population)
+        self.cum_weights = list(accumulate(weights))
+        self.total = self.cum_weights[-1]
+
+    def pick(self):
+        return self.population[bisect(self.cum_weights, self.rng.random() * self.total)]
+
+    def pick_distinct(self, k):
+        """k разных элементов (популярные выпадают чаще); меньше k, если выборка слишком перекошена."""
+        picked = {}
+        for _ in range(k * 4):
+            item = self.pick()
+            picked[id(item)] = item
+            if len(picked) == k:
+                break
+        return list(picked.values())
+
+
+def zipf_sampler(rng, population, skew):
+    """Популярность по закону Ципфа; ранги перемешаны, чтобы не зависеть от порядка id."""
+    population = list(population)
+    rng.shuffle(population)
+    return Sampler(rng, population, [1 / (rank ** skew) for rank in range(1, len(population) + 1)])
+
+
+def day_sampler(rng, date_from, date_to):
+    """Дни периода с весами: сезонность месяца, день недели и рост год к году."""
+    days, weights = [], []
+    span = max(1, (date_to - date_from).days)
+    for offset in range(span + 1):
+        day = date_from + timedelta(days=offset)
+        days.append(day)
+        weights.append(SEASONALITY[day.month - 1] * WEEKDAYS[day.weekday()] *
+                       (1 + YEARLY_GROWTH * offset / 365))
+    return Sampler(rng, days, weights)
+
+
+# ------------- запись строк -------------
+
+class BulkCreateSink:
+    """Запись пачками через bulk_create (любая БД)."""
+
+    def insert(self, model, rows):
+        """rows — список dict {attname: значение}; возвращает pk в том же порядке."""
+        stamps = _timestamp_defaults(model)
+        with explicit_timestamps(model):
+            objs = model.objects.bulk_create([model(**{**stamps, **row}) for row in rows])
+        return [obj.pk for obj in objs]
+
+
+class CopySink:
+    """
+    Запись через COPY FROM STDIN (PostgreSQL) — на порядок быстрее INSERT.
+
+    id резервируются заранее одним сдвигом последовательности таблицы,
+    чтобы строки документов можно было сразу связать с шапками.
+    """
+
+    def insert(self, model, rows):
+        table, pk_column = model._meta.db_table, model._meta.pk.column
+        fields = [f for f in model._meta.concrete_fields if not f.primary_key]
+        # COPY не знает о default полей модели — недостающие значения подставляем сами
+        defaults = {f.attname: f.get_default() for f in fields}
+        defaults.update(_timestamp_defaults(model))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT setval(pg_get_serial_sequence(%s, %s), nextval(pg_get_serial_sequence(%s, %s)) + %s)',
+                [table, pk_column, table, pk_column, len(rows) - 1],
+            )
+            last_id = cursor.fetchone()[0]
+            ids = range(last_id - len(rows) + 1, last_id + 1)
+            buffer = io.StringIO()
+            for pk, row in zip(ids, rows):
+                values = [_copy_value(row[f.attname] if f.attname in row else defaults[f.attname]) for f in fields]
+                buffer.write('\t'.join([str(pk)] + values))
+                buffer.write('\n')
+            buffer.seek(0)
+            sql = 'COPY %s (%s) FROM STDIN' % (
+                connection.ops.quote_name(table),
+                ', '.join(connection.ops.quote_name(f.column) for f in [model._meta.pk] + fields),
+            )
+            raw = cursor.cursor
+            if hasattr(raw, 'copy_expert'):  # psycopg2
+                raw.copy_expert(sql, buffer)
+            else:  # psycopg 3
+                with raw.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+        return list(ids)
+
+
+def _timestamp_defaults(model):
+    now = timezone.now()
+    return {f.attname: now for f in model._meta.concrete_fields
+            if getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)}
+
+
+def _copy_value(value):
+    if value is None:
+        return r'\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def make_sink(use_copy=True):
+    if use_copy and connection.vendor == 'postgresql':
+        return CopySink()
+    return BulkCreateSink()
+
+
+class DocumentWriter:
+    """
+    Потоковая запись документов (шапка + строки): копит пачку и сбрасывает её,
+    когда набирается batch_size строк. В памяти только текущая пачка.
+    Итоги шапки (items_count, total_qty, total_amount) считаются по строкам здесь же:
+    сигналы строк при массовой вставке не срабатывают.
+    """
+
+    def __init__(self, sink, model, item_model, parent_field, batch_size=5000):
+        self.sink = sink
+        self.model = model
+        self.item_model = item_model
+        self.parent_attname = f'{parent_field}_id'
+        self.batch_size = batch_size
+        self.headers, self.items, self.pending = [], [], 0
+        self.documents = self.lines = 0
+
+    def add(self, header, items):
+        if self.model in totals.DOCUMENTS:
+            header.update(items_count=len(items), total_qty=sum(item['count'] for item in items),
+                          total_amount=sum((item['count'] * item['price'] for item in items), Decimal(0)))
+        self.headers.append(header)
+        self.items.append(items)
+        self.lines += len(items)
+        self.pending += len(items)
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.headers:
+            return
+        ids = self.sink.insert(self.model, self.headers)
+        rows = []
+        for pk, items in zip(ids, self.items):
+            for item in items:
+                item[self.parent_attname] = pk
+                rows.append(item)
+        if rows:
+            self.sink.insert(self.item_model, rows)
+        self.documents += len(self.headers)
+        self.headers, self.items, self.pending = [], [], 0
+
+
+# ------------- генератор -------------
+
+class SalesGenerator:
+    """
+    Продажи для отчётов: планы, заказы, отгрузки по заказам, приходы, остатки.
+
+    Даты — с сезонностью и ростом, дилеры и товары — с перекосом популярности
+    (немногие дилеры и товары дают основную часть оборота). Детерминирован по rng.
+    """
+
+    def __init__(self, rng, owner, clients, products, warehouses, date_from, date_to,
+                 sink=None, batch_size=5000, log=None):
+        self.rng = rng
+        self.owner = owner
+        self.products = products
+        self.warehouses = warehouses
+        self.date_from, self.date_to = date_from, date_to
+        self.sink = sink or make_sink()
+        self.batch_size = batch_size
+        self.log = log or (lambda msg: None)
+        self.dealers = zipf_sampler(rng, clients, DEALER_SKEW)
+        self.popular = zipf_sampler(rng, products, PRODUCT_SKEW)
+        self.days = day_sampler(rng, date_from, date_to)
+
+    def moment(self, day=None):
+        day = day or self.days.pick()
+        moment = datetime.combine(day, dtime(hour=self.rng.randint(8, 19), minute=self.rng.randint(0, 59)))
+        return timezone.make_aware(moment)
+
+    def _lines(self, max_lines=7):
+        """Позиции документа: (товар, кол-во); частые товары попадают в документы чаще."""
+        rng = self.rng
+        return [(product, min(200, 1 + int(rng.expovariate(1 / 10))))
+                for product in self.popular.pick_distinct(rng.randint(1, max_lines))]
+
+    def seed_stock(self, factor=1):
+        """Стартовые остатки: на первом (центральном) складе втрое больше."""
+        rng, rows = self.rng, []
+        for warehouse in self.warehouses:
+            multiplier = 3 if warehouse is self.warehouses[0] else 1
+            for product in rng.sample(self.products, k=max(1, len(self.products) * 2 // 3)):
+                rows.append({'product_id': product.pk, 'warehouse_id': warehouse.pk,
+                             'count': rng.randint(5, 40) * multiplier * factor, 'price': product.price,
+                             'status': 'in_stock', 'user_id': self.owner.pk})
+        for start in range(0, len(rows), self.batch_size):
+            self.sink.insert(WarehouseProduct, rows[start:start + self.batch_size])
+        self.log(f'остатки: {len(rows)} строк')
+
+    def seed_plans(self, months):
+        """Подтверждённый план (Report) на каждого дилера и месяц, 10–20 SKU."""
+        rng = self.rng
+        writer = DocumentWriter(self.sink, Report, ReportItem, 'report', self.batch_size)
+        for year, month in months:
+            for client in self.dealers.population:
+                created = self.moment(date(year, month, 1))
+                header = {'client_id': client.pk, 'comment': f'План на {year}-{month:02d}',
+                          'status': Report.Status.confirmed, 'period': month, 'created': created}
+                items = [{'product_id': product.pk, 'count': rng.randint(5, 60)}
+                         for product in self.popular.pick_distinct(rng.randint(10, 20))]
+                writer.add(header, items)
+        writer.flush()
+        self.log(f'планы: {writer.documents} отчётов, {writer.lines} строк')
+
+    def seed_orders_and_outcomes(self, orders=None, outcome_items=None):
+        """
+        Заказы и отгрузки по ним (Outcome finished, кол-во 80–120% от заказанного).
+        Останавливается, когда набрано orders заказов или outcome_items строк отгрузок.
+        """
+        rng, owner = self.rng, self.owner
+        order_writer = DocumentWriter(self.sink, Order, OrderItem, 'order', self.batch_size)
+        outcome_writer = DocumentWriter(self.sink, Outcome, OutcomeItem, 'outcome', self.batch_size)
+        while not self._done(order_writer, outcome_writer, orders, outcome_items):
+            client = self.dealers.pick()
+            created = self.moment()
+            status = rng.choices(*ORDER_STATUSES)[0]
+            warehouse = rng.choice(self.warehouses)
+            lines = self._lines()
+            order_writer.add(
+                {'client_id': client.pk, 'user_id': owner.pk, 'comment': 'DEMO Order', 'status': status,
+                 'warehouse_id': warehouse.pk, 'created': created, 'updated': created},
+                [{'product_id': product.pk, 'count': qty, 'price': product.price,
+                  'status': OrderItem.Status.ready} for product, qty in lines],
+            )
+            if rng.random() >= REALIZED_SHARE.get(status, 0):
+                continue
+            shipped = created + timedelta(hours=rng.randint(1, 72))
+            if timezone.localdate(shipped) > self.date_to:
+                shipped = created
+            out_lines = [(product, max(1, int(qty * rng.uniform(0.8, 1.2)))) for product, qty in lines]
+            outcome_writer.add(
+                {'client_id': client.pk, 'user_id': owner.pk, 'comment': 'DEMO Outcome',
+                 'status': Outcome.Status.finished, 'warehouse_id': warehouse.pk,
+                 'created': shipped, 'updated': shipped},
+                [{'product_id': product.pk, 'count': qty, 'price': product.price, 'status': 'ok',
+                  'user_id': owner.pk} for product, qty in out_lines],
+            )
+        order_writer.flush()
+        outcome_writer.flush()
+        self.log(f'заказы: {order_writer.documents} документов, {order_writer.lines} строк; '
+                 f'отгрузки: {outcome_writer.documents} документов, {outcome_writer.lines} строк')
+
+    @staticmethod
+    def _done(order_writer, outcome_writer, orders, outcome_items):
+        placed = order_writer.documents + len(order_writer.headers)
+        if orders is not None and placed >= orders:
+            return True
+        return outcome_items is not None and outcome_writer.lines >= outcome_items
+
+    def seed_incomes(self, count, date_from=None):
+        """Приходы на склады; часть ещё pending/active — «ожидаемые поставки» для дефицитов."""
+        rng, owner = self.rng, self.owner
+        days = day_sampler(rng, date_from or self.date_from, self.date_to)
+        writer = DocumentWriter(self.sink, Income, IncomeItem, 'income', self.batch_size)
+        for _ in range(count):
+            created = self.moment(days.pick())
+            lines = [(product, rng.randint(5, 80)) for product in self.popular.pick_distinct(rng.randint(1, 5))]
+            writer.add(
+                {'client_id': owner.pk, 'user_id': owner.pk, 'comment': 'DEMO Income',
+                 'status': rng.choice([Income.Status.pending, Income.Status.active, Income.Status.finished]),
+                 'warehouse_id': rng.choice(self.warehouses).pk,
+                 'created': created, 'updated': created},
+                [{'product_id': product.pk, 'count': qty, 'price': product.price, 'status': 'ok',
+                  'user_id': owner.pk} for product, qty in lines],
+            )
+        writer.flush()
+        self.log(f'приходы: {writer.documents} документов, {writer.lines} строк')
+
+
+def month_range(months_back, today=None):
+    """Список (year, month) от (сегодня - months_back+1) до текущего месяца включительно."""
+    today = (today or timezone.localdate()).replace(day=1)
+    out = []
+    for i in range(months_back):
+        m = today.month - (months_back - 1 - i)
+        y = today.year
+        while m <= 0:
+            m += 12
+            y -= 1
+        out.append((y, m))
+    return out
+
+
+class DatasetBuilder:
+    """
+    Детерминированный синтетический набор для нагрузочных замеров отчётов.
+
+    Одинаковые seed, масштаб и anchor дают одинаковые данные (кроме id).
+    """
+
+    def __init__(self, items, seed=42, anchor=None, batch_size=5000, use_copy=True, log=None):
+        self.items = items
+        self.rng = random.Random(seed)
+        self.anchor = anchor or timezone.localdate()
+        self.batch_size = batch_size
+        self.use_copy = use_copy
+        self.log = log or (lambda msg: None)
+        self.dims = dimensions(items)
+
+    def build(self):
+        with transaction.atomic():
+            owner = User.objects.create(phone_number=OWNER_PHONE, first_name='Bench', last_name='Owner',
+                                        role=User.Role.admin, status=User.Status.active)
+            dealers, warehouses, products = self._seed_references(owner)
+            generator = SalesGenerator(self.rng, owner, dealers, products, warehouses,
+                                       self.anchor - timedelta(days=HISTORY_DAYS - 1), self.anchor,
+                                       sink=make_sink(self.use_copy), batch_size=self.batch_size, log=self.log)
+            generator.seed_stock()
+            generator.seed_plans(month_range(12, self.anchor))
+            generator.seed_orders_and_outcomes(outcome_items=self.items)
+            generator.seed_incomes(max(25, self.items // 80))
+
+    def _seed_references(self, owner):
+        rng, dims = self.rng, self.dims
+        dealers = User.objects.bulk_create([
+            User(phone_number=f'{PHONE_PREFIX}dealer-{i:04d}', first_name=f'Дилер {i}', last_name='Bench',
+                 role=User.Role.dealer, status=User.Status.active)
+            for i in range(dims['dealers'])
+        ])
+        warehouses = Warehouse.objects.bulk_create([
+            Warehouse(name=f'Bench склад {i}', user=owner, responsible=owner) for i in range(dims['warehouses'])
+        ])
+        categories = ProductCategory.objects.bulk_create([
+            ProductCategory(name=f'Bench категория {i}', status='active', user=owner)
+            for i in range(dims['categories'])
+        ])
+        products = Product.objects.bulk_create([
+            Product(category=rng.choice(categories), code=f'BENCH-{i:05d}', name=f'Bench товар {i}',
+                    unit_type=Product.UnitType.pcs, price=Decimal(rng.randint(100, 5000)), status='active',
+                    user=owner)
+            for i in range(dims['products'])
+        ], batch_size=self.batch_size)
+        self.log(f'справочники: {len(dealers)} дилеров, {len(warehouses)} складов, {len(products)} товаров')
+        return dealers, warehouses, products
@@ -1,3 +1,71 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase
+
+from .allocation import _allocate_order, _pick
+from .replenishment import fair_share
+from .valuation import FifoCost
+
+
+class FifoCostTests(SimpleTestCase):
+    def test_issue_past_stock_then_receipt_covers_shortfall(self):
+        fifo = FifoCost()
+        fifo.receive(5, Decimal('10'))
+
+        # 3 шт. сверх остатка оцениваются по цене последней партии
+        cost, short = fifo.issue(8)
+        self.assertEqual((cost, short), (Decimal('80'), 3))
+        self.assertEqual(fifo.qty, -3)
+        self.assertEqual(fifo.value, 0)
+
+        # поступление сначала гасит минус, в партию уходит только остаток
+        fifo.receive(4, Decimal('12'))
+        self.assertEqual(fifo.qty, 1)
+        self.assertEqual([list(layer) for layer in fifo.layers], [[1, Decimal('12')]])
+        self.assertEqual(fifo.value, Decimal('12'))
+
+        self.assertEqual(fifo.issue(1), (Decimal('12'), 0))
+        self.assertFalse(fifo.layers)
+
+    def test_receipt_smaller_than_shortfall_adds_no_layer(self):
+        fifo = FifoCost()
+        fifo.issue(5)
+        fifo.receive(2, Decimal('7'))
+        self.assertEqual(fifo.qty, -3)
+        self.assertFalse(fifo.layers)
+        self.assertEqual(fifo.last_unit, Decimal('7'))
+
+
+class FairShareTests(SimpleTestCase):
+    def test_scarce_stock_remainder_goes_to_largest_fraction(self):
+        need = np.array([[5, 1], [3, 1], [2, 1]], dtype=np.int64)
+        free = np.array([7, 10], dtype=np.int64)
+        alloc, scarce = fair_share(need, free)
+        # 7 * (5, 3, 2) / 10 = 3.5, 2.1, 1.4 -> 3, 2, 1 и одна штука строке с дробью .5
+        self.assertEqual(alloc.tolist(), [[4, 1], [2, 1], [1, 1]])
+        self.assertEqual(scarce.tolist(), [True, False])
+        self.assertEqual(alloc[:, 0].sum(), free[0])
+
+    def test_equal_fractions_break_ties_by_row_order(self):
+        need = np.array([[1], [1], [1]], dtype=np.int64)
+        alloc, _ = fair_share(need, np.array([2], dtype=np.int64))
+        self.assertEqual(alloc[:, 0].tolist(), [1, 1, 0])
+
+
+class AllocationTests(SimpleTestCase):
+    def test_tie_goes_to_lower_priority_then_lower_id(self):
+        stock = {1: {10: 5}, 2: {10: 5}, 3: {10: 5}}
+        self.assertEqual(_pick({10: 3}, stock, {1: 5, 2: 1, 3: 1}), 2)
+        self.assertEqual(_pick({10: 3}, stock, {}), 1)
+
+    def test_full_lines_beat_priority(self):
+        stock = {1: {10: 2}, 2: {10: 1, 20: 1}}
+        self.assertEqual(_pick({10: 2, 20: 2}, stock, {2: -1}), 1)
+
+    def test_allocate_order_splits_and_reports_shortage(self):
+        stock = {1: {10: 2}, 2: {10: 1, 20: 1}}
+        shipments, short = _allocate_order({10: 2, 20: 2}, stock, {})
+        self.assertEqual(shipments, {1: {10: 2}, 2: {20: 1}})
+        self.assertEqual(short, {20: 1})
+        self.assertEqual(stock, {1: {10: 0}, 2: {10: 1, 20: 0}})
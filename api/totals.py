@@ -0,0 +1,80 @@
+from decimal import Decimal
+
+from django.db.models import (Case, Count, DecimalField, Exists, ExpressionWrapper, F, IntegerField, OuterRef, Q,
+                              Subquery, Sum, Value, When)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Income, IncomeItem, Order, OrderItem, Outcome, OutcomeItem
+
+# Документ -> (модель строк, FK строки на документ)
+DOCUMENTS = {
+    Order: (OrderItem, 'order'),
+    Income: (IncomeItem, 'income'),
+    Outcome: (OutcomeItem, 'outcome'),
+}
+TOTAL_FIELDS = ('items_count', 'total_qty', 'total_amount')
+BATCH_SIZE = 5000
+
+
+def _item_totals(item_model, field):
+    """Подзапрос по строкам документа: количество строк, сумма count и сумма count × price."""
+    amount = ExpressionWrapper(F('count') * F('price'), output_field=DecimalField(max_digits=20, decimal_places=2))
+    items = item_model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field)
+
+    def total(aggregate, zero, output_field):
+        return Coalesce(Subquery(items.annotate(value=aggregate).values('value'), output_field=output_field),
+                        zero, output_field=output_field)
+
+    return {
+        'items_count': total(Count('id'), Value(0), IntegerField()),
+        'total_qty': total(Sum('count'), Value(0), IntegerField()),
+        'total_amount': total(Sum(amount), Value(Decimal('0.00')), DecimalField(max_digits=15, decimal_places=2)),
+    }
+
+
+def recalculate(model, ids=None, touch=True, keep_empty_amount=False):
+    """
+    Пересчитывает items_count, total_qty и total_amount шапок одним UPDATE с подзапросами.
+
+    ids=None — все документы (пачками по id). Нужен после массовых операций со строками
+    (bulk_create, update, COPY): сигналы строк при них не срабатывают.
+    keep_empty_amount — у документов без строк не трогать введённую вручную сумму.
+    """
+    item_model, field = DOCUMENTS[model]
+    values = _item_totals(item_model, field)
+    if keep_empty_amount:
+        has_items = Exists(item_model.objects.filter(**{field: OuterRef('pk')}))
+        values['total_amount'] = Case(When(has_items, then=values['total_amount']), default=F('total_amount'))
+    if touch:
+        values['updated'] = timezone.now()
+    if ids is not None:
+        ids = list(ids)
+        return model.objects.filter(pk__in=ids).update(**values) if ids else 0
+    updated, last_id = 0, 0
+    while True:
+        batch = list(model.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE])
+        if not batch:
+            return updated
+        updated += model.objects.filter(pk__in=batch).update(**values)
+        last_id = batch[-1]
+
+
+def mismatches(model):
+    """
+    Документы, у которых шапка расходится со строками: (id, записано, по строкам).
+
+    Документ без строк сохраняет введённую вручную сумму (импорт шапок из Excel),
+    поэтому у него сверяются только items_count и total_qty.
+    """
+    item_model, field = DOCUMENTS[model]
+    expected = {f'expected_{name}': expr for name, expr in _item_totals(item_model, field).items()}
+    diff = (
+        ~Q(items_count=F('expected_items_count'))
+        | ~Q(total_qty=F('expected_total_qty'))
+        | (~Q(total_amount=F('expected_total_amount')) & Q(expected_items_count__gt=0))
+    )
+    rows = (model.objects.annotate(**expected).filter(diff).order_by('pk')
+            .values_list('pk', *TOTAL_FIELDS, *expected).iterator(chunk_size=BATCH_SIZE))
+    for pk, *values in rows:
+        yield pk, dict(zip(TOTAL_FIELDS, values[:3])), dict(zip(TOTAL_FIELDS, values[3:]))
@@ -0,0 +1,93 @@
+from django.db import transaction
+from django.utils import timezone
+
+from . import reservations, stock
+from .models import Income, Movement, Order, Outcome
+
+# Разрешённые переходы статусов: {модель: {из статуса: {в статусы}}}
+TRANSITIONS = {
+    Order: {
+        Order.Status.pending: {Order.Status.collected, Order.Status.cancelled},
+        Order.Status.collected: {Order.Status.pending, Order.Status.sent, Order.Status.delivering,
+                                 Order.Status.cancelled},
+        Order.Status.sent: {Order.Status.delivering, Order.Status.delivered, Order.Status.cancelled},
+        Order.Status.delivering: {Order.Status.delivered, Order.Status.cancelled},
+    },
+    Outcome: {
+        Outcome.Status.pending: {Outcome.Status.active, Outcome.Status.finished, Outcome.Status.cancelled},
+        Outcome.Status.active: {Outcome.Status.finished, Outcome.Status.cancelled},
+    },
+    Income: {
+        Income.Status.pending: {Income.Status.active, Income.Status.finished, Income.Status.cancelled},
+        Income.Status.active: {Income.Status.finished, Income.Status.cancelled},
+    },
+    Movement: {
+        Movement.Status.pending: {Movement.Status.collected, Movement.Status.cancelled},
+        Movement.Status.collected: {Movement.Status.sent, Movement.Status.cancelled},
+        Movement.Status.sent: {Movement.Status.received},
+        Movement.Status.received: {Movement.Status.finished},
+        Movement.Status.cancelled: {Movement.Status.confirmed_cancel},
+    },
+}
+
+# Проводки по складу при входе в статус: функция получает документы и возвращает {id: ошибка}
+POSTINGS = {
+    (Income, Income.Status.finished): stock.post_incomes,
+    (Outcome, Outcome.Status.finished): stock.post_outcomes,
+    (Movement, Movement.Status.sent): stock.send_movements,
+    (Movement, Movement.Status.received): stock.receive_movements,
+}
+
+# Пересчёт после смены статуса: функция получает id переведённых документов
+AFTER_UPDATE = {
+    Order: reservations.sync_orders,
+}
+
+MAX_IDS = 500
+
+
+def allowed(model, current, target):
+    return target in TRANSITIONS[model].get(current, ())
+
+
+def apply(model, ids, target):
+    """
+    Переводит документы в статус target пачкой.
+
+    Документы блокируются (select_for_update, по возрастанию id), переходы проверяются
+    за один проход, проводки по складу делаются сразу для всех подходящих документов,
+    статус меняется одним UPDATE. Документ с ошибкой не мешает остальным.
+    Возвращает результаты в порядке ids: {id, ok, from, to} или {id, ok: False, error}.
+    """
+    ids = list(dict.fromkeys(ids))
+    results = {}
+    with transaction.atomic():
+        documents = list(model.objects.select_for_update().filter(pk__in=ids).order_by('id'))
+        found = {doc.pk for doc in documents}
+        for pk in ids:
+            if pk not in found:
+                results[pk] = {'id': pk, 'ok': False, 'error': "Документ не найден"}
+
+        movable = []
+        for doc in documents:
+            if doc.status == target:
+                results[doc.pk] = {'id': doc.pk, 'ok': False, 'from': doc.status, 'error': "Документ уже в этом статусе"}
+            elif not allowed(model, doc.status, target):
+                results[doc.pk] = {'id': doc.pk, 'ok': False, 'from': doc.status,
+                                   'error': f"Переход {doc.status} → {target} не разрешён"}
+            else:
+                movable.append(doc)
+
+        posting = POSTINGS.get((model, target))
+        errors = posting(movable) if posting and movable else {}
+        done = [doc for doc in movable if doc.pk not in errors]
+        for doc in movable:
+            if doc.pk in errors:
+                results[doc.pk] = {'id': doc.pk, 'ok': False, 'from': doc.status, 'error': errors[doc.pk]}
+            else:
+                results[doc.pk] = {'id': doc.pk, 'ok': True, 'from': doc.status, 'to': target}
+        if done:
+            model.objects.filter(pk__in=[doc.pk for doc in done]).update(status=target, updated=timezone.now())
+            if model in AFTER_UPDATE:
+                AFTER_UPDATE[model]([doc.pk for doc in done])
+    return [results[pk] for pk in ids]
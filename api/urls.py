@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework import routers
 from api.views import StatusViewSet, UnitTypeViewSet, ProductCategoryViewSet, ProductViewSet, WarehouseViewSet, \
@@ -6,7 +7,9 @@ from api.views import StatusViewSet, UnitTypeViewSet, ProductCategoryViewSet, Pr
     LeastPopularProductsView, DealersSalesView, DealersCompareView, DealerAvgCheckView, OrdersAndReturnsView, \
     SalesGeographyView, TopCategoriesView, AssortmentStructureView, CentralStockView, StocksByWarehouseDealerView, \
     ForecastShortagesView, PlanVsActualView, PlanAchievementView, OrdersCountView, AverageOrderAmountView, \
-    MostOrderedProductsView, OrderImportView, IncomeImportView, BannerViewSet, CatalogViewSet
+    MostOrderedProductsView, OrderImportView, IncomeImportView, BannerViewSet, CatalogViewSet, \
+    SalesVolumeCompareAsyncView, SalesGeographyAsyncView, CentralStockAsyncView, ForecastShortagesAsyncView, \
+    EndpointTimingView, StockAvailabilityView, StockValuationView, CostOfGoodsSoldView
 
 router = routers.SimpleRouter()
 router.register(r'statuses', StatusViewSet)
@@ -26,10 +29,13 @@ router.register(r'order-items', OrderItemViewSet)
 router.register(r'banners', BannerViewSet)
 router.register(r'catalogs', CatalogViewSet)
 
+# Под ASGI (ASYNC_REPORTS) отчёты с независимыми запросами обслуживают async-версии
+_async = settings.ASYNC_REPORTS
 
 urlpatterns = [
     path("reports/sales-volume/", SalesVolumeView.as_view(), name="report-sales-volume"),
-    path("reports/sales-volume/compare/", SalesVolumeCompareView.as_view(),
+    path("reports/sales-volume/compare/",
+         (SalesVolumeCompareAsyncView if _async else SalesVolumeCompareView).as_view(),
          name="report-sales-volume-compare"),
     path("reports/top-products/", TopProductsView.as_view(), name="report-top-products"),
     path("reports/least-popular-products/", LeastPopularProductsView.as_view(),
@@ -38,16 +44,17 @@ urlpatterns = [
     path("reports/dealers-compare/", DealersCompareView.as_view(), name="report-dealers-compare"),
     path("reports/dealer-avg-check/", DealerAvgCheckView.as_view(), name="report-dealer-avg-check"),
     path("reports/orders-and-returns/", OrdersAndReturnsView.as_view(), name="report-orders-and-returns"),
-    path("reports/sales-geography/", SalesGeographyView.as_view(),
+    path("reports/sales-geography/", (SalesGeographyAsyncView if _async else SalesGeographyView).as_view(),
          name="report-sales-geography"),
     path("reports/top-categories/", TopCategoriesView.as_view(),
          name="report-top-categories"),
     path("reports/assortment-structure/", AssortmentStructureView.as_view(),
          name="report-assortment-structure"),
-    path("reports/central-stock/", CentralStockView.as_view(), name="report-central-stock"),
+    path("reports/central-stock/", (CentralStockAsyncView if _async else CentralStockView).as_view(),
+         name="report-central-stock"),
     path("reports/stocks-by-warehouse-dealer/", StocksByWarehouseDealerView.as_view(),
          name="report-stocks-by-warehouse-dealer"),
-    path("reports/forecast-shortages/", ForecastShortagesView.as_view(),
+    path("reports/forecast-shortages/", (ForecastShortagesAsyncView if _async else ForecastShortagesView).as_view(),
          name="report-forecast-shortages"),
     path("reports/plan-vs-actual/", PlanVsActualView.as_view(), name="report-plan-vs-actual"),
     path("reports/plan-achievement/", PlanAchievementView.as_view(),
@@ -57,6 +64,10 @@ urlpatterns = [
          name="report-average-order-amount"),
     path("reports/most-ordered-products/", MostOrderedProductsView.as_view(),
          name="report-most-ordered-products"),
+    path("reports/stock-valuation/", StockValuationView.as_view(), name="report-stock-valuation"),
+    path("reports/cogs/", CostOfGoodsSoldView.as_view(), name="report-cogs"),
+    path("timing/endpoints/", EndpointTimingView.as_view(), name="timing-endpoints"),
+    path("stock/availability/", StockAvailabilityView.as_view(), name="stock-availability"),
     path('orders/import/', OrderImportView.as_view(), name='order_import'),
     path('incomes/import/', IncomeImportView.as_view(), name='income_import'),
 ]
@@ -0,0 +1,234 @@
+from collections import deque
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from heapq import merge
+from itertools import groupby
+
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Income, IncomeItem, MovementItem, Outcome, OutcomeItem, WarehouseProduct
+from .stock import CENT
+
+AVERAGE = 'average'
+FIFO = 'fifo'
+METHODS = (AVERAGE, FIFO)
+CHUNK_SIZE = 2000
+
+# Порядок событий в один момент времени: входящий остаток, поступления, потом списания
+_OPENING, _INCOME, _MOVE_IN, _MOVE_OUT, _OUTCOME = range(5)
+# Момент входящего остатка — раньше любого документа
+_BEGINNING = datetime.min.replace(tzinfo=dt_timezone.utc)
+
+
+class AverageCost:
+    """Скользящая средневзвешенная — та же формула, что у проводок (stock.blend_cost)."""
+
+    def __init__(self):
+        self.qty = 0
+        self.unit = Decimal(0)
+
+    def receive(self, qty, unit):
+        """Поступление qty по цене unit (None — по текущей средней)."""
+        if qty <= 0:
+            return
+        if unit is not None:
+            on_hand = max(self.qty, 0)
+            self.unit = ((self.unit * on_hand + unit * qty) / (on_hand + qty)).quantize(CENT)
+        self.qty += qty
+
+    def issue(self, qty):
+        """Списание qty -> (себестоимость, сколько списано сверх остатка)."""
+        short = max(0, qty - max(self.qty, 0))
+        self.qty -= qty
+        return self.unit * qty, short
+
+    @property
+    def value(self):
+        # минус (списано сверх остатка) стоимости не имеет — как и у FIFO без партий
+        return self.unit * max(self.qty, 0)
+
+
+class FifoCost:
+    """
+    Партии (слои) поступлений; списание забирает самые старые. Списанное сверх остатка
+    оценивается по цене последней партии, следующее поступление сначала гасит этот минус.
+    """
+
+    def __init__(self):
+        self.qty = 0
+        self.layers = deque()
+        self.last_unit = Decimal(0)
+
+    def receive(self, qty, unit):
+        if qty <= 0:
+            return
+        unit = self.last_unit if unit is None else unit
+        self.last_unit = unit
+        covered = min(qty, max(-self.qty, 0))
+        self.qty += qty
+        if qty > covered:
+            self.layers.append([qty - covered, unit])
+
+    def issue(self, qty):
+        cost, left = Decimal(0), qty
+        while left and self.layers:
+            layer = self.layers[0]
+            take = min(left, layer[0])
+            cost += layer[1] * take
+            left -= take
+            layer[0] -= take
+            if not layer[0]:
+                self.layers.popleft()
+        self.qty -= qty
+        return cost + self.last_unit * left, left
+
+    @property
+    def value(self):
+        return sum((unit * qty for qty, unit in self.layers), Decimal(0))
+
+
+def _stream(queryset, kind, unit=None, price=None):
+    """События одного вида: (склад, момент, вид, id строки, товар, кол-во, цена поступления, цена продажи)."""
+    fields = ('_warehouse', '_at', 'id', 'product_id', 'count') + tuple(name for name in (unit, price) if name)
+    rows = queryset.order_by('_warehouse', '_at', 'id').values_list(*fields)
+    for warehouse_id, at, pk, product_id, count, *extra in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield (warehouse_id, at, kind, pk, product_id, count,
+               extra[0] if unit else None, extra[-1] if price else None)
+
+
+def _sources():
+    """(строки, поле склада, момент, вид, поле цены поступления, поле цены продажи) по видам событий."""
+    return (
+        (IncomeItem.objects.filter(income__status=Income.Status.finished, income__warehouse__isnull=False),
+         'income__warehouse_id', Coalesce('income__finished_at', 'income__created'), _INCOME, 'price', None),
+        (MovementItem.objects.filter(movement__received_at__isnull=False),
+         'movement__warehouse_to_id', F('movement__received_at'), _MOVE_IN, 'cost', None),
+        (MovementItem.objects.filter(movement__sent_at__isnull=False),
+         'movement__warehouse_from_id', F('movement__sent_at'), _MOVE_OUT, None, None),
+        (OutcomeItem.objects.filter(outcome__status=Outcome.Status.finished, outcome__warehouse__isnull=False),
+         'outcome__warehouse_id', Coalesce('outcome__finished_at', 'outcome__created'), _OUTCOME, None, 'price'),
+    )
+
+
+def _opening(warehouse_ids=None, product_ids=None):
+    """
+    Входящий остаток — события _OPENING по (склад, товар): то, что лежит на складе (WarehouseProduct.count)
+    сверх всей истории документов (остатки, загруженные load_stock, ручные правки, учёт до системы).
+    Оценивается по текущей цене остатка. Отрицательный — история списала больше, чем есть:
+    уходит со склада до первого документа, себестоимостью продаж не считается.
+    """
+    net = {}
+    for queryset, warehouse, _, kind, _, _ in _sources():
+        queryset = queryset.annotate(_warehouse=F(warehouse))
+        if warehouse_ids:
+            queryset = queryset.filter(_warehouse__in=warehouse_ids)
+        if product_ids:
+            queryset = queryset.filter(product_id__in=product_ids)
+        sign = 1 if kind in (_INCOME, _MOVE_IN) else -1
+        for warehouse_id, product_id, qty in queryset.values_list('_warehouse', 'product_id').annotate(
+                qty=Sum('count')).order_by():
+            net[(warehouse_id, product_id)] = net.get((warehouse_id, product_id), 0) + sign * (qty or 0)
+
+    balances = WarehouseProduct.objects.filter(warehouse__isnull=False)
+    if warehouse_ids:
+        balances = balances.filter(warehouse_id__in=warehouse_ids)
+    if product_ids:
+        balances = balances.filter(product_id__in=product_ids)
+    # пара без строки остатка — на складе 0, история целиком гасится входящим остатком
+    opening = {pair: (-qty, None) for pair, qty in net.items()}
+    for warehouse_id, product_id, count, price in balances.values_list('warehouse_id', 'product_id', 'count', 'price'):
+        opening[(warehouse_id, product_id)] = (count - net.get((warehouse_id, product_id), 0), price)
+    for (warehouse_id, product_id), (qty, price) in sorted(opening.items()):
+        if qty:
+            yield warehouse_id, _BEGINNING, _OPENING, product_id, product_id, qty, price, None
+
+
+def _events(warehouse_ids=None, product_ids=None, until=None):
+    """
+    Вся история движения товара, упорядоченная по (склад, момент): входящий остаток,
+    проведённые приходы, расходы и перемещения (отправка — списание у отправителя,
+    получение — поступление у получателя по себестоимости отправки). Курсоры, слитые
+    heapq.merge, — ничего не собирается в память целиком.
+    """
+    streams = [_opening(warehouse_ids, product_ids)]
+    for queryset, warehouse, moment, kind, unit, price in _sources():
+        queryset = queryset.annotate(_warehouse=F(warehouse), _at=moment)
+        if warehouse_ids:
+            queryset = queryset.filter(_warehouse__in=warehouse_ids)
+        if product_ids:
+            queryset = queryset.filter(product_id__in=product_ids)
+        if until is not None:
+            queryset = queryset.filter(_at__lt=until)
+        streams.append(_stream(queryset, kind, unit, price))
+    return merge(*streams, key=lambda event: event[:4])
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min)) if day else None
+
+
+def replay(method=AVERAGE, warehouse_ids=None, product_ids=None, date_from=None, date_to=None, issued=None):
+    """
+    Оценка запасов и себестоимость продаж одним проходом по истории, склад за складом.
+
+    method — average (скользящая средняя) или fifo (партии). Состояние держится только
+    для текущего склада. Возвращает строки по (склад, товар):
+    {warehouse, product, qty, value, unit_cost — на конец date_to;
+     sold_qty, cogs, revenue, uncosted_qty — по расходам в [date_from, date_to]}.
+    uncosted_qty — списано сверх остатка по истории (оценено по последней цене).
+    История начинается с входящего остатка (_opening), так что qty без date_to совпадает
+    с WarehouseProduct.count.
+    Перемещение приходит к получателю по себестоимости, записанной при отправке
+    (средняя отправителя), — так склады проигрываются независимо и в FIFO тоже.
+    issued, если передан dict, получает себестоимость единицы каждой списанной строки:
+    {('outcome' | 'movement', id строки): цена}.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Неизвестный метод оценки: {method}")
+    cost_class = FifoCost if method == FIFO else AverageCost
+    start = _day_start(date_from)
+    until = _day_start(date_to + timedelta(days=1)) if date_to else None
+
+    rows = []
+    events = _events(warehouse_ids, product_ids, until)
+    for warehouse_id, warehouse_events in groupby(events, key=lambda event: event[0]):
+        states, period = {}, {}
+        for _, at, kind, pk, product_id, count, unit, price in warehouse_events:
+            state = states.get(product_id)
+            if state is None:
+                state = states[product_id] = cost_class()
+            if kind == _OPENING and count < 0:
+                state.issue(-count)
+                continue
+            if kind in (_OPENING, _INCOME, _MOVE_IN):
+                state.receive(count, unit)
+                continue
+            cost, short = state.issue(count)
+            if issued is not None and count:
+                issued[('outcome' if kind == _OUTCOME else 'movement', pk)] = (cost / count).quantize(CENT)
+            if kind == _OUTCOME and (start is None or at >= start):
+                totals = period.setdefault(product_id, [0, Decimal(0), Decimal(0), 0])
+                totals[0] += count
+                totals[1] += cost
+                totals[2] += price * count
+                totals[3] += short
+
+        for product_id, state in states.items():
+            sold_qty, cogs, revenue, uncosted = period.get(product_id, (0, Decimal(0), Decimal(0), 0))
+            if not state.qty and not sold_qty:
+                continue
+            value = state.value.quantize(CENT)
+            rows.append({
+                'warehouse': warehouse_id,
+                'product': product_id,
+                'qty': state.qty,
+                'value': value,
+                'unit_cost': (value / state.qty).quantize(CENT) if state.qty > 0 else None,
+                'sold_qty': sold_qty,
+                'cogs': cogs.quantize(CENT),
+                'revenue': revenue.quantize(CENT),
+                'uncosted_qty': uncosted,
+            })
+    return rows
@@ -1,23 +1,31 @@
+import time
 from datetime import timedelta, date
 from decimal import Decimal
 from math import ceil
 
 import openpyxl
 from dateutil.relativedelta import relativedelta
-from django.db.models import ExpressionWrapper, F, DecimalField, Sum, Count, Value, Min, Max, Q
-from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, Coalesce
+from django.db.models import ExpressionWrapper, F, DecimalField, Sum, Count, Value, Min, Max, Q, Window
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, Coalesce, RowNumber
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from panasonic_api import timing
 from user.models import User
-from .filters import WarehouseProductFilter, OutcomeFilter, OrderFilter, IncomeFilter
-from .models import ReportItem, Report
+from . import allocation, matviews, refcache, reorder, replenishment, reservations, stock, transitions, valuation
+from .concurrency import ConcurrentQueriesMixin, AsyncReportView
+from .conditional import ConditionalGetMixin
+from .expressions import WindowSum
+from .filters import WarehouseProductFilter, OutcomeFilter, OrderFilter, IncomeFilter, ProductFilter, OrderItemFilter, \
+    CatalogFilter, rank_products
+from .models import ReportItem, Report, SalesDaily, ReportViewRefresh, StockReservation
 from .serializers import *
 
 
@@ -26,8 +34,20 @@ class CustomPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+    def paginate_queryset(self, queryset, request, view=None):
+        page = super().paginate_queryset(queryset, request, view)
+        # serializer.data страницы считается между paginate_queryset и get_paginated_response
+        self._serialize_started = time.perf_counter()
+        return page
 
-class StatusViewSet(viewsets.ModelViewSet):
+    def get_paginated_response(self, data):
+        started = getattr(self, "_serialize_started", None)
+        if started is not None:
+            timing.add("serializer", (time.perf_counter() - started) * 1000)
+        return super().get_paginated_response(data)
+
+
+class StatusViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Status.objects.order_by('-id')
     serializer_class = StatusSerializer
     permission_classes = [IsAuthenticated]
@@ -36,7 +56,7 @@ class StatusViewSet(viewsets.ModelViewSet):
     filterset_fields = ['name', 'status', '_type', 'created', 'user']
 
 
-class UnitTypeViewSet(viewsets.ModelViewSet):
+class UnitTypeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = UnitType.objects.order_by('-id')
     serializer_class = UnitTypeSerializer
     permission_classes = [IsAuthenticated]
@@ -45,7 +65,7 @@ class UnitTypeViewSet(viewsets.ModelViewSet):
     filterset_fields = ['name', 'status', 'created', 'user']
 
 
-class ProductCategoryViewSet(viewsets.ModelViewSet):
+class ProductCategoryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = ProductCategory.objects.order_by('-id')
     serializer_class = ProductCategorySerializer
     permission_classes = [IsAuthenticated]
@@ -54,16 +74,40 @@ class ProductCategoryViewSet(viewsets.ModelViewSet):
     filterset_fields = ['name', 'status', 'created', 'user']
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Product.objects.order_by('-id')
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = CustomPagination
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['name', 'category', 'code', 'unit_type', 'status', 'created', 'user']
+    filterset_class = ProductFilter
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        Поиск товаров: ?q=строка&limit=20 (до 100).
+        Сначала точное совпадение и префикс кода, затем по похожести названия (pg_trgm).
+        """
+        q = request.query_params.get("q", "").strip()
+        if not q:
+            return Response({"error": "Параметр q обязателен"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(100, max(1, int(request.query_params.get("limit", 20))))
+        except ValueError:
+            return Response({"error": "limit должен быть числом"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # отбор по q (и прочим фильтрам списка) делает ProductFilter
+        qs = self.filter_queryset(self.get_queryset()).select_related('category')
+        qs = rank_products(qs, q).order_by('-search_rank', 'name', 'id')[:limit]
+        results = []
+        for product in qs:
+            row = self.get_serializer(product).data
+            row["rank"] = round(product.search_rank, 4)
+            results.append(row)
+        return Response({"q": q, "count": len(results), "results": results})
 
 
-class WarehouseViewSet(viewsets.ModelViewSet):
+class WarehouseViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Warehouse.objects.order_by('-id')
     serializer_class = WarehouseSerializer
     permission_classes = [IsAuthenticated]
@@ -72,16 +116,137 @@ class WarehouseViewSet(viewsets.ModelViewSet):
     filterset_fields = ['name', 'created', 'user', 'responsible']
 
 
-class WarehouseProductViewSet(viewsets.ModelViewSet):
-    queryset = WarehouseProduct.objects.order_by('-id')
+class WarehouseProductViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = reorder.below_reorder(reservations.with_available(WarehouseProduct.objects.order_by('-id')))
     serializer_class = WarehouseProductSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = CustomPagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = WarehouseProductFilter
 
+    def get_conditional_querysets(self, request):
+        querysets = super().get_conditional_querysets(request)
+        # reserved/available меняются вместе с заказами, а не с остатками
+        if querysets:
+            querysets.append((StockReservation.objects.all(), 'updated'))
+        return querysets
+
+    @action(detail=False, methods=['post'], url_path='load')
+    def load(self, request):
+        """
+        Загрузка остатков склада из файла (xlsx/csv: code, count, [name], [price]).
+
+        Параметры формы: file, warehouse (id), keep_missing, create_products, category, dry_run.
+        Позиции, которых нет в файле, обнуляются (если не keep_missing). Возвращает сводку сверки.
+        """
+        excel_file = request.FILES.get("file")
+        if not excel_file:
+            return Response({"error": "Необходимо передать файл"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            warehouse = Warehouse.objects.filter(pk=int(request.data.get("warehouse"))).first()
+        except (TypeError, ValueError):
+            warehouse = None
+        if not warehouse:
+            return Response({"error": "Склад не найден"}, status=status.HTTP_400_BAD_REQUEST)
+
+        def flag(name):
+            return str(request.data.get(name, "false")).lower() in ("1", "true", "yes")
+
+        try:
+            lines, errors = stock.read_stock_file(excel_file, excel_file.name)
+        except stock.StockFileError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        summary = stock.load_stock(
+            warehouse, lines, user=request.user, zero_missing=not flag("keep_missing"),
+            create_products=flag("create_products"), category_name=request.data.get("category"),
+            dry_run=flag("dry_run"),
+        )
+        return Response({**summary, "errors": errors})
+
+
+class StockAvailabilityView(APIView):
+    """
+    Наличие под корзину одним запросом
+    POST /api/v1/stock/availability/
+        {"items": [{"product": ID, "qty": N}, ...],   # до 1000 строк
+         "warehouses": [ID, ...]}                     # опционально: только эти склады
+
+    По каждой строке (в порядке items): available — свободный остаток (count - reserved)
+    по складам, enough — хватает ли его, warehouse — склад, с которого строку можно
+    отгрузить целиком, warehouses — склады со свободным остатком.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        items, warehouse_ids = request.data.get("items"), request.data.get("warehouses")
+        try:
+            if not isinstance(items, list):
+                raise TypeError
+            lines = [(int(item["product"]), int(item.get("qty", 1))) for item in items]
+            if warehouse_ids is not None:
+                if not isinstance(warehouse_ids, list):
+                    raise TypeError
+                warehouse_ids = [int(pk) for pk in warehouse_ids]
+        except (TypeError, ValueError, KeyError, AttributeError):
+            return Response({"error": "items — список {product, qty}, warehouses — список id складов"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not lines or len(lines) > reservations.AVAILABILITY_MAX_LINES:
+            return Response({"error": f"Нужно от 1 до {reservations.AVAILABILITY_MAX_LINES} строк"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if any(qty <= 0 for _, qty in lines):
+            return Response({"error": "qty должно быть больше 0"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = reservations.availability(lines, warehouse_ids)
+        # названия — из справочников в памяти процесса, без запросов
+        products = refcache.PRODUCTS.get_many({row["product"] for row in results})
+        warehouses = {row.id: row.name for row in refcache.WAREHOUSES.all()}
+        for row in results:
+            product = products.get(row["product"])
+            row["product_name"] = product.name if product else None
+            if product is None:
+                row["error"] = "Товар не найден"
+            for stock_row in row["warehouses"]:
+                stock_row["warehouse_name"] = warehouses.get(stock_row["warehouse"])
+        return Response({
+            "count": len(results),
+            "enough": all(row["enough"] for row in results),
+            "results": results,
+        })
+
+
+class TransitionMixin:
+    """
+    POST <документы>/transition/ {"ids": [...], "status": "..."} — смена статуса пачкой.
 
-class IncomeViewSet(viewsets.ModelViewSet):
+    Переходы проверяются по api.transitions.TRANSITIONS, проводки по складу делаются
+    сразу для всех документов. Ответ 200 и результат по каждому id (ok / error).
+    """
+
+    @action(detail=False, methods=['post'], url_path='transition')
+    def transition(self, request):
+        model = self.get_queryset().model
+        ids, target = request.data.get("ids"), request.data.get("status")
+        if target not in model.Status.values:
+            return Response({"error": f"Неизвестный статус: {target}"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            if not isinstance(ids, list):
+                raise TypeError
+            ids = [int(pk) for pk in ids]
+        except (TypeError, ValueError):
+            return Response({"error": "ids — список id документов"}, status=status.HTTP_400_BAD_REQUEST)
+        if not ids or len(ids) > transitions.MAX_IDS:
+            return Response({"error": f"Нужно от 1 до {transitions.MAX_IDS} id"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = transitions.apply(model, ids, target)
+        return Response({
+            "status": target,
+            "updated": sum(1 for row in results if row["ok"]),
+            "failed": sum(1 for row in results if not row["ok"]),
+            "results": results,
+        })
+
+
+class IncomeViewSet(TransitionMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Income.objects.order_by('-id')
     serializer_class = IncomeSerializer
     permission_classes = [IsAuthenticated]
@@ -99,13 +264,14 @@ class IncomeItemViewSet(viewsets.ModelViewSet):
     filterset_fields = ['income', 'product', 'status', 'user']
 
 
-class OutcomeViewSet(viewsets.ModelViewSet):
+class OutcomeViewSet(TransitionMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Outcome.objects.order_by('-id')
     serializer_class = OutcomeSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = CustomPagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = OutcomeFilter
+    conditional_actions = ('list', 'my_outcomes')
 
     @action(detail=False, methods=['get'], url_path='my')
     def my_outcomes(self, request):
@@ -136,7 +302,7 @@ class OutcomeItemViewSet(viewsets.ModelViewSet):
     filterset_fields = ['outcome', 'product', 'status', 'user']
 
 
-class MovementViewSet(viewsets.ModelViewSet):
+class MovementViewSet(TransitionMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Movement.objects.order_by('-id')
     serializer_class = MovementSerializer
     permission_classes = [IsAuthenticated]
@@ -144,6 +310,31 @@ class MovementViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['warehouse_from', 'warehouse_to', 'user', 'created', 'status']
 
+    @action(detail=False, methods=['post'], url_path='replenish')
+    def replenish(self, request):
+        """
+        POST movements/replenish/ — пополнение складов с центрального по расходу.
+
+        Параметры: central, warehouses (список id), window_days, cover_days, dry_run.
+        Создаёт черновики перемещений (pending); с dry_run — только план.
+        """
+        data = request.data
+        try:
+            central = int(data["central"]) if data.get("central") else None
+            warehouses = [int(pk) for pk in data.get("warehouses") or []] or None
+            window_days = max(1, int(data.get("window_days", replenishment.WINDOW_DAYS)))
+            cover_days = max(1, int(data.get("cover_days", replenishment.COVER_DAYS)))
+        except (TypeError, ValueError):
+            return Response({"error": "central, window_days, cover_days — числа, warehouses — список id"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        dry_run = str(data.get("dry_run", "false")).lower() in ("1", "true", "yes")
+        try:
+            result = replenishment.replenish(request.user, central, warehouses, window_days, cover_days,
+                                             dry_run=dry_run)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+
 
 class MovementItemViewSet(viewsets.ModelViewSet):
     queryset = MovementItem.objects.order_by('-id')
@@ -154,13 +345,43 @@ class MovementItemViewSet(viewsets.ModelViewSet):
     filterset_fields = ['movement', 'product', 'user']
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(TransitionMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Order.objects.order_by('-id')
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = CustomPagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = OrderFilter
+    conditional_actions = ('list', 'my_orders')
+
+    @action(detail=False, methods=['post'], url_path='allocate')
+    def allocate(self, request):
+        """
+        POST orders/allocate/ {"ids": [...], "dry_run": false} — распределение заказов по складам.
+
+        Для каждого открытого заказа без отгрузок подбираются склады (меньше отгрузок,
+        затем приоритет склада) и создаются черновики расходов (pending, reason=order).
+        С dry_run — только план. По заказу: shipments, short (чего не хватило), outcomes.
+        """
+        ids = request.data.get("ids")
+        try:
+            if not isinstance(ids, list):
+                raise TypeError
+            ids = [int(pk) for pk in ids]
+        except (TypeError, ValueError):
+            return Response({"error": "ids — список id заказов"}, status=status.HTTP_400_BAD_REQUEST)
+        if not ids or len(ids) > allocation.MAX_ORDERS:
+            return Response({"error": f"Нужно от 1 до {allocation.MAX_ORDERS} id"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        dry_run = str(request.data.get("dry_run", "false")).lower() in ("1", "true", "yes")
+
+        results = allocation.allocate(ids, user=request.user, dry_run=dry_run)
+        return Response({
+            "dry_run": dry_run,
+            "shipments": sum(len(row.get("shipments", ())) for row in results),
+            "outcomes": sum(len(row.get("outcomes", ())) for row in results),
+            "results": results,
+        })
 
     @action(detail=False, methods=['get'], url_path='my')
     def my_orders(self, request):
@@ -187,12 +408,13 @@ class OrderItemViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     pagination_class = CustomPagination
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['order', 'product', 'status']
+    filterset_class = OrderItemFilter
 
 
-class SalesVolumeView(APIView):
+class SalesVolumeView(ConditionalGetMixin, APIView):
     """Общий объем продаж (по дням, неделям, месяцам)"""
     permission_classes = [IsAuthenticated]
+    conditional_sources = ((Outcome, "created"),)
 
     def get(self, request):
         group_by = request.query_params.get("group_by", "day")  # day|week|month
@@ -249,11 +471,16 @@ class SalesVolumeView(APIView):
         return Response({"group_by": group_by, "results": data})
 
 
-class SalesVolumeCompareView(APIView):
-    """Сравнение с предыдущими периодами"""
+class SalesVolumeCompareView(ConditionalGetMixin, ConcurrentQueriesMixin, APIView):
+    """
+    Сравнение с предыдущими периодами.
+    Итоги и корзины текущего и сравнительного периодов — четыре независимых
+    запроса (см. SalesVolumeCompareAsyncView).
+    """
     permission_classes = [IsAuthenticated]
+    conditional_sources = ((Outcome, None),)
 
-    def get(self, request):
+    def prepare(self, request):
         group_by = request.query_params.get("group_by", "day")  # day|week|month
         mode = request.query_params.get("mode", "prev")  # prev|yoy
         status = request.query_params.get("status", Outcome.Status.finished)
@@ -308,20 +535,24 @@ class SalesVolumeCompareView(APIView):
         )
         zero_dec = Value(0, output_field=DecimalField(max_digits=20, decimal_places=2))
 
-        def aggregate_range(start_date: str, end_date: str):
-            qs = base_qs().filter(
+        def range_qs(start_date: str, end_date: str):
+            return base_qs().filter(
                 outcome__created__date__gte=start_date,
                 outcome__created__date__lte=end_date
             )
+
+        def totals(start_date: str, end_date: str):
             # Итоги
-            totals = qs.aggregate(
+            return lambda: range_qs(start_date, end_date).aggregate(
                 total_qty=Coalesce(Sum("count"), 0),
                 total_amount=Coalesce(Sum(amount_expr), zero_dec),
                 orders=Count("outcome_id", distinct=True),
             )
+
+        def periods(start_date: str, end_date: str):
             # По корзинам
             buckets = (
-                qs.annotate(period=trunc("outcome__created"))
+                range_qs(start_date, end_date).annotate(period=trunc("outcome__created"))
                 .values("period")
                 .annotate(
                     total_qty=Coalesce(Sum("count"), 0),
@@ -330,21 +561,38 @@ class SalesVolumeCompareView(APIView):
                 )
                 .order_by("period")
             )
-            # нормализуем ключ периода в iso
-            by_period = []
-            for b in buckets:
-                p = b["period"]
-                key = p.date().isoformat() if hasattr(p, "date") else p
-                by_period.append({
-                    "period": key,
-                    "total_qty": b["total_qty"],
-                    "total_amount": b["total_amount"],
-                    "orders": b["orders"],
-                })
-            return totals, by_period
 
-        cur_totals, cur_periods = aggregate_range(cur_start, cur_end)
-        prev_totals, prev_periods = aggregate_range(prev_start, prev_end)
+            def run():
+                # нормализуем ключ периода в iso
+                by_period = []
+                for b in buckets:
+                    p = b["period"]
+                    key = p.date().isoformat() if hasattr(p, "date") else p
+                    by_period.append({
+                        "period": key,
+                        "total_qty": b["total_qty"],
+                        "total_amount": b["total_amount"],
+                        "orders": b["orders"],
+                    })
+                return by_period
+            return run
+
+        context = {
+            "group_by": group_by,
+            "mode": mode,
+            "current": {"date_from": cur_start, "date_to": cur_end},
+            "previous": {"date_from": prev_start, "date_to": prev_end},
+        }
+        return context, {
+            "cur_totals": totals(cur_start, cur_end),
+            "cur_periods": periods(cur_start, cur_end),
+            "prev_totals": totals(prev_start, prev_end),
+            "prev_periods": periods(prev_start, prev_end),
+        }
+
+    def build_response(self, context, results):
+        cur_totals, cur_periods = results["cur_totals"], results["cur_periods"]
+        prev_totals, prev_periods = results["prev_totals"], results["prev_periods"]
 
         # Вычисляем дельты/проценты
         def diff(cur, prev):
@@ -404,18 +652,59 @@ class SalesVolumeCompareView(APIView):
                 },
             })
 
-        result = {
-            "group_by": group_by,
-            "mode": mode,
-            "current": {"date_from": cur_start, "date_to": cur_end},
-            "previous": {"date_from": prev_start, "date_to": prev_end},
+        return {
+            **context,
             "summary": diff(cur_totals, prev_totals),
             "by_period": by_period,
         }
-        return Response(result)
 
 
-class TopProductsView(APIView):
+def _per_group_fields(per, prefix):
+    """
+    Поля группы для параметра ?per=: (id, name, ...).
+    prefix — связь строки с документом: "outcome" или "order".
+    """
+    return {
+        "warehouse": (f"{prefix}__warehouse_id", f"{prefix}__warehouse__name"),
+        "dealer": (f"{prefix}__client_id", f"{prefix}__client__first_name", f"{prefix}__client__last_name"),
+        "category": ("product__category_id", "product__category__name"),
+    }.get(per)
+
+
+def _top_per_group(grouped, group_field, order_by, limit):
+    """
+    Топ-N внутри каждой группы одним запросом:
+    ROW_NUMBER() OVER (PARTITION BY группа ORDER BY метрика) и фильтр rank <= limit.
+    """
+    return (
+        grouped.annotate(
+            rank=Window(RowNumber(), partition_by=[F(group_field)], order_by=order_by),
+        )
+        .filter(rank__lte=limit)
+        .order_by(group_field, "rank")
+    )
+
+
+def _split_groups(rows, per, group_fields, make_item):
+    """Раскладывает отсортированные по группе строки в [{group: {...}, results: [...]}]."""
+    groups = []
+    current = None
+    for r in rows:
+        gid = r[group_fields[0]]
+        if current is None or current["group"]["id"] != gid:
+            if per == "dealer":
+                name = _display_name(r[group_fields[1]], r[group_fields[2]], gid)
+            else:
+                name = r[group_fields[1]]
+            current = {"group": {"type": per, "id": gid, "name": name}, "results": []}
+            groups.append(current)
+        item = make_item(r)
+        item["rank"] = r["rank"]
+        current["results"].append(item)
+    return groups
+
+
+class TopProductsView(ConditionalGetMixin, APIView):
     """
     Самые продаваемые товары
     GET /api/reports/top-products/
@@ -428,15 +717,24 @@ class TopProductsView(APIView):
         &status=finished|active|...
         &category=ID
         &product=ID   (можно передавать несколько: ?product=560&product=561)
+        &per=warehouse|dealer|category   (топ-N внутри каждой группы)
 
     Возвращает топ товаров с полями:
     - product_id, product_name, unit_type, category_id, category_name
     - total_qty, total_amount, orders
+
+    С ?per= вместо results отдаётся groups: [{group: {type, id, name}, results: [...]}],
+    limit применяется к каждой группе отдельно (ROW_NUMBER() OVER (PARTITION BY ...)).
     """
     permission_classes = [IsAuthenticated]
+    conditional_sources = ((Outcome, "created"), (Product, None), (ProductCategory, None))
 
     def get(self, request):
         metric = request.query_params.get("metric", "amount")  # amount|qty
+        per = request.query_params.get("per")
+        group_fields = _per_group_fields(per, "outcome") if per else ()
+        if per and group_fields is None:
+            return Response({"detail": "per должен быть warehouse|dealer|category"}, status=400)
         try:
             limit = int(request.query_params.get("limit", 20))
         except ValueError:
@@ -485,6 +783,7 @@ class TopProductsView(APIView):
                 "product__unit_type",
                 "product__category_id",
                 "product__category__name",
+                *group_fields,
             )
             .annotate(
                 total_qty=Coalesce(Sum("count"), 0),
@@ -493,13 +792,10 @@ class TopProductsView(APIView):
             )
         )
 
-        if metric == "qty":
-            grouped = grouped.order_by("-total_qty", "product__name")
-        else:  # amount
-            grouped = grouped.order_by("-total_amount", "product__name")
+        metric_field = "total_qty" if metric == "qty" else "total_amount"
 
-        data = [
-            {
+        def make_item(r):
+            return {
                 "product_id": r["product_id"],
                 "product_name": r["product__name"],
                 "unit_type": r["product__unit_type"],
@@ -509,8 +805,23 @@ class TopProductsView(APIView):
                 "total_amount": r["total_amount"],
                 "orders": r["orders"],
             }
-            for r in grouped[:limit]
-        ]
+
+        if per:
+            rows = _top_per_group(
+                grouped, group_fields[0],
+                [F(metric_field).desc(), F("product__name").asc()], limit,
+            )
+            groups = _split_groups(rows, per, group_fields, make_item)
+            return Response({
+                "metric": metric,
+                "limit": limit,
+                "per": per,
+                "count": len(groups),
+                "groups": groups,
+            })
+
+        grouped = grouped.order_by(f"-{metric_field}", "product__name")
+        data = [make_item(r) for r in grouped[:limit]]
 
         # опционально — добавить номер в рейтинге
         for i, item in enumerate(data, start=1):
@@ -524,7 +835,7 @@ class TopProductsView(APIView):
         })
 
 
-class LeastPopularProductsView(APIView):
+class LeastPopularProductsView(ConditionalGetMixin, APIView):
     """
     Наименее популярные товары
     GET /api/reports/least-popular-products/
@@ -543,6 +854,7 @@ class LeastPopularProductsView(APIView):
     - total_qty, total_amount, orders
     """
     permission_classes = [IsAuthenticated]
+    conditional_sources = ((Outcome, "created"), (Product, None), (ProductCategory, None))
 
     def get(self, request):
         metric = request.query_params.get("metric", "amount")
@@ -628,7 +940,150 @@ class LeastPopularProductsView(APIView):
         })
 
 
-class DealersSalesView(APIView):
+# Поля отчётов (от OutcomeItem) -> колонки api_sales_daily_mv
+_SALES_DAILY_FIELDS = {
+    "outcome__client_id": "client_id",
+    "outcome__client__first_name": "client__first_name",
+    "outcome__client__last_name": "client__last_name",
+    "outcome__warehouse_id": "warehouse_id",
+    "outcome__warehouse__name": "warehouse__name",
+}
+
+
+def _sales_source(date_from, date_to):
+    """materialized — если диапазон целиком есть в api_sales_daily_mv и не менялся после обновления, иначе live."""
+    return "materialized" if matviews.covers(matviews.SALES_DAILY, date_to, date_from) else "live"
+
+
+def _sales_rows(source, date_from, date_to, status, warehouse_id=None, client_ids=None):
+    """
+    Строки продаж с фильтрами отчёта: SalesDaily (день × дилер × склад × статус)
+    для source=materialized, иначе OutcomeItem.
+    """
+    if source == "materialized":
+        qs = SalesDaily.objects.all()
+        if status:
+            qs = qs.filter(status=status)
+        if date_from:
+            qs = qs.filter(day__gte=date_from)
+        if date_to:
+            qs = qs.filter(day__lte=date_to)
+        if warehouse_id:
+            qs = qs.filter(warehouse_id=warehouse_id)
+        if client_ids:
+            qs = qs.filter(client_id__in=client_ids)
+        return qs
+
+    qs = OutcomeItem.objects.select_related("outcome", "outcome__client")
+    if status:
+        qs = qs.filter(outcome__status=status)
+    if date_from:
+        qs = qs.filter(outcome__created__date__gte=date_from)
+    if date_to:
+        qs = qs.filter(outcome__created__date__lte=date_to)
+    if warehouse_id:
+        qs = qs.filter(outcome__warehouse_id=warehouse_id)
+    if client_ids:
+        qs = qs.filter(outcome__client_id__in=client_ids)
+    return qs
+
+
+def _sales_values(qs, source, fields, *extra):
+    """
+    values(*extra, *fields) — группировка по полям отчёта. Для представления колонки
+    отдаются под именами полей OutcomeItem, чтобы разбор строк в отчётах не менялся.
+    """
+    if source == "materialized":
+        return qs.values(*extra, **{f: F(_SALES_DAILY_FIELDS[f]) for f in fields})
+    return qs.values(*extra, *fields)
+
+
+def _outcome_headers(date_from, date_to, status, warehouse_id=None, client_ids=None):
+    """
+    Шапки Outcome с фильтрами отчёта. Итоги строк (items_count, total_qty, total_amount)
+    ведутся в самих шапках (api.totals), поэтому отчётам по документам строки не нужны.
+    Документы без строк не считаются — как и при агрегации по OutcomeItem.
+    """
+    qs = Outcome.objects.filter(items_count__gt=0)
+    if status:
+        qs = qs.filter(status=status)
+    if date_from:
+        qs = qs.filter(created__date__gte=date_from)
+    if date_to:
+        qs = qs.filter(created__date__lte=date_to)
+    if warehouse_id:
+        qs = qs.filter(warehouse_id=warehouse_id)
+    if client_ids:
+        qs = qs.filter(client_id__in=client_ids)
+    return qs
+
+
+def _dealer_sales(source, date_from, date_to, warehouse_id, status, client_ids):
+    """Продажи по дилерам: qty, amount, orders, first/last sale, warehouses."""
+    zero_dec = Value(0, output_field=DecimalField(max_digits=20, decimal_places=2))
+    client_fields = ("outcome__client_id", "outcome__client__first_name", "outcome__client__last_name")
+
+    if source == "materialized":
+        qs = _sales_rows(source, date_from, date_to, status, warehouse_id, client_ids)
+        return _sales_values(qs, source, client_fields).annotate(
+            total_qty=Coalesce(Sum("qty"), 0),
+            total_amount=Coalesce(Sum("amount"), zero_dec),
+            orders=Coalesce(Sum("orders"), 0),
+            first_sale=Min("first_sale"),
+            last_sale=Max("last_sale"),
+            warehouses=Count("warehouse_id", distinct=True),
+        )
+
+    # живой запрос — одна таблица шапок вместо соединения со строками;
+    # после values() имена агрегатов могут совпадать с полями шапки
+    qs = _outcome_headers(date_from, date_to, status, warehouse_id, client_ids)
+    return qs.values(**{f: F(f.removeprefix("outcome__")) for f in client_fields}).annotate(
+        total_qty=Coalesce(Sum("total_qty"), 0),
+        total_amount=Coalesce(Sum("total_amount"), zero_dec),
+        orders=Count("id"),
+        first_sale=Min("created"),
+        last_sale=Max("created"),
+        warehouses=Count("warehouse_id", distinct=True),
+    )
+
+
+def _monthly_sales(source, date_from, date_to, status, client_ids, warehouse_id, dim_values):
+    """Факт продаж по месяцам (period) и полям измерения: actual_qty, actual_amount, actual_orders."""
+    zero_dec = Value(0, output_field=DecimalField(max_digits=20, decimal_places=2))
+    qs = _sales_rows(source, date_from, date_to, status, warehouse_id, client_ids)
+
+    if source == "materialized":
+        return (
+            _sales_values(qs.annotate(period=TruncMonth("day")), source, dim_values, "period")
+            .annotate(
+                actual_qty=Coalesce(Sum("qty"), 0),
+                actual_amount=Coalesce(Sum("amount"), zero_dec),
+                actual_orders=Coalesce(Sum("orders"), 0),
+            )
+            .order_by("period")
+        )
+
+    amount_expr = ExpressionWrapper(
+        F("count") * F("price"),
+        output_field=DecimalField(max_digits=20, decimal_places=2),
+    )
+    return (
+        _sales_values(qs.annotate(period=TruncMonth("outcome__created")), source, dim_values, "period")
+        .annotate(
+            actual_qty=Coalesce(Sum("count"), 0),
+            actual_amount=Coalesce(Sum(amount_expr), zero_dec),
+            actual_orders=Count("outcome_id", distinct=True),
+        )
+        .order_by("period")
+    )
+
+
+def _period_key(p):
+    # TruncMonth по DateTimeField отдаёт datetime, по DateField (представление) — date
+    return p.date().isoformat() if hasattr(p, "date") else p.isoformat()
+
+
+class DealersSalesView(ConditionalGetMixin, APIView):
     """
     Список всех дилеров с объемом продаж
     GET /api/reports/dealers-sales/
@@ -642,8 +1097,11 @@ class DealersSalesView(APIView):
         &limit=100
 
     Возвращает список дилеров (users) с объёмом продаж.
+    Если date_to не позже последнего полного дня в api_sales_daily_mv, отчёт
+    читается из неё (source=materialized), иначе — из шапок Outcome (source=live).
     """
     permission_classes = [IsAuthenticated]
+    conditional_sources = ((Outcome, "created"), (ReportViewRefresh, None))
 
     def get(self, request):
         date_from = request.query_params.get("date_from")
@@ -660,44 +1118,9 @@ class DealersSalesView(APIView):
             limit = 100
         limit = max(1, min(limit, 1000))
 
-        qs = OutcomeItem.objects.select_related(
-            "outcome", "outcome__client"
-        )
-
-        # Фильтры
-        if status:
-            qs = qs.filter(outcome__status=status)
-        if date_from:
-            qs = qs.filter(outcome__created__date__gte=date_from)
-        if date_to:
-            qs = qs.filter(outcome__created__date__lte=date_to)
-        if warehouse_id:
-            qs = qs.filter(outcome__warehouse_id=warehouse_id)
-        if client_ids:
-            qs = qs.filter(outcome__client_id__in=client_ids)
-
-        # Агрегации
-        amount_expr = ExpressionWrapper(
-            F("count") * F("price"),
-            output_field=DecimalField(max_digits=20, decimal_places=2),
-        )
-        zero_dec = Value(0, output_field=DecimalField(max_digits=20, decimal_places=2))
-
-        grouped = (
-            qs.values(
-                "outcome__client_id",
-                "outcome__client__first_name",
-                "outcome__client__last_name",
-            )
-            .annotate(
-                total_qty=Coalesce(Sum("count"), 0),
-                total_amount=Coalesce(Sum(amount_expr), zero_dec),
-                orders=Count("outcome_id", distinct=True),
-                first_sale=Min("outcome__created"),
-                last_sale=Max("outcome__created"),
-                warehouses=Count("outcome__warehouse_id", distinct=True),
-            )
-        )
+        # Агрегации (из представления или живым запросом)
+        source = _sales_source(date_from, date_to)
+        grouped = _dealer_sales(source, date_from, date_to, warehouse_id, status, client_ids)
 
         # Сортировка
         order_map = {
@@ -743,11 +1166,12 @@ class DealersSalesView(APIView):
             "count": len(results),
             "order_by": order_by,
             "direction": direction,
+            "source": source,
             "results": results,
         })
 
 
-class DealersCompareView(APIView):
+class DealersCompareView(ConditionalGetMixin, APIView):
     """
     Сравнение активности разных дилеров
     GET /api/reports/dealers-compare/
@@ -765,6 +1189,7 @@ class DealersCompareView(APIView):
     - timeseries: (если задан group_by) временные ряды по каждому дилеру
     """
     permission_classes = [IsAuthenticated]
+    conditional_sources = ((Outcome, "created"),)
 
     def get(self, request):
         metric = request.query_params.get("metric", "amount")  # amount|qty|orders
@@ -927,7 +1352,7 @@ class DealersCompareView(APIView):
         })
 
 
-class DealerAvgCheckView(APIView):
+class DealerAvgCheckView(ConditionalGetMixin, APIView):
     """
     Средний чек по дилеру
     GET /api/reports/dealer-avg-check/
@@ -943,8 +1368,10 @@ class DealerAvgCheckView(APIView):
     Возвращает по каждому дилеру:
       - total_amount, orders, avg_check (= total_amount / orders), total_qty
       - first_sale, last_sale, warehouses (в скольких складах были продажи)
+    Закрытый диапазон, целиком попадающий в api_sales_daily_mv, читается из неё (source в ответе).
     """
     permission_classes = [IsAuthenticated]
+    conditional_sources = ((Outcome, "created"), (ReportViewRefresh, None))
 
     def get(self, request):
         date_from = request.query_params.get("date_from")
@@ -961,41 +1388,8 @@ class DealerAvgCheckView(APIView):
             limit = 100
         limit = max(1, min(limit, 1000))
 
-        # База + фильтры
-        qs = OutcomeItem.objects.select_related("outcome", "outcome__client")
-        if status:
-            qs = qs.filter(outcome__status=status)
-        if date_from:
-            qs = qs.filter(outcome__created__date__gte=date_from)
-        if date_to:
-            qs = qs.filter(outcome__created__date__lte=date_to)
-        if warehouse_id:
-            qs = qs.filter(outcome__warehouse_id=warehouse_id)
-        if client_ids:
-            qs = qs.filter(outcome__client_id__in=client_ids)
-
-        # ORM выражения
-        amount_expr = ExpressionWrapper(
-            F("count") * F("price"),
-            output_field=DecimalField(max_digits=20, decimal_places=2),
-        )
-        zero_dec = Value(0, output_field=DecimalField(max_digits=20, decimal_places=2))
-
-        grouped = (
-            qs.values(
-                "outcome__client_id",
-                "outcome__client__first_name",
-                "outcome__client__last_name",
-            )
-            .annotate(
-                total_qty=Coalesce(Sum("count"), 0),
-                total_amount=Coalesce(Sum(amount_expr), zero_dec),
-                orders=Count("outcome_id", distinct=True),
-                first_sale=Min("outcome__created"),
-                last_sale=Max("outcome__created"),
-                warehouses=Count("outcome__warehouse_id", distinct=True),
-            )
-        )
+        source = _sales_source(date_from, date_to)
+        grouped = _dealer_sales(source, date_from, date_to, warehouse_id, status, client_ids)
 
         # Формируем список и считаем avg_check в Python (избегаем деления в БД)
         rows = []
@@ -1043,11 +1437,12 @@ class DealerAvgCheckView(APIView):
             "direction": direction,
             "limit": None if client_ids else limit,
             "count": len(rows),
+            "source": source,
             "results": rows,
         })
 
 
-class OrdersAndReturnsView(APIView):
+class OrdersAndReturnsView(ConditionalGetMixin, APIView):
     """
     Количество заказов и возвратов
     GET /api/reports/orders-and-returns/
@@ -1070,6 +1465,7 @@ class OrdersAndReturnsView(APIView):
       }
     """
     permission_classes = [IsAuthenticated]
+    conditional_sources = ((Order, "created"), (Outcome, "created"))
 
     def get(self, request):
         group_by = request.query_params.get("group_by", "day")  # day|week|month
@@ -1212,7 +1608,7 @@ class OrdersAndReturnsView(APIView):
         })
 
 
-class SalesGeographyView(APIView):
+class SalesGeographyView(ConditionalGetMixin, ConcurrentQueriesMixin, APIView):
     """
     География продаж
     GET /api/reports/sales-geography/
@@ -1222,10 +1618,12 @@ class SalesGeographyView(APIView):
         &status=finished|active|...
 
     Возвращает продажи в разрезе складов (география).
+    Разрез по складам и общие итоги — независимые запросы (см. SalesGeographyAsyncView).
     """
     permission_classes = [IsAuthenticated]
+    conditional_sources = ((Outcome, "created"), (Warehouse, None))
 
-    def get(self, request):
+    def prepare(self, request):
         date_from = request.query_params.get("date_from")
         date_to = request.query_params.get("date_to")
         client_id = request.query_params.get("client")
@@ -1260,23 +1658,30 @@ class SalesGeographyView(APIView):
             .order_by("-total_amount")
         )
 
-        # Общие суммы для долей
-        totals = qs.aggregate(
-            sum_qty=Coalesce(Sum("count"), 0),
-            sum_amount=Coalesce(Sum(amount_expr), zero_dec),
-            sum_orders=Count("outcome_id", distinct=True),
-        )
+        context = {"date_from": date_from, "date_to": date_to, "client": client_id, "status": status}
+        return context, {
+            "grouped": lambda: list(grouped),
+            # Общие суммы для долей
+            "totals": lambda: qs.aggregate(
+                sum_qty=Coalesce(Sum("count"), 0),
+                sum_amount=Coalesce(Sum(amount_expr), zero_dec),
+                sum_orders=Count("outcome_id", distinct=True),
+            ),
+        }
+
+    def build_response(self, context, results):
+        totals = results["totals"]
         sum_qty = totals["sum_qty"] or 0
         sum_amount = totals["sum_amount"] or Decimal("0")
         sum_orders = totals["sum_orders"] or 0
 
-        results = []
-        for r in grouped:
+        rows = []
+        for r in results["grouped"]:
             share_amount = float(r["total_amount"]) / float(sum_amount) * 100.0 if sum_amount else None
             share_qty = float(r["total_qty"]) / float(sum_qty) * 100.0 if sum_qty else None
             share_orders = float(r["orders"]) / float(sum_orders) * 100.0 if sum_orders else None
 
-            results.append({
+            rows.append({
                 "warehouse_id": r["outcome__warehouse_id"],
                 "warehouse_name": r["outcome__warehouse__name"],
                 "total_qty": r["total_qty"],
@@ -1287,23 +1692,18 @@ class SalesGeographyView(APIView):
                 "share_orders_pct": share_orders,
             })
 
-        return Response({
-            "filters": {
-                "date_from": date_from,
-                "date_to": date_to,
-                "client": client_id,
-                "status": status,
-            },
+        return {
+            "filters": context,
             "totals": {
                 "sum_qty": sum_qty,
                 "sum_amount": sum_amount,
                 "sum_orders": sum_orders,
             },
-            "results": results,
-        })
+            "results": rows,
+        }
 
 
-class TopCategoriesView(APIView):
+class TopCategoriesView(ConditionalGetMixin, APIView):
     """
     Какие категории товаров продаются лучше всего
     GET /api/reports/top-categories/
@@ -1314,12 +1714,20 @@ class TopCategoriesView(APIView):
         &status=finished|active|...
         &metric=amount|qty|orders
         &limit=20
+        &per=warehouse|dealer   (топ-N категорий внутри каждого склада / дилера)
 
     Возвращает продажи по категориям товаров.
+    С ?per= доли считаются от итогов своей группы, ответ — groups: [{group, results}].
     """
     permission_classes = [IsAuthenticated]
+    conditional_sources = ((Outcome, "created"), (ProductCategory, None))
 
     def get(self, request):
+        per = request.query_params.get("per")
+        group_fields = _per_group_fields(per, "outcome") if per != "category" else None
+        if per and group_fields is None:
+            return Response({"detail": "per должен быть warehouse|dealer"}, status=400)
+        group_fields = group_fields if per else ()
         date_from = request.query_params.get("date_from")
         date_to = request.query_params.get("date_to")
         warehouse_id = request.query_params.get("warehouse")
@@ -1354,7 +1762,7 @@ class TopCategoriesView(APIView):
         zero_dec = Value(0, output_field=DecimalField(max_digits=20, decimal_places=2))
 
         grouped = (
-            qs.values("product__category_id", "product__category__name")
+            qs.values("product__category_id", "product__category__name", *group_fields)
             .annotate(
                 total_qty=Coalesce(Sum("count"), 0),
                 total_amount=Coalesce(Sum(amount_expr), zero_dec),
@@ -1368,7 +1776,6 @@ class TopCategoriesView(APIView):
             "orders": "-orders",
             "amount": "-total_amount",
         }.get(metric, "-total_amount")
-        grouped = grouped.order_by(order_key)
 
         # Общие суммы для долей
         totals = qs.aggregate(
@@ -1380,24 +1787,45 @@ class TopCategoriesView(APIView):
         sum_amount = totals["sum_amount"] or Decimal("0")
         sum_orders = totals["sum_orders"] or 0
 
-        # Формируем список
-        results = []
-        for i, r in enumerate(grouped[:limit], start=1):
-            share_amount = float(r["total_amount"]) / float(sum_amount) * 100.0 if sum_amount else None
-            share_qty = float(r["total_qty"]) / float(sum_qty) * 100.0 if sum_qty else None
-            share_orders = float(r["orders"]) / float(sum_orders) * 100.0 if sum_orders else None
-
-            results.append({
-                "rank": i,
+        def make_item(r, g_qty, g_amount, g_orders):
+            return {
                 "category_id": r["product__category_id"],
                 "category_name": r["product__category__name"],
                 "total_qty": r["total_qty"],
                 "total_amount": r["total_amount"],
                 "orders": r["orders"],
-                "share_amount_pct": share_amount,
-                "share_qty_pct": share_qty,
-                "share_orders_pct": share_orders,
-            })
+                "share_amount_pct": float(r["total_amount"]) / float(g_amount) * 100.0 if g_amount else None,
+                "share_qty_pct": float(r["total_qty"]) / float(g_qty) * 100.0 if g_qty else None,
+                "share_orders_pct": float(r["orders"]) / float(g_orders) * 100.0 if g_orders else None,
+            }
+
+        if per:
+            # Итоги каждой группы — отдельным агрегатом (заказы считаются distinct, суммировать их нельзя)
+            group_totals = {
+                t[group_fields[0]]: t
+                for t in qs.values(group_fields[0]).annotate(
+                    sum_qty=Coalesce(Sum("count"), 0),
+                    sum_amount=Coalesce(Sum(amount_expr), zero_dec),
+                    sum_orders=Count("outcome_id", distinct=True),
+                ).order_by()
+            }
+
+            def make_group_item(r):
+                t = group_totals.get(r[group_fields[0]], {})
+                return make_item(r, t.get("sum_qty"), t.get("sum_amount"), t.get("sum_orders"))
+
+            rows = _top_per_group(
+                grouped, group_fields[0],
+                [F(order_key[1:]).desc(), F("product__category__name").asc()], limit,
+            )
+            groups = _split_groups(rows, per, group_fields, make_group_item)
+            payload = {"per": per, "limit": limit, "count": len(groups), "groups": groups}
+        else:
+            # Формируем список
+            results = []
+            for i, r in enumerate(grouped.order_by(order_key)[:limit], start=1):
+                results.append({"rank": i, **make_item(r, sum_qty, sum_amount, sum_orders)})
+            payload = {"results": results}
 
         return Response({
             "metric": metric,
@@ -1413,11 +1841,11 @@ class TopCategoriesView(APIView):
                 "sum_amount": sum_amount,
                 "sum_orders": sum_orders,
             },
-            "results": results,
+            **payload,
         })
 
 
-class AssortmentStructureView(APIView):
+class AssortmentStructureView(ConditionalGetMixin, APIView):
     """
     Структура ассортимента и его эффективность
     GET /api/reports/assortment-structure/
@@ -1430,9 +1858,15 @@ class AssortmentStructureView(APIView):
         &client=ID
         &status=finished|active|...
 
-    Возвращает структуру ассортимента с метриками эффективности и ABC-классификацией.
+    Возвращает структуру ассортимента с метриками эффективности, ABC- и XYZ-классификацией.
+
+    ABC считается в БД оконными функциями: накопленная сумма
+    SUM(total_amount) OVER (ORDER BY total_amount DESC) и общий итог SUM(...) OVER ().
+    XYZ — по коэффициенту вариации помесячного спроса (qty) за период:
+    X ≤ 10%, Y ≤ 25%, Z > 25%. Месяцы без продаж учитываются как нули.
     """
     permission_classes = [IsAuthenticated]
+    conditional_sources = ((Outcome, "created"), (Product, None), (ProductCategory, None))
 
     def get(self, request):
         level = request.query_params.get("level", "category")  # category|product
@@ -1443,8 +1877,10 @@ class AssortmentStructureView(APIView):
             limit = 100
         limit = max(1, min(limit, 1000))
 
-        date_from = request.query_params.get("date_from")
-        date_to = request.query_params.get("date_to")
+        try:
+            date_from, date_to = _query_date(request, "date_from"), _query_date(request, "date_to")
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=400)
         warehouse_id = request.query_params.get("warehouse")
         client_id = request.query_params.get("client")
         status = request.query_params.get("status", Outcome.Status.finished)
@@ -1479,11 +1915,10 @@ class AssortmentStructureView(APIView):
                 "product__category_id",
                 "product__category__name",
             )
-            result_keys = ("product_id", "product__name", "product__unit_type",
-                           "product__category_id", "product__category__name")
+            key_field = "product_id"
         else:  # category (по умолчанию)
             group_fields = ("product__category_id", "product__category__name")
-            result_keys = ("product__category_id", "product__category__name")
+            key_field = "product__category_id"
 
         grouped = (
             qs.values(*group_fields)
@@ -1492,6 +1927,14 @@ class AssortmentStructureView(APIView):
                 total_amount=Coalesce(Sum(amount_expr), zero_dec),
                 orders=Count("outcome_id", distinct=True),
             )
+            .annotate(
+                # ABC: накопленная доля по сумме считается по ВСЕМ группам, до LIMIT
+                cum_amount=Window(
+                    WindowSum(F("total_amount")),
+                    order_by=[F("total_amount").desc(), F(key_field).asc()],
+                ),
+                all_amount=Window(WindowSum(F("total_amount"))),
+            )
         )
 
         # Сортировка
@@ -1500,36 +1943,52 @@ class AssortmentStructureView(APIView):
             "orders": "-orders",
             "amount": "-total_amount",
         }.get(metric, "-total_amount")
-        grouped = grouped.order_by(order_key)
+        grouped = grouped.order_by(order_key, key_field)
 
         # Общие суммы для долей
         totals = qs.aggregate(
             sum_qty=Coalesce(Sum("count"), 0),
             sum_amount=Coalesce(Sum(amount_expr), zero_dec),
             sum_orders=Count("outcome_id", distinct=True),
+            first_sale=Min("outcome__created"),
+            last_sale=Max("outcome__created"),
         )
         sum_qty = totals["sum_qty"] or 0
         sum_amount = totals["sum_amount"] or Decimal("0")
         sum_orders = totals["sum_orders"] or 0
 
-        # Собираем строки и считаем производные метрики в Python
-        raw_rows = list(grouped[:limit]) if limit else list(grouped)
+        # Из БД уходят только итоговые TOP-N строк
+        raw_rows = list(grouped[:limit])
 
-        # Для ABC нужна сортировка по total_amount (DESC) и кумулятивная доля
-        rows_for_abc = sorted(raw_rows, key=lambda r: r["total_amount"], reverse=True)
-        cum = Decimal("0")
         abc_map = {}
-        if sum_amount and float(sum_amount) != 0.0:
-            for r in rows_for_abc:
-                key = self._key_from_row(level, r)
-                cum += r["total_amount"]
-                share = (cum / sum_amount) * Decimal("100")
-                if share <= 80:
-                    abc_map[key] = "A"
-                elif share <= 95:
-                    abc_map[key] = "B"
-                else:
-                    abc_map[key] = "C"
+        for r in raw_rows:
+            all_amount = r["all_amount"] or Decimal("0")
+            if not all_amount:
+                continue
+            share = (r["cum_amount"] / all_amount) * Decimal("100")
+            if share <= 80:
+                abc_map[r[key_field]] = "A"
+            elif share <= 95:
+                abc_map[r[key_field]] = "B"
+            else:
+                abc_map[r[key_field]] = "C"
+
+        # XYZ: помесячный спрос только по попавшим в TOP-N ключам
+        months_total = self._months_between(
+            date_from or totals["first_sale"],
+            date_to or totals["last_sale"],
+        )
+        monthly = (
+            qs.filter(**{f"{key_field}__in": [r[key_field] for r in raw_rows]})
+            .annotate(month=TruncMonth("outcome__created"))
+            .values(key_field, "month")
+            .annotate(qty=Coalesce(Sum("count"), 0))
+            .order_by()
+        )
+        series = {}
+        for m in monthly:
+            series.setdefault(m[key_field], []).append(m["qty"])
+        xyz_map = {k: self._xyz(v, months_total) for k, v in series.items()}
 
         # Формируем финальные строки
         results = []
@@ -1566,15 +2025,16 @@ class AssortmentStructureView(APIView):
                     "category_id": r["product__category_id"],
                     "category_name": r["product__category__name"],
                 })
-                abc_key = ("product", r["product_id"])
             else:
                 base.update({
                     "category_id": r["product__category_id"],
                     "category_name": r["product__category__name"],
                 })
-                abc_key = ("category", r["product__category_id"])
 
-            base["abc_class"] = abc_map.get(abc_key)  # может быть None, если sum_amount=0
+            base["abc_class"] = abc_map.get(r[key_field])  # может быть None, если sum_amount=0
+            demand_cv, xyz_class = xyz_map.get(r[key_field], (None, None))
+            base["demand_cv"] = demand_cv
+            base["xyz_class"] = xyz_class
             results.append(base)
 
         return Response({
@@ -1596,13 +2056,33 @@ class AssortmentStructureView(APIView):
         })
 
     @staticmethod
-    def _key_from_row(level, r):
-        if level == "product":
-            return ("product", r["product_id"])
-        return ("category", r["product__category_id"])
+    def _months_between(start, end):
+        """Кол-во календарных месяцев в периоде (включительно); start/end — date или datetime."""
+        if not start or not end:
+            return 0
+        return max(0, (end.year - start.year) * 12 + end.month - start.month + 1)
+
+    @staticmethod
+    def _xyz(monthly_qty, months_total):
+        """(коэффициент вариации, класс X/Y/Z) по ряду помесячного спроса."""
+        n = max(months_total, len(monthly_qty))
+        if n == 0:
+            return None, None
+        mean = sum(monthly_qty) / n
+        if not mean:
+            return None, None
+        variance = sum((q - mean) ** 2 for q in monthly_qty) + (n - len(monthly_qty)) * mean ** 2
+        cv = (variance / n) ** 0.5 / mean
+        if cv <= 0.10:
+            cls = "X"
+        elif cv <= 0.25:
+            cls = "Y"
+        else:
+            cls = "Z"
+        return round(cv, 4), cls
 
 
-class CentralStockView(APIView):
+class CentralStockView(ConditionalGetMixin, ConcurrentQueriesMixin, APIView):
     """
     Общие остатки на центральном складе
     GET /api/reports/central-stock/
@@ -1615,14 +2095,19 @@ class CentralStockView(APIView):
         &direction=desc|asc          # направление сортировки (по умолчанию desc)
         &limit=1000                  # ограничение строк (только для group_by=product)
 
+    Цена остатка — скользящая средневзвешенная себестоимость, её пересчитывают проводки
+    приходов и перемещений (api.stock.blend_cost); на дату и по FIFO — reports/stock-valuation/.
+
     Возвращает:
       - по товарам: product_id, product_name, unit_type, category, qty, avg_price, value
       - по категориям (group_by=category): category_id, category_name, qty, value, avg_price
       - totals: общий qty и value
+    Строки отчёта и тоталы — независимые запросы (см. CentralStockAsyncView).
     """
     permission_classes = [IsAuthenticated]
+    conditional_sources = ((WarehouseProduct, None), (Warehouse, None), (Product, None), (ProductCategory, None))
 
-    def get(self, request):
+    def prepare(self, request):
         # -------- параметры
         warehouse_id = request.query_params.get("warehouse")
         category_id = request.query_params.get("category")
@@ -1638,12 +2123,13 @@ class CentralStockView(APIView):
         limit = max(1, min(limit, 10000))
 
         # -------- определяем "центральный" склад, если warehouse не задан
+        # склады — из справочника в памяти процесса, без запроса к БД
         warehouse = None
         if warehouse_id:
-            warehouse = Warehouse.objects.filter(pk=warehouse_id).first()
+            warehouse = refcache.WAREHOUSES.get(warehouse_id)
         if not warehouse:
             # на крайний случай — первый склад в системе
-            warehouse = Warehouse.objects.order_by("id").first()
+            warehouse = refcache.default_warehouse()
 
         if not warehouse:
             return Response({"detail": "Склад не найден. Задайте ?warehouse=ID или создайте склад."}, status=400)
@@ -1677,9 +2163,50 @@ class CentralStockView(APIView):
                     value=Coalesce(Sum(line_value), zero_dec),
                 )
             )
+        else:  # group_by == "product"
+            # на складе одна строка на товар — без GROUP BY; сортируем в БД, чтобы limit брал верхние строки
+            sort_key = {"qty": "qty", "name": "product__name"}.get(order_by, "value")
+            grouped = (
+                qs.values(
+                    "product_id",
+                    "product__name",
+                    "product__unit_type",
+                    "product__category_id",
+                    "product__category__name",
+                    "price",
+                )
+                .annotate(qty=F("count"), value=line_value)
+                .order_by(F(sort_key).asc() if direction == "asc" else F(sort_key).desc(), "product_id")
+            )[:limit]
+
+        context = {
+            "warehouse": {"id": warehouse.id, "name": warehouse.name},
+            "group_by": group_by,
+            "filters": {
+                "category": category_id,
+                "product_ids": product_ids or None,
+                "include_zero": include_zero,
+                "order_by": order_by,
+                "direction": direction,
+            },
+        }
+        return context, {
+            "grouped": lambda: list(grouped),
+            # -------- тоталы
+            "totals": lambda: qs.aggregate(
+                sum_qty=Coalesce(Sum("count"), 0),
+                sum_value=Coalesce(Sum(line_value), zero_dec),
+            ),
+        }
+
+    def build_response(self, context, results):
+        order_by = context["filters"]["order_by"]
+        direction = context["filters"]["direction"]
+
+        if context["group_by"] == "category":
             # средняя цена по категории = value / qty
             rows = []
-            for r in grouped:
+            for r in results["grouped"]:
                 qty = r["qty"] or 0
                 value = r["value"] or Decimal("0")
                 rows.append({
@@ -1698,27 +2225,11 @@ class CentralStockView(APIView):
             rows.sort(key=key_map.get(order_by, key_map["value"]), reverse=(direction != "asc"))
 
         else:  # group_by == "product"
-            grouped = (
-                qs.values(
-                    "product_id",
-                    "product__name",
-                    "product__unit_type",
-                    "product__category_id",
-                    "product__category__name",
-                )
-                .annotate(
-                    qty=Coalesce(Sum("count"), 0),
-                    value=Coalesce(Sum(line_value), zero_dec),
-                    # средняя цена = сумм(цена*кол-во)/сумм(кол-во)
-                    weighted_price_num=Coalesce(Sum(line_value), zero_dec),
-                    weighted_price_den=Coalesce(Sum("count"), 0),
-                )
-            )
             rows = []
-            for r in grouped[:limit]:
+            for r in results["grouped"]:
                 qty = r["qty"] or 0
                 value = r["value"] or Decimal("0")
-                avg_price = (r["weighted_price_num"] / r["weighted_price_den"]) if r["weighted_price_den"] else None
+                avg_price = r["price"] if qty else None
                 rows.append({
                     "product_id": r["product_id"],
                     "product_name": r["product__name"],
@@ -1736,32 +2247,19 @@ class CentralStockView(APIView):
             }
             rows.sort(key=key_map.get(order_by, key_map["value"]), reverse=(direction != "asc"))
 
-        # -------- тоталы
-        totals_qs = qs.aggregate(
-            sum_qty=Coalesce(Sum("count"), 0),
-            sum_value=Coalesce(Sum(line_value), zero_dec),
-        )
         totals = {
-            "sum_qty": totals_qs["sum_qty"] or 0,
-            "sum_value": totals_qs["sum_value"] or Decimal("0"),
+            "sum_qty": results["totals"]["sum_qty"] or 0,
+            "sum_value": results["totals"]["sum_value"] or Decimal("0"),
         }
 
-        return Response({
-            "warehouse": {"id": warehouse.id, "name": warehouse.name},
-            "group_by": group_by,
-            "filters": {
-                "category": category_id,
-                "product_ids": product_ids or None,
-                "include_zero": include_zero,
-                "order_by": order_by,
-                "direction": direction,
-            },
+        return {
+            **context,
             "totals": totals,
             "results": rows,
-        })
+        }
 
 
-class StocksByWarehouseDealerView(APIView):
+class StocksByWarehouseDealerView(ConditionalGetMixin, APIView):
     """
     Остатки по складам/дилерам
     GET /api/reports/stocks-by-warehouse-dealer/
@@ -1784,6 +2282,7 @@ class StocksByWarehouseDealerView(APIView):
       totals: sum_qty, sum_value
     """
     permission_classes = [IsAuthenticated]
+    conditional_sources = ((WarehouseProduct, None), (Warehouse, None), (Product, None), (ProductCategory, None))
 
     def get(self, request):
         group_by = request.query_params.get("group_by", "warehouse")  # warehouse|dealer|warehouse_product
@@ -1876,7 +2375,7 @@ class StocksByWarehouseDealerView(APIView):
                 .annotate(
                     qty=Coalesce(Sum("count"), 0),
                     value=Coalesce(Sum(line_value), zero_dec),
-                    skus=Count("product_id", distinct=True),
+                    skus=Count("product_id"),
                     dealers=Count("warehouse__responsible_id", distinct=True),
                 )
             )
@@ -1903,14 +2402,13 @@ class StocksByWarehouseDealerView(APIView):
             rows = tmp[:limit]
 
         else:  # group_by == "warehouse_product" (детализация)
+            # строка остатка уникальна по (склад, товар) — группировать нечего
             grouped = (
                 qs.values("warehouse_id", "warehouse__name",
                           "product_id", "product__name", "product__unit_type",
                           "product__category_id", "product__category__name")
-                .annotate(
-                    qty=Coalesce(Sum("count"), 0),
-                    value=Coalesce(Sum(line_value), zero_dec),
-                )
+                .annotate(qty=F("count"), value=line_value)
+                .order_by("warehouse_id", "product_id")
             )
             tmp = []
             for r in grouped[:limit]:
@@ -1955,7 +2453,7 @@ class StocksByWarehouseDealerView(APIView):
         })
 
 
-class ForecastShortagesView(APIView):
+class ForecastShortagesView(ConditionalGetMixin, ConcurrentQueriesMixin, APIView):
     """
     Прогнозируемые дефициты
     GET /api/reports/forecast-shortages/
@@ -1964,6 +2462,8 @@ class ForecastShortagesView(APIView):
         &product=ID&product=...         # несколько конкретных товаров
         &window_days=60                 # окно для расчёта средней дневной потребности (по умолчанию 60)
         &threshold_days=14              # минимальный запас покрытия в днях (по умолчанию 14)
+        &basis=threshold|reorder|any    # что считать дефицитом: покрытие < threshold_days (по умолчанию),
+                                        # остаток + в пути < точки заказа (compute_reorder_points) или любое
         &include_incoming=true|false    # учитывать будущие приходы (Income pending/active), по умолчанию true
         &status_out=finished            # какой статус Outcome считать потреблением (по умолчанию finished)
         &min_total_usage=0              # отсечь «шум»: мин. суммарное потребление в окне
@@ -1976,16 +2476,22 @@ class ForecastShortagesView(APIView):
       - warehouse_id/name, product_id/name/category/unit
       - stock_qty, incoming_qty, daily_rate, days_of_cover, depletion_date
       - recommended_qty (сколько докупить до threshold_days покрытия)
+      - safety_stock, reorder_point, below_reorder (сохранённые api.reorder)
+    Остатки, потребление и будущие приходы — независимые запросы (см. ForecastShortagesAsyncView).
     """
     permission_classes = [IsAuthenticated]
+    conditional_sources = ((WarehouseProduct, None), (Outcome, None), (Income, None), (Product, None))
 
-    def get(self, request):
+    def prepare(self, request):
         # --- параметры
         warehouse_id = request.query_params.get("warehouse")
         category_id = request.query_params.get("category")
         product_ids = request.query_params.getlist("product")
         window_days = int(request.query_params.get("window_days", 60))
         threshold_days = int(request.query_params.get("threshold_days", 14))
+        basis = request.query_params.get("basis", "threshold")
+        if basis not in ("threshold", "reorder", "any"):
+            basis = "threshold"
         include_incoming = request.query_params.get("include_incoming", "true").lower() == "true"
         status_out = request.query_params.get("status_out", Outcome.Status.finished)
         min_total_usage = int(request.query_params.get("min_total_usage", 0))
@@ -2010,28 +2516,34 @@ class ForecastShortagesView(APIView):
         if product_ids:
             stock_qs = stock_qs.filter(product_id__in=product_ids)
 
-        stock_agg = (
-            stock_qs.values(
-                "warehouse_id", "warehouse__name",
-                "product_id", "product__name", "product__unit_type",
-                "product__category_id", "product__category__name",
-            )
-            .annotate(stock_qty=Coalesce(Sum("count"), 0))
+        # одна строка на (склад, товар) — остаток читается как есть, без GROUP BY
+        stock_agg = reorder.below_reorder(stock_qs).values(
+            "warehouse_id", "warehouse__name",
+            "product_id", "product__name", "product__unit_type",
+            "product__category_id", "product__category__name",
+            "safety_stock", "reorder_point", "below_reorder",
+            stock_qty=F("count"),
         )
-        # dict ключ: (w,p)
-        stock_map = {}
-        for r in stock_agg:
-            key = (r["warehouse_id"], r["product_id"])
-            stock_map[key] = {
-                "warehouse_id": r["warehouse_id"],
-                "warehouse_name": r["warehouse__name"],
-                "product_id": r["product_id"],
-                "product_name": r["product__name"],
-                "unit_type": r["product__unit_type"],
-                "category_id": r["product__category_id"],
-                "category_name": r["product__category__name"],
-                "stock_qty": r["stock_qty"] or 0,
-            }
+
+        def stock_map():
+            # dict ключ: (w,p)
+            result = {}
+            for r in stock_agg:
+                key = (r["warehouse_id"], r["product_id"])
+                result[key] = {
+                    "warehouse_id": r["warehouse_id"],
+                    "warehouse_name": r["warehouse__name"],
+                    "product_id": r["product_id"],
+                    "product_name": r["product__name"],
+                    "unit_type": r["product__unit_type"],
+                    "category_id": r["product__category_id"],
+                    "category_name": r["product__category__name"],
+                    "stock_qty": r["stock_qty"] or 0,
+                    "safety_stock": r["safety_stock"],
+                    "reorder_point": r["reorder_point"],
+                    "below_reorder": bool(r["below_reorder"]),
+                }
+            return result
 
         # --- 2) Потребление (OutcomeItem) за окно
         out_qs = OutcomeItem.objects.select_related("outcome", "product")
@@ -2052,10 +2564,12 @@ class ForecastShortagesView(APIView):
             .values("outcome__warehouse_id", "product_id")
             .annotate(total_usage=Coalesce(Sum("count"), 0))
         )
-        usage_map = {(r["outcome__warehouse_id"], r["product_id"]): r["total_usage"] for r in usage_agg}
+        queries = {
+            "stock": stock_map,
+            "usage": lambda: {(r["outcome__warehouse_id"], r["product_id"]): r["total_usage"] for r in usage_agg},
+        }
 
         # --- 3) Будущие приходы (IncomeItem) pending/active
-        incoming_map = {}
         if include_incoming:
             inc_qs = IncomeItem.objects.select_related("income", "product")
             if warehouse_id:
@@ -2070,7 +2584,38 @@ class ForecastShortagesView(APIView):
                 inc_qs.values("income__warehouse_id", "product_id")
                 .annotate(incoming_qty=Coalesce(Sum("count"), 0))
             )
-            incoming_map = {(r["income__warehouse_id"], r["product_id"]): r["incoming_qty"] for r in inc_agg}
+            queries["incoming"] = lambda: {
+                (r["income__warehouse_id"], r["product_id"]): r["incoming_qty"] for r in inc_agg
+            }
+
+        context = {
+            "warehouse": warehouse_id,
+            "category": category_id,
+            "product_ids": product_ids or None,
+            "window_days": window_days,
+            "threshold_days": threshold_days,
+            "basis": basis,
+            "include_incoming": include_incoming,
+            "status_out": status_out,
+            "min_total_usage": min_total_usage,
+            "include_zero_demand": include_zero_demand,
+            "order_by": order_by, "direction": direction,
+            "limit": limit,
+            "today": today,
+        }
+        return context, queries
+
+    def build_response(self, context, results):
+        window_days = context["window_days"]
+        threshold_days = context["threshold_days"]
+        include_incoming = context["include_incoming"]
+        basis = context["basis"]
+        min_total_usage = context["min_total_usage"]
+        include_zero_demand = context["include_zero_demand"]
+        today = context["today"]
+        stock_map = results["stock"]
+        usage_map = results["usage"]
+        incoming_map = results.get("incoming", {})
 
         # --- 4) Собираем позиции (только те, что есть на складе или были продажи/приходы в окне)
         keys = set(stock_map.keys()) | set(usage_map.keys()) | set(incoming_map.keys())
@@ -2082,7 +2627,7 @@ class ForecastShortagesView(APIView):
                 "warehouse_id": w_id, "warehouse_name": None,
                 "product_id": p_id, "product_name": None,
                 "unit_type": None, "category_id": None, "category_name": None,
-                "stock_qty": 0
+                "stock_qty": 0, "safety_stock": 0, "reorder_point": 0, "below_reorder": False,
             })
             stock_qty = int(base["stock_qty"] or 0)
             used = int(usage_map.get(key, 0) or 0)
@@ -2121,6 +2666,11 @@ class ForecastShortagesView(APIView):
             else:
                 # нет спроса — дефицит не отмечаем (если include_zero_demand=false мы сюда не попадём)
                 is_short = False
+            # точка заказа уже сравнена в запросе (count + in_transit < reorder_point)
+            if basis == "reorder":
+                is_short = base["below_reorder"]
+            elif basis == "any":
+                is_short = is_short or base["below_reorder"]
 
             if not is_short:
                 # показывать только риск-дефициты; если нужно видеть все — добавим флаг позже
@@ -2160,27 +2710,39 @@ class ForecastShortagesView(APIView):
             "stock": key_stock,
             "doc": key_doc,
         }
-        rows.sort(key=key_map.get(order_by, key_days), reverse=(direction == "desc"))
+        order_by = context["order_by"]
+        rows.sort(key=key_map.get(order_by, key_days), reverse=(context["direction"] == "desc"))
 
-        return Response({
-            "filters": {
-                "warehouse": warehouse_id,
-                "category": category_id,
-                "product_ids": product_ids or None,
-                "window_days": window_days,
-                "threshold_days": threshold_days,
-                "include_incoming": include_incoming,
-                "status_out": status_out,
-                "min_total_usage": min_total_usage,
-                "include_zero_demand": include_zero_demand,
-                "order_by": order_by, "direction": direction,
-            },
+        limit = context["limit"]
+        filters = {k: v for k, v in context.items() if k not in ("limit", "today")}
+        return {
+            "filters": filters,
             "count": min(len(rows), limit),
             "results": rows[:limit],
-        })
+        }
+
+
+class SalesVolumeCompareAsyncView(AsyncReportView):
+    """SalesVolumeCompareView для ASGI: четыре агрегата выполняются одновременно."""
+    report_view = SalesVolumeCompareView
+
+
+class SalesGeographyAsyncView(AsyncReportView):
+    """SalesGeographyView для ASGI: разрез по складам и итоги — одновременно."""
+    report_view = SalesGeographyView
+
+
+class CentralStockAsyncView(AsyncReportView):
+    """CentralStockView для ASGI: строки и тоталы — одновременно."""
+    report_view = CentralStockView
+
+
+class ForecastShortagesAsyncView(AsyncReportView):
+    """ForecastShortagesView для ASGI: остатки, потребление и приходы — одновременно."""
+    report_view = ForecastShortagesView
 
 
-class PlanVsActualView(APIView):
+class PlanVsActualView(ConditionalGetMixin, APIView):
     """
     План продаж vs. Фактические продажи (по месяцам/дилерам/регионам)
     GET /api/reports/plan-vs-actual/
@@ -2196,6 +2758,7 @@ class PlanVsActualView(APIView):
 
     Логика:
       - Факт: OutcomeItem по периодам (TruncMonth(outcome.created)), сумма = count*price.
+              Если date_to покрыт api_sales_daily_mv — факт берётся из неё (source=materialized).
       - План: Report (status=confirmed), месяц берём из Report.period (1..12),
               год — из Report.created.year. Сумма = sum(ReportItem.count * Product.price).
       - При dimension=dealer план привязывается к Report.client.
@@ -2212,6 +2775,9 @@ class PlanVsActualView(APIView):
       }
     """
     permission_classes = [IsAuthenticated]
+    conditional_sources = (
+        (Outcome, "created"), (Report, None), (ReportItem, None), (Warehouse, None), (ReportViewRefresh, None),
+    )
 
     def get(self, request):
         # -------- параметры
@@ -2229,24 +2795,9 @@ class PlanVsActualView(APIView):
             limit = 200
         limit = max(1, min(limit, 2000))
 
-        # -------- факт из OutcomeItem
-        amount_expr = ExpressionWrapper(
-            F("count") * F("price"),
-            output_field=DecimalField(max_digits=20, decimal_places=2),
-        )
+        # -------- факт из OutcomeItem (или из api_sales_daily_mv)
         zero_dec = Value(0, output_field=DecimalField(max_digits=20, decimal_places=2))
-
-        fact_qs = OutcomeItem.objects.select_related("outcome", "product", "outcome__client", "outcome__warehouse")
-        if status:
-            fact_qs = fact_qs.filter(outcome__status=status)
-        if date_from:
-            fact_qs = fact_qs.filter(outcome__created__date__gte=date_from)
-        if date_to:
-            fact_qs = fact_qs.filter(outcome__created__date__lte=date_to)
-        if client_ids:
-            fact_qs = fact_qs.filter(outcome__client_id__in=client_ids)
-        if warehouse_id:
-            fact_qs = fact_qs.filter(outcome__warehouse_id=warehouse_id)
+        source = _sales_source(date_from, date_to)
 
         # поля группировки по измерению
         dim_values = []
@@ -2257,16 +2808,7 @@ class PlanVsActualView(APIView):
         else:
             dim_values = []  # none
 
-        fact_grouped = (
-            fact_qs.annotate(period=TruncMonth("outcome__created"))
-            .values("period", *dim_values)
-            .annotate(
-                actual_qty=Coalesce(Sum("count"), 0),
-                actual_amount=Coalesce(Sum(amount_expr), zero_dec),
-                actual_orders=Count("outcome_id", distinct=True),
-            )
-            .order_by("period")
-        )
+        fact_grouped = _monthly_sales(source, date_from, date_to, status, client_ids, warehouse_id, dim_values)
 
         # -------- план из Report / ReportItem
         # report.period = месяц (1..12), report.created.year = год плана
@@ -2354,8 +2896,7 @@ class PlanVsActualView(APIView):
         # собираем итоговые строки
         bucket = {}
         for r in fact_grouped:
-            p = r["period"]
-            pkey = p.date().isoformat() if hasattr(p, "date") else p
+            pkey = _period_key(r["period"])
             dkey = dim_key_from_fact(r)
             key = (pkey, dkey)
 
@@ -2461,6 +3002,7 @@ class PlanVsActualView(APIView):
                 "warehouse": warehouse_id,
             },
             "count": len(rows),
+            "source": source,
             "results": rows,
             "notes": [
                 "План берётся из Report(status=confirmed), месяц = Report.period (1..12), год = Report.created.year.",
@@ -2470,7 +3012,7 @@ class PlanVsActualView(APIView):
         })
 
 
-class PlanAchievementView(APIView):
+class PlanAchievementView(ConditionalGetMixin, APIView):
     """
     Выполнение плана в процентах
     GET /api/reports/plan-achievement/
@@ -2496,9 +3038,11 @@ class PlanAchievementView(APIView):
 
     Примечания:
       - План: сумма = ∑(ReportItem.count × Product.price); qty = ∑ ReportItem.count; orders = кол-во Report.
+      - Факт за диапазон, целиком покрытый api_sales_daily_mv, берётся из неё (source в ответе).
       - Для разреза по складам планов нет — используйте /plan-vs-actual (dimension=warehouse) для факта.
     """
     permission_classes = [IsAuthenticated]
+    conditional_sources = ((Outcome, "created"), (Report, None), (ReportItem, None), (ReportViewRefresh, None))
 
     def get(self, request):
         # ---- параметры
@@ -2517,21 +3061,8 @@ class PlanAchievementView(APIView):
         limit = max(1, min(limit, 2000))
 
         # ---- ФАКТ
-        amount_expr = ExpressionWrapper(
-            F("count") * F("price"),
-            output_field=DecimalField(max_digits=20, decimal_places=2),
-        )
         zero_dec = Value(0, output_field=DecimalField(max_digits=20, decimal_places=2))
-
-        fact_qs = OutcomeItem.objects.select_related("outcome", "outcome__client")
-        if status:
-            fact_qs = fact_qs.filter(outcome__status=status)
-        if date_from:
-            fact_qs = fact_qs.filter(outcome__created__date__gte=date_from)
-        if date_to:
-            fact_qs = fact_qs.filter(outcome__created__date__lte=date_to)
-        if client_ids:
-            fact_qs = fact_qs.filter(outcome__client_id__in=client_ids)
+        source = _sales_source(date_from, date_to)
 
         dim_fields = []
         if dimension == "dealer":
@@ -2541,15 +3072,7 @@ class PlanAchievementView(APIView):
                 "outcome__client__last_name",
             ]
 
-        fact_rows = (
-            fact_qs.annotate(period=TruncMonth("outcome__created"))
-            .values("period", *dim_fields)
-            .annotate(
-                actual_qty=Coalesce(Sum("count"), 0),
-                actual_amount=Coalesce(Sum(amount_expr), zero_dec),
-                actual_orders=Count("outcome_id", distinct=True),
-            )
-        )
+        fact_rows = _monthly_sales(source, date_from, date_to, status, client_ids, None, dim_fields)
 
         # ---- ПЛАН (Report.confirmed)
         plan_qs = Report.objects.filter(status=Report.Status.confirmed)
@@ -2608,8 +3131,7 @@ class PlanAchievementView(APIView):
 
         fact_map = {}
         for r in fact_rows:
-            p = r["period"]
-            pkey = p.date().isoformat() if hasattr(p, "date") else p
+            pkey = _period_key(r["period"])
             if dimension == "dealer":
                 cid = r.get("outcome__client_id")
                 dkey = ("dealer", cid)
@@ -2694,6 +3216,7 @@ class PlanAchievementView(APIView):
             "dimension": dimension,
             "metric": metric,
             "count": len(rows),
+            "source": source,
             "results": rows,
         })
 
@@ -2705,7 +3228,7 @@ def _display_name(first_name, last_name, cid):
     return disp
 
 
-class OrdersCountView(APIView):
+class OrdersCountView(ConditionalGetMixin, APIView):
     """
     Количество заказов в периоде
     GET /api/reports/orders-count/
@@ -2719,6 +3242,7 @@ class OrdersCountView(APIView):
     Возвращает список периодов с количеством заказов по статусам и итого.
     """
     permission_classes = [IsAuthenticated]
+    conditional_sources = ((Order, "created"),)
 
     def get(self, request):
         group_by = request.query_params.get("group_by", "day")
@@ -2794,7 +3318,7 @@ class OrdersCountView(APIView):
         })
 
 
-class AverageOrderAmountView(APIView):
+class AverageOrderAmountView(ConditionalGetMixin, APIView):
     """
     Средняя сумма заказа
     GET /api/reports/average-order-amount/
@@ -2819,6 +3343,7 @@ class AverageOrderAmountView(APIView):
       }
     """
     permission_classes = [IsAuthenticated]
+    conditional_sources = ((Outcome, "created"), (Warehouse, None))
 
     def get(self, request):
         # ---- параметры
@@ -2837,51 +3362,36 @@ class AverageOrderAmountView(APIView):
             limit = 500
         limit = max(1, min(limit, 2000))
 
-        # ---- база
-        qs = OutcomeItem.objects.select_related("outcome", "outcome__client", "outcome__warehouse")
-        if status:
-            qs = qs.filter(outcome__status=status)
-        if date_from:
-            qs = qs.filter(outcome__created__date__gte=date_from)
-        if date_to:
-            qs = qs.filter(outcome__created__date__lte=date_to)
-        if client_ids:
-            qs = qs.filter(outcome__client_id__in=client_ids)
-        if warehouse_id:
-            qs = qs.filter(outcome__warehouse_id=warehouse_id)
-
-        # выражения ORM
-        amount_expr = ExpressionWrapper(
-            F("count") * F("price"),
-            output_field=DecimalField(max_digits=20, decimal_places=2),
-        )
+        # ---- база: шапки Outcome, сумма документа уже посчитана по строкам (api.totals)
+        qs = _outcome_headers(date_from, date_to, status, warehouse_id, client_ids)
         zero_dec = Value(0, output_field=DecimalField(max_digits=20, decimal_places=2))
 
         # поля группировки
         time_annot = None
         if group_by == "day":
-            time_annot = TruncDay("outcome__created")
+            time_annot = TruncDay("created")
         elif group_by == "week":
-            time_annot = TruncWeek("outcome__created")
+            time_annot = TruncWeek("created")
         elif group_by == "month":
-            time_annot = TruncMonth("outcome__created")
+            time_annot = TruncMonth("created")
 
-        values = []
+        periods = []
         if time_annot is not None:
             qs = qs.annotate(period=time_annot)
-            values.append("period")
+            periods.append("period")
 
+        dims = []
         if dimension == "dealer":
-            values += ["outcome__client_id", "outcome__client__first_name", "outcome__client__last_name"]
+            dims = ["outcome__client_id", "outcome__client__first_name", "outcome__client__last_name"]
         elif dimension == "warehouse":
-            values += ["outcome__warehouse_id", "outcome__warehouse__name"]
+            dims = ["outcome__warehouse_id", "outcome__warehouse__name"]
 
-        # агрегация
+        # агрегация (ключи строк — как у прежнего запроса по OutcomeItem)
         grouped = (
-            qs.values(*values)
+            qs.values(*periods, **{f: F(f.removeprefix("outcome__")) for f in dims})
             .annotate(
-                total_amount=Coalesce(Sum(amount_expr), zero_dec),
-                orders=Count("outcome_id", distinct=True),
+                total_amount=Coalesce(Sum("total_amount"), zero_dec),
+                orders=Count("id"),
             )
         )
 
@@ -2950,7 +3460,7 @@ class AverageOrderAmountView(APIView):
         })
 
 
-class MostOrderedProductsView(APIView):
+class MostOrderedProductsView(ConditionalGetMixin, APIView):
     """
     Самые часто заказываемые позиции
     GET /api/reports/most-ordered-products/
@@ -2961,6 +3471,7 @@ class MostOrderedProductsView(APIView):
         &status=pending|collected|delivered|...   # фильтр по статусу заказа
         &metric=orders|qty|amount                 # сортировка (по умолчанию orders)
         &limit=50
+        &per=dealer|category|warehouse            # топ-N внутри каждого дилера / категории / склада
 
     Возвращает список товаров с метриками:
       - product_id, product_name, unit_type, category
@@ -2968,10 +3479,19 @@ class MostOrderedProductsView(APIView):
       - total_qty: общее количество по всем заказам
       - total_amount: сумма (qty × price)
       - share_orders_pct: доля товара в общем числе заказов
+
+    С ?per= ответ — groups: [{group: {type, id, name}, results: [...]}].
+    Заказы без склада в per=warehouse не попадают.
     """
     permission_classes = [IsAuthenticated]
+    conditional_sources = ((Order, "created"), (Product, None), (ProductCategory, None))
 
     def get(self, request):
+        per = request.query_params.get("per")
+        group_fields = _per_group_fields(per, "order")
+        if per and group_fields is None:
+            return Response({"detail": "per должен быть dealer|category|warehouse"}, status=400)
+        group_fields = group_fields if per else ()
         date_from = request.query_params.get("date_from")
         date_to = request.query_params.get("date_to")
         client_id = request.query_params.get("client")
@@ -2995,6 +3515,8 @@ class MostOrderedProductsView(APIView):
             qs = qs.filter(order__warehouse_id=warehouse_id)
         if status:
             qs = qs.filter(order__status=status)
+        if per == "warehouse":
+            qs = qs.filter(order__warehouse__isnull=False)
 
         amount_expr = ExpressionWrapper(
             F("count") * F("price"),
@@ -3004,7 +3526,7 @@ class MostOrderedProductsView(APIView):
 
         grouped = (
             qs.values("product_id", "product__name", "product__unit_type",
-                      "product__category_id", "product__category__name")
+                      "product__category_id", "product__category__name", *group_fields)
             .annotate(
                 total_qty=Coalesce(Sum("count"), 0),
                 total_amount=Coalesce(Sum(amount_expr), zero_dec),
@@ -3032,13 +3554,9 @@ class MostOrderedProductsView(APIView):
             "amount": "-total_amount",
             "orders": "-orders",
         }.get(metric, "-orders")
-        grouped = grouped.order_by(order_key)
 
-        results = []
-        for i, r in enumerate(grouped[:limit], start=1):
-            share_orders = (r["orders"] * 100.0 / total_orders_count) if total_orders_count else None
-            results.append({
-                "rank": i,
+        def make_item(r):
+            return {
                 "product_id": r["product_id"],
                 "product_name": r["product__name"],
                 "unit_type": r["product__unit_type"],
@@ -3047,22 +3565,250 @@ class MostOrderedProductsView(APIView):
                 "total_qty": r["total_qty"],
                 "total_amount": r["total_amount"],
                 "orders": r["orders"],
-                "share_orders_pct": share_orders,
+                "share_orders_pct": (r["orders"] * 100.0 / total_orders_count) if total_orders_count else None,
+            }
+
+        filters = {
+            "date_from": date_from, "date_to": date_to,
+            "client": client_id, "warehouse": warehouse_id,
+            "status": status,
+        }
+
+        if per:
+            rows = _top_per_group(
+                grouped, group_fields[0],
+                [F(order_key[1:]).desc(), F("product__name").asc()], limit,
+            )
+            groups = _split_groups(rows, per, group_fields, make_item)
+            return Response({
+                "metric": metric,
+                "per": per,
+                "limit": limit,
+                "filters": filters,
+                "total_orders": total_orders_count,
+                "count": len(groups),
+                "groups": groups,
             })
 
+        results = []
+        for i, r in enumerate(grouped.order_by(order_key)[:limit], start=1):
+            results.append({"rank": i, **make_item(r)})
+
         return Response({
             "metric": metric,
-            "filters": {
-                "date_from": date_from, "date_to": date_to,
-                "client": client_id, "warehouse": warehouse_id,
-                "status": status,
-            },
+            "filters": filters,
             "total_orders": total_orders_count,
             "count": len(results),
             "results": results,
         })
 
 
+def _valuation_params(request):
+    """Общие параметры отчётов оценки: method, склады, товары, лимит. ValueError — на неверные значения."""
+    method = request.query_params.get("method", valuation.AVERAGE)
+    if method not in valuation.METHODS:
+        raise ValueError(f"method: {' | '.join(valuation.METHODS)}")
+    try:
+        warehouse_ids = [int(pk) for pk in request.query_params.getlist("warehouse")]
+        product_ids = [int(pk) for pk in request.query_params.getlist("product")]
+        limit = max(1, min(int(request.query_params.get("limit", 1000)), 10000))
+    except ValueError:
+        raise ValueError("warehouse, product и limit — целые числа")
+    group_by = request.query_params.get("group_by", "product")  # product|warehouse
+    if group_by not in ("product", "warehouse"):
+        group_by = "product"
+    return method, warehouse_ids, product_ids, group_by, limit
+
+
+def _query_date(request, name):
+    """Дата из query string (YYYY-MM-DD, как у фильтров __date: допускается 2024-1-5) или None."""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f"{name}: дата в формате YYYY-MM-DD")
+    return parsed
+
+
+def _valuation_names(rows, group_by):
+    """Имена складов и товаров — из справочника в памяти; group_by=warehouse сворачивает товары."""
+    warehouses = refcache.WAREHOUSES.get_many({row["warehouse"] for row in rows})
+    products = refcache.PRODUCTS.get_many({row["product"] for row in rows})
+    if group_by == "warehouse":
+        grouped = {}
+        for row in rows:
+            total = grouped.setdefault(row["warehouse"], {"warehouse": row["warehouse"]})
+            for key, value in row.items():
+                if key not in ("warehouse", "product", "unit_cost"):
+                    total[key] = total.get(key, 0) + (value or 0)
+        rows = list(grouped.values())
+    for row in rows:
+        warehouse = warehouses.get(row["warehouse"])
+        row["warehouse_name"] = warehouse.name if warehouse else None
+        if "product" in row:
+            product = products.get(row["product"])
+            row["product_name"] = product.name if product else None
+            row["product_code"] = product.code if product else None
+    return rows
+
+
+class StockValuationView(ConditionalGetMixin, APIView):
+    """
+    Стоимость запасов по себестоимости
+    GET /api/v1/reports/stock-valuation/
+        ?method=average|fifo            # скользящая средняя (по умолчанию) или FIFO-партии
+        &date=YYYY-MM-DD                # на конец дня; без даты — на текущий момент
+        &warehouse=ID&warehouse=...     # склады (по умолчанию все)
+        &product=ID&product=...
+        &group_by=product|warehouse
+        &limit=1000
+
+    average без date читается из остатков (count × средняя цена, её ведут проводки —
+    source=stock); иначе история приходов, расходов и перемещений проигрывается одним
+    проходом по складам (api.valuation, source=history).
+    Строки: warehouse, product, qty, value, unit_cost; totals — qty и value.
+    """
+    permission_classes = [IsAuthenticated]
+    conditional_sources = ((WarehouseProduct, None), (Income, None), (Outcome, None), (Movement, None))
+
+    def get(self, request):
+        try:
+            method, warehouse_ids, product_ids, group_by, limit = _valuation_params(request)
+            on_date = _query_date(request, "date")
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if method == valuation.AVERAGE and on_date is None:
+            source = "stock"
+            qs = WarehouseProduct.objects.filter(warehouse__isnull=False).exclude(count=0)
+            if warehouse_ids:
+                qs = qs.filter(warehouse_id__in=warehouse_ids)
+            if product_ids:
+                qs = qs.filter(product_id__in=product_ids)
+            rows = [
+                {"warehouse": w, "product": p, "qty": qty, "value": (price * qty).quantize(Decimal("0.01")),
+                 "unit_cost": price}
+                for w, p, qty, price in qs.order_by().values_list("warehouse_id", "product_id", "count", "price")
+            ]
+        else:
+            source = "history"
+            rows = [
+                {key: row[key] for key in ("warehouse", "product", "qty", "value", "unit_cost")}
+                for row in valuation.replay(method, warehouse_ids, product_ids, date_to=on_date) if row["qty"]
+            ]
+
+        rows = _valuation_names(rows, group_by)
+        rows.sort(key=lambda row: row["value"], reverse=True)
+        return Response({
+            "filters": {"method": method, "date": on_date, "warehouse": warehouse_ids or None,
+                        "product": product_ids or None, "group_by": group_by},
+            "source": source,
+            "totals": {"qty": sum(row["qty"] for row in rows), "value": sum(row["value"] for row in rows)},
+            "count": min(len(rows), limit),
+            "results": rows[:limit],
+        })
+
+
+class CostOfGoodsSoldView(ConditionalGetMixin, APIView):
+    """
+    Себестоимость продаж и валовая маржа
+    GET /api/v1/reports/cogs/
+        ?date_from=YYYY-MM-DD&date_to=YYYY-MM-DD    # по моменту списания расхода
+        &method=average|fifo
+        &warehouse=ID&warehouse=...
+        &product=ID&product=...
+        &group_by=product|warehouse
+        &limit=1000
+
+    average — сумма count × cost строк расходов (себестоимость ставится при проводке)
+    одним GROUP BY; строки, проведённые до учёта себестоимости, попадают в uncosted_qty
+    (их заполняет команда rebuild_costs). fifo — проигрывание истории (api.valuation).
+    Строки: sold_qty, revenue, cogs, margin, margin_pct, uncosted_qty.
+    """
+    permission_classes = [IsAuthenticated]
+    conditional_sources = ((Outcome, None), (Income, None), (Movement, None))
+
+    def get(self, request):
+        try:
+            method, warehouse_ids, product_ids, group_by, limit = _valuation_params(request)
+            date_from, date_to = _query_date(request, "date_from"), _query_date(request, "date_to")
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if method == valuation.AVERAGE:
+            qs = (OutcomeItem.objects.filter(outcome__status=Outcome.Status.finished, outcome__warehouse__isnull=False)
+                  .annotate(posted=Coalesce("outcome__finished_at", "outcome__created")))
+            if date_from:
+                qs = qs.filter(posted__date__gte=date_from)
+            if date_to:
+                qs = qs.filter(posted__date__lte=date_to)
+            if warehouse_ids:
+                qs = qs.filter(outcome__warehouse_id__in=warehouse_ids)
+            if product_ids:
+                qs = qs.filter(product_id__in=product_ids)
+            money = DecimalField(max_digits=20, decimal_places=2)
+            zero = Value(0, output_field=money)
+            rows = [
+                {"warehouse": r["outcome__warehouse_id"], "product": r["product_id"], "sold_qty": r["sold_qty"],
+                 "revenue": r["revenue"], "cogs": r["cogs"], "uncosted_qty": r["uncosted_qty"]}
+                for r in qs.values("outcome__warehouse_id", "product_id").annotate(
+                    sold_qty=Sum("count"),
+                    revenue=Coalesce(Sum(ExpressionWrapper(F("count") * F("price"), output_field=money)), zero),
+                    cogs=Coalesce(Sum(ExpressionWrapper(F("count") * F("cost"), output_field=money)), zero),
+                    uncosted_qty=Coalesce(Sum("count", filter=Q(cost__isnull=True)), 0),
+                ).order_by()
+            ]
+        else:
+            rows = [
+                {key: row[key] for key in ("warehouse", "product", "sold_qty", "revenue", "cogs", "uncosted_qty")}
+                for row in valuation.replay(method, warehouse_ids, product_ids, date_from=date_from, date_to=date_to)
+                if row["sold_qty"]
+            ]
+
+        rows = _valuation_names(rows, group_by)
+        for row in rows:
+            row["margin"] = row["revenue"] - row["cogs"]
+            row["margin_pct"] = round(float(row["margin"] / row["revenue"] * 100), 2) if row["revenue"] else None
+        rows.sort(key=lambda row: row["cogs"], reverse=True)
+        revenue = sum(row["revenue"] for row in rows)
+        cogs = sum(row["cogs"] for row in rows)
+        return Response({
+            "filters": {"method": method, "date_from": date_from, "date_to": date_to,
+                        "warehouse": warehouse_ids or None, "product": product_ids or None, "group_by": group_by},
+            "totals": {"sold_qty": sum(row["sold_qty"] for row in rows), "revenue": revenue, "cogs": cogs,
+                       "margin": revenue - cogs, "uncosted_qty": sum(row["uncosted_qty"] for row in rows)},
+            "count": min(len(rows), limit),
+            "results": rows[:limit],
+        })
+
+
+class EndpointTimingView(APIView):
+    """
+    Агрегаты ServerTimingMiddleware по эндпоинтам
+    GET /api/v1/timing/endpoints/      — число вызовов, среднее/максимальное время, БД, Python, запросы,
+                                         самый медленный SQL; самые тяжёлые эндпоинты первыми
+        &limit=50
+    DELETE /api/v1/timing/endpoints/   — сбросить накопленное
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get("limit", 50))
+        except ValueError:
+            limit = 50
+        rows = timing.endpoint_stats()
+        return Response({"count": len(rows), "results": rows[:max(1, limit)]})
+
+    def delete(self, request):
+        timing.reset_endpoint_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class OrderImportView(APIView):
     """
     Импорт заказов из Excel-файла
@@ -3156,7 +3902,7 @@ class IncomeImportView(APIView):
                 # 2️⃣ ищем склад
                 warehouse = None
                 if warehouse_name:
-                    warehouse = Warehouse.objects.filter(name__iexact=warehouse_name).first()
+                    warehouse = refcache.WAREHOUSES.get(warehouse_name, by="name")
                     if not warehouse:
                         skipped.append(f"Склад '{warehouse_name}' не найден")
                         continue
@@ -3168,7 +3914,7 @@ class IncomeImportView(APIView):
                     comment=comment or "",
                     total_amount=total_amount or 0,
                     status=status_value,
-                    warehouse=warehouse,
+                    warehouse_id=warehouse.id if warehouse else None,
                 )
                 created_count += 1
 
@@ -3198,4 +3944,4 @@ class CatalogViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     pagination_class = CustomPagination
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['status']
+    filterset_class = CatalogFilter
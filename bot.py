@@ -15,7 +15,7 @@ def setup_django():
         "DJANGO_SETTINGS_MODULE",
         "panasonic_api.settings"
     )
-    os.environ["DJANGO_ALLOW_ASYNC_UNSAFE"] = "true"
+    os.environ.setdefault("PROCESS_TYPE", "bot")
     django.setup()
 
 
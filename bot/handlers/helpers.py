@@ -7,8 +7,10 @@ from openpyxl import load_workbook
 from openpyxl.styles import Font
 from openpyxl.utils import get_column_letter
 from openpyxl.workbook import Workbook
+from django.utils import timezone
 
-from api.models import Product, ReportItem
+from api import refcache
+from api.models import Report, ReportItem
 
 # from bot.admin import url_file_download
 # from bot.handlers.lot import TIME_ZONE
@@ -68,9 +70,17 @@ def set_column_width_based_on_content(ws):
         ws.column_dimensions[column_letter].width = adjusted_width
 
 
-async def create_report_item(report, item_code: str, item_name: str, count: int):
-    product = Product.objects.get(code=item_code)
-    ReportItem.objects.create(report=report, product=product, count=count)
+def create_report(client_id, items):
+    """ Отчёт и его строки (одним INSERT): коды товаров — из справочника в памяти. Возвращает ненайденные коды """
+    report = Report.objects.create(client_id=client_id)
+    products = refcache.product_ids(item["item_code"] for item in items)
+    ReportItem.objects.bulk_create([
+        ReportItem(report=report, product_id=products[item["item_code"]], count=item["count"])
+        for item in items if item["item_code"] in products
+    ])
+    # bulk_create не шлёт сигналов — «касаемся» шапки сами (ETag планов, signals.touch_document)
+    Report.objects.filter(pk=report.pk).update(updated=timezone.now())
+    return [item["item_code"] for item in items if item["item_code"] not in products]
 
 # def create_excel_task_file(chat_id):
 #     file_path = f'C:\\Projects\\ee_task\\bot\\handlers\\reports\\xlsx\\data.xlsx'
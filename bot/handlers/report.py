@@ -11,15 +11,18 @@ from aiogram import F, types
 from aiogram.fsm.context import FSMContext
 from aiogram.types import FSInputFile, Document, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from asgiref.sync import sync_to_async
 from django.core.files.base import ContentFile
+from django.db import models
 from django.core.files.uploadedfile import SimpleUploadedFile
 from openpyxl import Workbook
 from openpyxl.styles import Side, Border, Alignment, Font
 from openpyxl.utils import get_column_letter
 
-from api.models import Report, WarehouseProduct
+from api import reorder
+from api.models import WarehouseProduct
 from bot.MESSAGES import MESSAGES
-from bot.handlers.helpers import create_report_item
+from bot.handlers.helpers import create_report
 # from bot.handlers.helpers import add_days_to_today, file_processing, create_excel_task_file
 # from bot.handlers.lot import TIME_ZONE
 from bot.keyboards.main import main_menu_btn, inline_btns, task_btns
@@ -29,11 +32,15 @@ from bot.loader import dp, bot, form_router
 
 from bot.state.document import UploadState
 from panasonic_api import settings
+from panasonic_api.db_router import use_replica
 from user.models import User
 
 
 # from ee_task.settings import ITEMS_PER_PAGE
 
+# Строк в ответе «Ниже точки заказа» (лимит длины сообщения Telegram)
+BELOW_REORDER_LIMIT = 30
+
 
 @form_router.message(F.text == '📃 Шаблон отчёта')
 async def create_task_step(message: types.Message, state: FSMContext):
@@ -41,7 +48,7 @@ async def create_task_step(message: types.Message, state: FSMContext):
     file = FSInputFile(file_path)
     await message.answer_document(file, caption=MESSAGES['send_sales_report'])
     await state.set_state(UploadState.send_document)
-    user = User.objects.get(tg_id=message.from_user.id)
+    user = await sync_to_async(User.objects.get)(tg_id=message.from_user.id)
     await state.update_data(user_id=user.id)
 
 
@@ -114,13 +121,13 @@ async def handle_excel_file(message: types.Message, state: FSMContext):
 async def confirm_upload(callback: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
     items = data.get("items", [])
-    report = Report.objects.create(client_id=data.get('user_id'))
-    for item in items:
-        await create_report_item(report, item["item_code"], item["item_name"], item["count"])
+    unknown = await sync_to_async(create_report)(data.get('user_id'), items)
 
     await state.clear()
     await callback.message.edit_reply_markup()
     await callback.message.answer("✅ Расходы по складу успешно зарегистрированы!")
+    if unknown:
+        await callback.message.answer(f"⚠️ Не найдены товары с кодами: {', '.join(unknown)}")
 
 
 @form_router.callback_query(F.data == "cancel_upload")
@@ -132,17 +139,25 @@ async def cancel_upload(callback: types.CallbackQuery, state: FSMContext):
 
 
 
+def warehouse_rows():
+    queryset = reorder.below_reorder(WarehouseProduct.objects.select_related("product").all())
+    # выгрузка читает из реплики, не нагружая основную БД
+    with use_replica():
+        return [
+            {
+                "Код модели": wp.product.code,
+                "Модели": wp.product.name,
+                "Количество": wp.count,
+                "Точка заказа": wp.reorder_point,
+                "Ниже точки заказа": "да" if wp.below_reorder else "",
+            }
+            for wp in queryset
+        ]
+
+
 @form_router.message(F.text == "📤 Выгрузить склад")
 async def export_warehouse_products(message: types.Message):
-    queryset = WarehouseProduct.objects.select_related("product").all()
-
-    data = []
-    for wp in queryset:
-        data.append({
-            "Код модели": wp.product.code,
-            "Модели": wp.product.name,
-            "Количество": wp.count
-        })
+    data = await sync_to_async(warehouse_rows)()
 
     # Создаем Excel-файл в памяти
     wb = Workbook()
@@ -150,7 +165,8 @@ async def export_warehouse_products(message: types.Message):
     ws.title = "Warehouse"
 
     # Заголовки
-    headers = list(data[0].keys()) if data else ["Код модели", "Модели", "Количество"]
+    headers = list(data[0].keys()) if data else ["Код модели", "Модели", "Количество", "Точка заказа",
+                                                 "Ниже точки заказа"]
     ws.append(headers)
 
     # Стили для заголовков
@@ -190,6 +206,32 @@ async def export_warehouse_products(message: types.Message):
     await message.answer_document(excel_file, caption="📦 Текущий список товаров на складе")
 
 
+def below_reorder_rows():
+    """ (всего ниже точки заказа, первые BELOW_REORDER_LIMIT строк остатка) """
+    # флаг сравнивается в запросе: остаток + в пути < точки заказа (api.reorder)
+    queryset = (reorder.below_reorder(WarehouseProduct.objects.select_related("product", "warehouse"))
+                .filter(below_reorder=True)
+                .order_by(models.F("count") + models.F("in_transit") - models.F("reorder_point"), "warehouse_id",
+                          "product_id"))
+    with use_replica():
+        return queryset.count(), list(queryset[:BELOW_REORDER_LIMIT])
+
+
+@form_router.message(F.text == "⚠️ Ниже точки заказа")
+async def below_reorder_products(message: types.Message):
+    total, rows = await sync_to_async(below_reorder_rows)()
+    if not rows:
+        await message.answer("✅ Все позиции выше точки заказа")
+        return
+    lines = [
+        f"📦 {wp.product.name} ({wp.product.code}) — {wp.warehouse.name if wp.warehouse else '—'}: "
+        f"{wp.count} шт. (+{wp.in_transit} в пути), точка заказа {wp.reorder_point}"
+        for wp in rows
+    ]
+    more = f"\n\n… и ещё {total - len(rows)}" if total > len(rows) else ""
+    await message.answer(f"⚠️ Ниже точки заказа: {total}\n\n" + "\n".join(lines) + more)
+
+
 
 @form_router.message(F.text == '🗂 Прайс каталог')
 async def create_task_step(message: types.Message):
@@ -3,6 +3,7 @@ from datetime import datetime
 from aiogram import types, F
 from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
+from asgiref.sync import sync_to_async
 
 from bot.MESSAGES import MESSAGES
 
@@ -14,7 +15,7 @@ from user.models import User
 @dp.message(CommandStart())
 async def bot_start(message: types.Message, state: FSMContext):
     print(message.from_user.full_name)
-    user = User.objects.filter(tg_id=message.from_user.id)
+    user = await sync_to_async(User.objects.filter(tg_id=message.from_user.id).exists)()
     if user:
         await show_main_btns(message, state)
     else:
@@ -22,15 +23,22 @@ async def bot_start(message: types.Message, state: FSMContext):
         await message.answer(MESSAGES['user_start'].format(message.from_user.full_name), reply_markup=keyboard)
 
 
+def bind_phone(normalized_phone, tg_id):
+    """ Привязывает Telegram-аккаунт к пользователю с этим телефоном. Возвращает пользователя или None """
+    phones = [normalized_phone, f"+{normalized_phone}"]
+    if User.objects.filter(phone_number__in=phones).update(tg_id=tg_id):
+        return User.objects.get(phone_number__in=phones)
+    return None
+
+
 @dp.message(F.contact)
 async def contact_search_step(message: types.Message):
     phone_number = message.contact.phone_number
     normalized_phone = phone_number.lstrip('+')
-    updated = User.objects.filter(phone_number__in=[normalized_phone, f"+{normalized_phone}"]).update(tg_id=message.from_user.id)
+    user = await sync_to_async(bind_phone)(normalized_phone, message.from_user.id)
     print(phone_number)
-    if updated:
+    if user:
         keyboard = start_btns()
-        user = User.objects.get(phone_number__in=[normalized_phone, f"+{normalized_phone}"])
         await bot.send_message(message.from_user.id,
                                MESSAGES['success_logged'].format(user.first_name, user.last_name, phone_number),
                                reply_markup=keyboard)
@@ -22,6 +22,7 @@ def start_btns():
         ],
         [
             KeyboardButton(text='🗂 Прайс каталог'),
+            KeyboardButton(text='⚠️ Ниже точки заказа'),
         ]
 
     ]
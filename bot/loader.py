@@ -2,11 +2,14 @@ from aiogram import Bot, Dispatcher, Router
 from aiogram.fsm.storage.memory import MemoryStorage
 from django.conf import settings
 
+from bot.middlewares import DBConnectionMiddleware
+
 form_router = Router()
 
 bot = Bot(token=settings.BOT_TOKEN)
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
+dp.update.outer_middleware(DBConnectionMiddleware())
 dp.include_router(form_router)
 
 __all__ = ['bot', 'storage', 'dp']
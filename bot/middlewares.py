@@ -0,0 +1,29 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+
+class DBConnectionMiddleware(BaseMiddleware):
+    """
+    Жизненный цикл соединения с БД на каждый апдейт — как request_started/request_finished в Django.
+
+    Обработчики ходят в ORM только через sync_to_async (thread_sensitive): вся работа с БД идёт
+    в одном потоке, и его соединение переживает апдейт. До и после обработки в том же потоке
+    закрываем соединения, у которых истёк CONN_MAX_AGE (DB_BOT_CONN_MAX_AGE) или которые
+    сломались (CONN_HEALTH_CHECKS), — живое переиспользуется следующим апдейтом.
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        await sync_to_async(close_old_connections)()
+        try:
+            return await handler(event, data)
+        finally:
+            await sync_to_async(close_old_connections)()
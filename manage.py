@@ -7,6 +7,8 @@ import sys
 def main():
     """Run administrative tasks."""
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'panasonic_api.settings')
+    # runserver обслуживает API, остальные команды — разовые процессы
+    os.environ.setdefault('PROCESS_TYPE', 'api' if sys.argv[1:2] == ['runserver'] else 'command')
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'panasonic_api.settings')
+os.environ.setdefault('PROCESS_TYPE', 'api')
+os.environ.setdefault('ASYNC_REPORTS', '1')
 
 application = get_asgi_application()
@@ -0,0 +1,103 @@
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Алиас БД для чтения в текущем запросе / задаче (None — default)
+_read_db = ContextVar('read_db', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _pin_cache_key(sticky_key):
+    return f'db_router:pin:{sticky_key}'
+
+
+def pin_to_primary(sticky_key):
+    """
+    После записи читаем из default REPLICA_STICKY_SECONDS секунд (read-your-writes),
+    пока реплика не догонит. Метка живёт в общем кэше (settings.CACHES: таблица в БД
+    или Redis), поэтому действует на всех воркерах и в боте, а не только в том процессе,
+    который принял запись.
+    """
+    cache.set(_pin_cache_key(sticky_key), 1, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned(sticky_key):
+    return bool(sticky_key) and cache.get(_pin_cache_key(sticky_key)) is not None
+
+
+def sticky_key_for(request):
+    """Ключ «автора» запроса: JWT из Authorization или сессия. Без них липкость не работает."""
+    credentials = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credentials:
+        return None
+    return hashlib.md5(credentials.encode()).hexdigest()
+
+
+@contextmanager
+def use_replica(sticky_key=None):
+    """
+    Читать из случайной реплики внутри блока (отчёты, выгрузки бота).
+    Если реплик нет или ключ недавно писал — остаёмся на default.
+    """
+    alias = None
+    replicas = settings.REPLICA_DATABASES
+    if replicas and not is_pinned(sticky_key):
+        alias = random.choice(replicas)
+    token = _read_db.set(alias)
+    try:
+        yield alias or 'default'
+    finally:
+        _read_db.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Запись и миграции — всегда default. Чтение — реплика, если она выбрана
+    через use_replica() (middleware для путей REPLICA_ROUTED_PATHS), иначе default.
+    """
+
+    def db_for_read(self, model, **hints):
+        # общий кэш (DatabaseCache) — только default: реплика отдала бы устаревшие версии справочников
+        if model._meta.app_label == 'django_cache':
+            return 'default'
+        return _read_db.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики — копии default, связи между объектами из них допустимы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaRoutingMiddleware:
+    """
+    GET/HEAD на REPLICA_ROUTED_PATHS (отчёты) читают из реплики.
+    Успешный небезопасный запрос закрепляет автора за default на REPLICA_STICKY_SECONDS.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sticky_key = sticky_key_for(request)
+        if request.method in ('GET', 'HEAD') and request.path.startswith(settings.REPLICA_ROUTED_PATHS):
+            with use_replica(sticky_key) as alias:
+                response = self.get_response(request)
+            response['X-DB-Alias'] = alias
+            return response
+
+        response = self.get_response(request)
+        # без реплик метку никто не читает (use_replica) — лишняя запись в кэш на каждый POST
+        if (settings.REPLICA_DATABASES and request.method not in SAFE_METHODS
+                and response.status_code < 400 and sticky_key):
+            pin_to_primary(sticky_key)
+        return response
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt.token_blacklist',
     'corsheaders',
@@ -51,11 +52,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
+    'panasonic_api.timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'panasonic_api.db_router.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -85,7 +88,7 @@ WSGI_APPLICATION = 'panasonic_api.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'ENGINE': 'django.db.backends.postgresql',
         'NAME': 'panasonic_db',
         'USER': 'postgres',
         'PASSWORD': '123',
@@ -94,6 +97,93 @@ DATABASES = {
     }
 }
 
+# Соединения с БД по типу процесса (PROCESS_TYPE задают точки входа: wsgi/asgi, bot.py, manage.py).
+# max_age — CONN_MAX_AGE в секундах (0 — закрывать после запроса, None — без ограничения).
+# Бот ходит в ORM через sync_to_async из одного потока — его соединение живёт между апдейтами.
+PROCESS_TYPE = os.getenv('PROCESS_TYPE', 'api')
+DB_CONNECTIONS = {
+    'api': {'max_age': int(os.getenv('DB_API_CONN_MAX_AGE', 60))},
+    'bot': {'max_age': int(os.getenv('DB_BOT_CONN_MAX_AGE', 300))},
+    'command': {'max_age': int(os.getenv('DB_COMMAND_CONN_MAX_AGE', 0))},
+}
+_db_conn = DB_CONNECTIONS.get(PROCESS_TYPE, DB_CONNECTIONS['api'])
+DATABASES['default']['CONN_MAX_AGE'] = _db_conn['max_age']
+# Переиспользуемое соединение проверяется перед первым запросом в запросе/апдейте бота
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Реплики только для чтения: DB_REPLICA_HOSTS=host1,host2:5433
+# Локально для проверки хватит DB_REPLICA_HOSTS=127.0.0.1 — второй алиас на ту же БД.
+REPLICA_DATABASES = []
+for _i, _host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    _host, _, _port = _host.strip().partition(':')
+    DATABASES[f'replica{_i}'] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'PORT': _port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(f'replica{_i}')
+
+DATABASE_ROUTERS = ['panasonic_api.db_router.ReplicaRouter']
+# GET-запросы с этими префиксами читают из реплики
+REPLICA_ROUTED_PATHS = ('/api/v1/reports/',)
+# Сколько секунд после записи автор читает из default (read-your-writes)
+REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', 15))
+
+# Общий для всех процессов (воркеры API, бот, команды) кэш: на нём версии справочников
+# (api.refcache), закрепление автора за default после записи (db_router.pin_to_primary)
+# и агрегаты по эндпоинтам (timing.endpoint_stats).
+# По умолчанию — таблица в БД (создаётся миграцией api 0037_cache_table),
+# CACHE_REDIS_URL=redis://host:6379/0 — Redis (нужен пакет redis).
+if os.getenv('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_REDIS_URL'),
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': os.getenv('CACHE_TABLE', 'django_cache'),
+            # по метке на каждого недавно писавшего пользователя; при переполнении таблица
+            # чистится вслепую и могла бы выкинуть версии справочников
+            'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000))},
+        },
+    }
+
+# Справочники в памяти процесса (api.refcache): как часто сверять версию в общем кэше, с,
+# и сколько секунд максимум держать таблицу без перечитывания, даже если версия не менялась
+# (версия потерялась при очистке кэша, массовая правка без invalidate())
+REFCACHE_CHECK_SECONDS = float(os.getenv('REFCACHE_CHECK_SECONDS', 2))
+REFCACHE_MAX_AGE = float(os.getenv('REFCACHE_MAX_AGE', 300))
+
+# Строк-счётчиков резерва на пару (склад, товар) (api.reservations): больше — меньше
+# ожиданий блокировок при одновременных заказах одного товара, дороже чтение суммы
+RESERVATION_STRIPES = int(os.getenv('RESERVATION_STRIPES', 8))
+
+# Async-версии отчётов с параллельными запросами (включается в asgi.py)
+ASYNC_REPORTS = os.getenv('ASYNC_REPORTS', '0') == '1'
+
+# Профилирование запросов (panasonic_api.timing): заголовок Server-Timing и JSON-строка лога
+SERVER_TIMING_HEADER = os.getenv('SERVER_TIMING_HEADER', '1') == '1'
+# Логировать только запросы дольше N мс (0 — все)
+SERVER_TIMING_LOG_MIN_MS = float(os.getenv('SERVER_TIMING_LOG_MIN_MS', 0))
+# Как часто процесс сбрасывает свои агрегаты по эндпоинтам в общий кэш, с
+SERVER_TIMING_FLUSH_SECONDS = float(os.getenv('SERVER_TIMING_FLUSH_SECONDS', 5))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'panasonic_api.timing': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
@@ -0,0 +1,333 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('panasonic_api.timing')
+
+# Замеры текущего запроса (None — вне запроса)
+_current = ContextVar('request_timing', default=None)
+
+AGGREGATES_KEY = 'timing:endpoints'
+GENERATION_KEY = f'{AGGREGATES_KEY}:generation'
+# Слотов агрегатов (одновременно живущих процессов) и сколько их читать за раз
+MAX_SHARDS = 256
+SHARD_BATCH = 64
+# Аренда слота живёт столько сбросов: процесс, не сбрасывавший дольше, отдаёт слот другому
+LEASE_FLUSHES = 12
+SUMMED_FIELDS = ('count', 'total_ms', 'db_ms', 'app_ms', 'serializer_ms', 'render_ms', 'queries')
+SLOW_SQL_CHARS = 500
+
+
+class RequestTiming:
+    """Замеры одного запроса. Запросы к БД могут приходить из нескольких потоков (async-отчёты)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest_sql = None
+        self.view_started = None
+        self.render_started = None
+        self.render_ms = 0.0
+        self.serializer_ms = 0.0
+        self._lock = threading.Lock()
+
+    def add_query(self, sql, ms):
+        with self._lock:
+            self.queries += 1
+            self.db_ms += ms
+            if ms > self.slowest_ms:
+                self.slowest_ms = ms
+                self.slowest_sql = sql
+
+    def metrics(self, finished):
+        total_ms = (finished - self.started) * 1000
+        view_end = self.render_started or finished
+        view_ms = (view_end - self.view_started) * 1000 if self.view_started else 0.0
+        return {
+            'total': total_ms,
+            'view': view_ms,
+            'db': self.db_ms,
+            'serializer': self.serializer_ms,
+            'render': self.render_ms,
+            # Python во вьюхе: сортировки, циклы, сборка ответа
+            'app': max(0.0, view_ms - self.db_ms - self.serializer_ms),
+        }
+
+
+def current():
+    return _current.get()
+
+
+def add(name, ms):
+    """Добавить время к метрике текущего запроса (serializer, render)."""
+    timing = _current.get()
+    if timing is not None:
+        with timing._lock:
+            setattr(timing, f'{name}_ms', getattr(timing, f'{name}_ms') + ms)
+
+
+def _query_timer(execute, sql, params, many, context):
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    t0 = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.add_query(sql, (time.perf_counter() - t0) * 1000)
+
+
+def _install_timer(sender, connection, **kwargs):
+    if _query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_query_timer)
+
+
+def install():
+    """Подключить счётчик SQL ко всем соединениям — открытым и будущим."""
+    connection_created.connect(_install_timer, dispatch_uid='server_timing_install')
+    for conn in connections.all(initialized_only=True):
+        _install_timer(None, conn)
+
+
+@contextmanager
+def measure():
+    """Замеры вне HTTP-запроса (бенчмарки, команды): SQL считается так же, как в middleware."""
+    install()
+    timing = RequestTiming()
+    token = _current.set(timing)
+    try:
+        yield timing
+    finally:
+        _current.reset(token)
+
+
+def _shard_key(generation, slot):
+    return f'{AGGREGATES_KEY}:{generation}:{slot}'
+
+
+def _lease_key(generation, slot):
+    return f'{AGGREGATES_KEY}:{generation}:{slot}:lease'
+
+
+def _lease_timeout():
+    return max(60, settings.SERVER_TIMING_FLUSH_SECONDS * LEASE_FLUSHES)
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, uuid.uuid4().hex, None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def _empty(endpoint):
+    return {
+        'endpoint': endpoint, 'count': 0, 'total_ms': 0.0, 'max_total_ms': 0.0,
+        'db_ms': 0.0, 'app_ms': 0.0, 'serializer_ms': 0.0, 'render_ms': 0.0, 'queries': 0,
+        'slowest_query_ms': 0.0, 'slowest_query': None,
+    }
+
+
+def _merge(agg, other):
+    for field in SUMMED_FIELDS:
+        agg[field] += other[field]
+    agg['max_total_ms'] = max(agg['max_total_ms'], other['max_total_ms'])
+    if other['slowest_query_ms'] > agg['slowest_query_ms']:
+        agg['slowest_query_ms'] = other['slowest_query_ms']
+        agg['slowest_query'] = other['slowest_query']
+
+
+class EndpointAggregates:
+    """
+    Агрегаты по эндпоинтам одного процесса: копятся в памяти и раз в
+    SERVER_TIMING_FLUSH_SECONDS пишутся в свой слот общего кеша.
+
+    Слот арендуется cache.add ключа аренды с таймаутом — атомарно на любом бэкенде
+    (в т.ч. DatabaseCache, где incr — это get + set), поэтому у слота ровно один
+    писатель и прочитать-изменить-записать между воркерами не теряет вызовов. Каждый
+    сброс продлевает аренду. Слот завершившегося воркера освобождается через
+    _lease_timeout(), и следующий процесс забирает его вместе с накопленным — слотов
+    столько, сколько процессов живёт одновременно, а статистика умерших не пропадает.
+    Процесс, потерявший аренду (долго простаивал), пишет дальше только новые вызовы —
+    прежние уже в слоте у нового хозяина. endpoint_stats() складывает слоты.
+    Сброс меняет поколение — процессы начинают заново.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._token = uuid.uuid4().hex
+        self._items = {}  # вызовы с последнего сброса
+        self._base = {}  # содержимое слота на момент последнего сброса
+        self._generation = None
+        self._slot = None
+        self._flushed = 0.0
+
+    def add(self, key, metrics, queries, slowest_ms, slowest_sql):
+        with self._lock:
+            agg = self._items.setdefault(key, _empty(key))
+            _merge(agg, {
+                'count': 1, 'total_ms': metrics['total'], 'max_total_ms': metrics['total'],
+                'db_ms': metrics['db'], 'app_ms': metrics['app'], 'serializer_ms': metrics['serializer'],
+                'render_ms': metrics['render'], 'queries': queries,
+                'slowest_query_ms': slowest_ms, 'slowest_query': slowest_sql,
+            })
+            if time.monotonic() - self._flushed >= settings.SERVER_TIMING_FLUSH_SECONDS:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        self._flushed = time.monotonic()
+        generation = _generation()
+        if generation != self._generation:
+            if self._generation is not None:
+                self._items = {}  # статистику сбросили — накопленное до сброса не пишем
+            self._generation, self._slot, self._base = generation, None, {}
+        if not self._items:
+            return
+        timeout = _lease_timeout()
+        if self._slot is not None and cache.get(_lease_key(generation, self._slot)) != self._token:
+            self._slot, self._base = None, {}  # аренда истекла — слот с прежними вызовами у другого процесса
+        if self._slot is None:
+            self._slot = next((slot for slot in range(MAX_SHARDS)
+                               if cache.add(_lease_key(generation, slot), self._token, timeout)), None)
+            if self._slot is None:
+                logger.warning('Нет свободного слота для агрегатов эндпоинтов')
+                return
+            # слот мог остаться от завершившегося воркера — продолжаем его агрегаты
+            self._base = cache.get(_shard_key(generation, self._slot)) or {}
+        else:
+            cache.touch(_lease_key(generation, self._slot), timeout)
+        for key, agg in self._items.items():
+            _merge(self._base.setdefault(key, _empty(key)), agg)
+        self._items = {}
+        cache.set(_shard_key(generation, self._slot), self._base, None)
+
+
+_aggregates = EndpointAggregates()
+
+
+def record_endpoint(key, metrics, queries, slowest_ms, slowest_sql):
+    """Копит агрегаты по эндпоинту: в памяти процесса, периодически — в общий кеш."""
+    _aggregates.add(key, metrics, queries, slowest_ms, slowest_sql)
+
+
+def _shards(generation):
+    """Агрегаты всех слотов поколения — живых и освобождённых процессов."""
+    for start in range(0, MAX_SHARDS, SHARD_BATCH):
+        yield from cache.get_many([_shard_key(generation, slot)
+                                   for slot in range(start, start + SHARD_BATCH)]).values()
+
+
+def endpoint_stats():
+    """Агрегаты по эндпоинтам со средними значениями, самые медленные — первыми."""
+    _aggregates.flush()
+    generation = cache.get(GENERATION_KEY)
+    merged = {}
+    for items in _shards(generation) if generation else ():
+        for key, agg in items.items():
+            _merge(merged.setdefault(key, _empty(key)), agg)
+    rows = []
+    for agg in merged.values():
+        n = agg['count'] or 1
+        rows.append({
+            **agg,
+            'avg_total_ms': agg['total_ms'] / n,
+            'avg_db_ms': agg['db_ms'] / n,
+            'avg_app_ms': agg['app_ms'] / n,
+            'avg_queries': agg['queries'] / n,
+        })
+    rows.sort(key=lambda r: r['total_ms'], reverse=True)
+    return rows
+
+
+def reset_endpoint_stats():
+    generation = cache.get(GENERATION_KEY)
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+    if generation:
+        for start in range(0, MAX_SHARDS, SHARD_BATCH):
+            slots = range(start, start + SHARD_BATCH)
+            cache.delete_many([_shard_key(generation, slot) for slot in slots]
+                              + [_lease_key(generation, slot) for slot in slots])
+
+
+class ServerTimingMiddleware:
+    """
+    Профилирование запросов без DEBUG: число SQL-запросов, время БД, самый медленный
+    запрос, время вьюхи / сериализации / рендера.
+
+    SQL считается через execute_wrapper, который ставится на каждое новое соединение
+    (в т.ч. реплики и потоки async-отчётов). Результат — заголовок Server-Timing,
+    строка лога panasonic_api.timing (JSON) и агрегаты по эндпоинтам (endpoint_stats()).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install()
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        token = _current.set(timing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        finished = time.perf_counter()
+
+        metrics = timing.metrics(finished)
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = ', '.join(
+                [f'db;dur={metrics["db"]:.1f};desc="{timing.queries} queries"',
+                 f'sql-max;dur={timing.slowest_ms:.1f}'] +
+                [f'{name};dur={metrics[name]:.1f}' for name in ('view', 'app', 'serializer', 'render', 'total')]
+            )
+
+        match = getattr(request, 'resolver_match', None)
+        # шаблон маршрута, а не конкретный путь: /api/v1/products/<pk>/ и т.п.
+        route = match.route.lstrip('^').rstrip('$') if match and match.route else None
+        endpoint = f'{request.method} /{route}' if route else f'{request.method} {request.path}'
+        slowest_sql = timing.slowest_sql[:SLOW_SQL_CHARS] if timing.slowest_sql else None
+        if metrics['total'] >= settings.SERVER_TIMING_LOG_MIN_MS:
+            logger.info(json.dumps({
+                'endpoint': endpoint,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'user': getattr(getattr(request, 'user', None), 'pk', None),
+                'queries': timing.queries,
+                **{f'{k}_ms': round(v, 1) for k, v in metrics.items()},
+                'slowest_query_ms': round(timing.slowest_ms, 1),
+                'slowest_query': slowest_sql,
+            }, ensure_ascii=False))
+        record_endpoint(endpoint, metrics, timing.queries, timing.slowest_ms, slowest_sql)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timing = _current.get()
+        if timing is not None:
+            timing.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF Response рендерится после middleware: отмечаем начало и конец рендера
+        timing = _current.get()
+        if timing is not None:
+            timing.render_started = time.perf_counter()
+
+            def rendered(resp):
+                timing.render_ms = (time.perf_counter() - timing.render_started) * 1000
+
+            response.add_post_render_callback(rendered)
+        return response
@@ -12,5 +12,6 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'panasonic_api.settings')
+os.environ.setdefault('PROCESS_TYPE', 'api')
 
 application = get_wsgi_application()